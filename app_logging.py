@@ -0,0 +1,129 @@
+"""Leveled, non-blocking logging for the booking assistant.
+
+Modules log through `get_logger(name)` (loggers under "booking"). Records go
+onto an in-memory queue and a background thread writes them out, so a slow
+stdout pipe never stalls a request. Messages use %-style arguments, which are
+only formatted when the level is enabled.
+
+    LOG_LEVEL=INFO     DEBUG adds the slot extraction dumps
+    LOG_FORMAT=text    or "json": one JSON object per line, including the
+                       fields passed with extra={...}
+
+Agent tracing (what used to be verbose=True) logs each tool call, tool result
+and final answer. It is off by default; turn it on for every turn with
+AGENT_TRACE=1, or for one request with the X-Agent-Trace: 1 header.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+AGENT_TRACE = os.environ.get("AGENT_TRACE", "0") == "1"
+
+ROOT_LOGGER = "booking"
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+# Attributes every LogRecord has; anything else came from extra={...}
+STANDARD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_trace = ContextVar("agent_trace", default=None)
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record with its time, level, logger, message and extra fields"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def get_logger(name):
+    """Logger for one part of the app, e.g. get_logger("agent") -> "booking.agent\""""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def setup_logging(level=None, fmt=None, stream=None):
+    """Route "booking" logs through a queue to a writer thread; safe to call more than once"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        writer = logging.StreamHandler(stream or sys.stdout)
+        writer.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == "json" else logging.Formatter(TEXT_FORMAT))
+
+        records = queue.SimpleQueue()
+        logger = logging.getLogger(ROOT_LOGGER)
+        logger.setLevel(level or LOG_LEVEL)
+        logger.addHandler(logging.handlers.QueueHandler(records))
+        logger.propagate = False
+
+        _listener = logging.handlers.QueueListener(records, writer)
+        _listener.start()
+        # Drain what is still queued when the process exits
+        atexit.register(_listener.stop)
+
+
+def tracing_enabled():
+    """Whether the current request asked for an agent trace (or AGENT_TRACE is set)"""
+    enabled = _trace.get()
+    return AGENT_TRACE if enabled is None else enabled
+
+
+@contextmanager
+def agent_tracing(enabled):
+    """Turn agent tracing on or off for the enclosed request"""
+    token = _trace.set(bool(enabled) or AGENT_TRACE)
+    try:
+        yield
+    finally:
+        _trace.reset(token)
+
+
+_tracer_class = None
+
+
+def new_agent_tracer():
+    """Return a callback handler that logs an agent turn's tool calls, results and answer.
+
+    The class is defined on first use so importing this module does not pull in LangChain.
+    """
+    global _tracer_class
+    if _tracer_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        log = get_logger("agent.trace")
+
+        class AgentTracer(BaseCallbackHandler):
+            def on_agent_action(self, action, **kwargs):
+                log.info("🔧 %s(%r)", action.tool, action.tool_input, extra={"tool": action.tool})
+
+            def on_tool_end(self, output, **kwargs):
+                log.info("📤 %s", output)
+
+            def on_tool_error(self, error, **kwargs):
+                log.warning("❌ Tool failed: %s", error)
+
+            def on_agent_finish(self, finish, **kwargs):
+                log.info("✅ %s", finish.return_values.get("output"))
+
+        _tracer_class = AgentTracer
+    return _tracer_class()
@@ -1,33 +1,70 @@
-from langchain_openai import ChatOpenAI
-from langchain.agents import initialize_agent, Tool, AgentType
-from langchain.memory import ConversationBufferMemory
 from dotenv import load_dotenv
+import asyncio
+import csv
 import os
 import re
-import random
-import dateparser
-from datetime import datetime, timedelta
+import threading
+import time
+from datetime import datetime
+import contextvars
+import database
 import sqlite3
+import migrations
+from migrations import SERVICES
+from tickets import ticket_allocator
+from scheduling import scheduler
+from booking_locks import booking_locks
+from booking_queue import build_booking_queue
+from idempotency import recent_bookings
+from date_resolution import resolve_date
+from slot_extractor import (
+    EMAIL_PATTERN, canonical_service, extract_income_filters, extract_slots, extract_staff_filters, normalize_time
+)
+from contextlib import contextmanager, nullcontext
+from app_logging import get_logger, new_agent_tracer, tracing_enabled
+from metrics import timed
+from session_store import Session, build_session_store
 
 load_dotenv()
 
-from langchain_google_genai import GoogleGenerativeAI
-# Initialize LLM
-llm = GoogleGenerativeAI(model="gemini-1.5-flash", google_api_key=os.environ["GOOGLE_API_KEY"])
+log = get_logger("agent")
+
+# LangChain and the Gemini client take seconds to import, so the LLM and agent
+# are built on first use (or by warm_up_agent) rather than at import time.
+# "background" lets the servers start that build as soon as they boot;
+# "lazy" leaves it to the first chat turn that needs the agent.
+AGENT_WARMUP = os.environ.get("AGENT_WARMUP", "background")
 
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+# Per-user conversation state (slots, staff mode, chat history) lives in the
+# session store; the tools below act on the session bound to the current request.
+session_store = build_session_store(
+    ttl_seconds=int(os.environ.get("SESSION_TTL_SECONDS", 1800)),
+    max_sessions=int(os.environ.get("SESSION_MAX_COUNT", 10000))
+)
+_current_session = contextvars.ContextVar("current_session", default=None)
 
-# Global variable to store appointment info
-appointment_info = {
-    "name": None,
-    "email": None,
-    "service": None,
-    "date": None
-}
+# Write-behind queue for new bookings (BOOKING_WRITES=write-behind), or None
+# when each booking is inserted and committed inside its request
+booking_queue = build_booking_queue()
+
+# Session used by the CLI loop and by any tool call made outside use_session()
+cli_session = Session("cli")
 
 # Staff authentication variables
 STAFF_PASSCODE = "staff1234"  
-is_staff_mode = False
+
+def current_session():
+    """Return the session bound to the current request (the CLI session if none)"""
+    return _current_session.get() or cli_session
+
+@contextmanager
+def use_session(session):
+    """Bind a session to the current context while the agent and tools run"""
+    token = _current_session.set(session)
+    try:
+        yield session
+    finally:
+        _current_session.reset(token)
 
 def is_date_valid(date_str):
     """Check if the date is valid (not today or in the past)"""
@@ -37,74 +74,34 @@ def is_date_valid(date_str):
         
         return appointment_date > today
     except Exception as e:
-        print(f"Date validation error: {str(e)}")
+        log.warning("Date validation error: %s", e)
         return False
 
+@timed("tool", "extract_info")
 def extract_appointment_info(text: str) -> str: 
-    global appointment_info  # Ensure we're accessing the global variable
+    session = current_session()
+    appointment_info = session.appointment_info
     
-    print(f"Debug - Before extraction, stored info: {appointment_info}")
+    log.debug("Before extraction, stored info: %s", appointment_info, extra={"sessionId": session.session_id})
     
     # Use existing values as defaults
     current_info = appointment_info.copy()
     
-    # Try to extract name - expanded pattern to catch single names
-    name_match = re.search(r"(?:my name is|i am|name is|name -|name:|^)\s*([A-Za-z]+(?:\s+[A-Za-z]+)*)", text, re.IGNORECASE)
-    if name_match and len(name_match.group(1)) >= 2:  
-        current_info["name"] = name_match.group(1).title()
-    
-    # Try to extract email
-    email_match = re.search(r"\b[\w.-]+@[\w.-]+\.\w+\b", text)  
-    if email_match:
-        current_info["email"] = email_match.group(0)
-    
-    # Try to extract service - more flexible pattern
-    service_match = re.search(r"(?:service is|i need|service -|service:|need a)\s+(.+?)(?:,|\.|$|and)", text, re.IGNORECASE)
-    if not service_match:
-        
-        common_services = ["haircut", "manicure", "pedicure", "massage", "facial", "consultation", "appointment", "checkup", "cleaning"]
-        for service in common_services:
-            if service in text.lower():
-                current_info["service"] = service
-                break
-    else:
-        current_info["service"] = service_match.group(1).strip()
-    
-    # Try to extract date - handle various formats
+    slots = extract_slots(text)
+    if slots.name:
+        current_info["name"] = slots.name
+    if slots.email:
+        current_info["email"] = slots.email
+    if slots.service:
+        current_info["service"] = slots.service
+
+    # Candidates come ordered numeric, ISO, cue phrase, then date words; the
+    # first one that parses wins
     date_extracted = None
-    
-    # Standard format date (DD/MM/YYYY)
-    std_date_match = re.search(r"\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\b", text)
-    if std_date_match:
-        date_text = std_date_match.group(1)
-        parsed_date = dateparser.parse(date_text)
-        if parsed_date:
-            date_extracted = parsed_date.strftime("%Y-%m-%d")
-    
-    # ISO format date (YYYY-MM-DD)
-    if not date_extracted:
-        iso_date_match = re.search(r"\b(\d{4}-\d{2}-\d{2})\b", text)
-        if iso_date_match:
-            date_extracted = iso_date_match.group(1)
-    
-    # Date words and phrases
-    if not date_extracted:
-        date_match = re.search(r"(?:date is|on|date -|date:|for)\s+(\S+(?:\s+\S+)*?)(?:,|\.|$)", text, re.IGNORECASE)
-        if date_match:
-            date_text = date_match.group(1)
-            parsed_date = dateparser.parse(date_text)
-            if parsed_date:
-                date_extracted = parsed_date.strftime("%Y-%m-%d")
-    
-    # Common date words
-    if not date_extracted:
-        date_words = ["tomorrow", "today", "next week", "next month"]
-        for date_word in date_words:
-            if date_word in text.lower():
-                parsed_date = dateparser.parse(date_word)
-                if parsed_date:
-                    date_extracted = parsed_date.strftime("%Y-%m-%d")
-                    break
+    for date_text in slots.date_candidates:
+        date_extracted = resolve_date(date_text)
+        if date_extracted:
+            break
     
     # Now validate the date if a date was extracted
     if date_extracted:
@@ -113,9 +110,22 @@ def extract_appointment_info(text: str) -> str:
         else:
             return "⚠️ I noticed you selected today or a past date. Please choose a future date for your appointment."
     
+    # Check the requested date and time against the salon's schedule
+    time_extracted = slots.time
+    if (date_extracted or time_extracted) and current_info["date"]:
+        date = current_info["date"]
+        service = current_info["service"]
+        preferred_time = time_extracted or session.preferred_time
+        if scheduler.find_start(date, service, preferred_time) is None:
+            free_times = scheduler.suggest_times(date, service, preferred_time) if preferred_time else []
+            if free_times:
+                return f"⚠️ {preferred_time} on {date} is not available. Nearest free times: {', '.join(free_times)}."
+            free_dates = scheduler.suggest_dates(date, service)
+            suggestion = f" Nearest dates with free slots: {', '.join(free_dates)}." if free_dates else " Please choose another date."
+            return f"⚠️ {date} is fully booked.{suggestion}"
+
 
-    print(f"Debug - Extracted from text: {text}")
-    print(f"Debug - Extracted info: {current_info}")
+    log.debug("Extracted %s from text: %s", current_info, text, extra={"sessionId": session.session_id})
     
     # Update the global variable with any new information
     changes = []
@@ -124,7 +134,11 @@ def extract_appointment_info(text: str) -> str:
             appointment_info[key] = value
             changes.append(f"✅ {key.title()} saved: {value}")
     
-    print(f"Debug - Updated info after extraction: {appointment_info}")
+    if time_extracted and time_extracted != session.preferred_time:
+        session.preferred_time = time_extracted
+        changes.append(f"✅ Time saved: {time_extracted}")
+    
+    log.debug("Updated info after extraction: %s", appointment_info, extra={"sessionId": session.session_id})
     
     # If no changes were made but we already have some info, don't say "couldn't extract"
     if not changes:
@@ -142,28 +156,29 @@ def extract_appointment_info(text: str) -> str:
     response += "\n" + get_appointment_status()
     
     # If all information is complete, book the appointment
-    if all(appointment_info.values()):
+    if appointment_info.is_complete:
         response += "\n✅ All information complete! Booking your appointment now..."
         
         # Create ticket and book appointment
-        ticket_number = f"APPT-{random.randint(10000, 99999)}"
-        db_result = save_appointment_to_db(
+        ticket_number, start_time = book_appointment(
             appointment_info["name"],
             appointment_info["email"],
             appointment_info["service"],
             appointment_info["date"],
-            ticket_number)
+            session.preferred_time)
         
-        if db_result:
-            print("Hello")
-            response += f"\n🎉 Your appointment has been booked successfully! Your ticket number is: {ticket_number}"
+        if ticket_number:
+            response += f"\n🎉 Your appointment has been booked successfully for {start_time}! Your ticket number is: {ticket_number}"
         else:
-            response += f"\n⚠️ Your information is complete, but there was an issue with the booking system. Please try again later. Ticket number: {ticket_number}"
+            response += "\n⚠️ Your information is complete, but there was an issue with the booking system. Please try again later."
     
     return response
 
 def get_appointment_status():
     """Get the current status of appointment information"""
+    return current_session().appointment_info.cached("status", _render_status)
+
+def _render_status(appointment_info):
     status_parts = []
     
     # Add confirmed information
@@ -184,47 +199,47 @@ def get_appointment_status():
 
 def reset_appointment_info():
     """Reset appointment info after booking is complete"""
-    global appointment_info
-    appointment_info = {
-        "name": None,
-        "email": None,
-        "service": None,
-        "date": None
-    }
-
-    is_staff_mode = False
+    session = current_session()
+    session.appointment_info.clear()
+    session.preferred_time = None
+    session.is_staff_mode = False
 
+@timed("tool", "check_goal")
 def check_appointment_goal(_: str) -> str:
     """Check if all required information has been provided and book appointment if complete."""
-    if all(appointment_info.values()):
+    session = current_session()
+    appointment_info = session.appointment_info
+    if appointment_info.is_complete:
         # Additional check for date validity
         if not is_date_valid(appointment_info["date"]):
             return "⚠️ The selected date is today or in the past. Please choose a future date for your appointment."
             
-        ticket_number = f"APPT-{random.randint(10000, 99999)}"
-        
-        db_result = save_appointment_to_db(
+        ticket_number, start_time = book_appointment(
             appointment_info["name"],
             appointment_info["email"],
             appointment_info["service"],
             appointment_info["date"],
-            ticket_number)
+            session.preferred_time)
         
-        if db_result:
+        if ticket_number:
             success_message = (f"✅ Booking complete! Name: {appointment_info['name']}, Email: {appointment_info['email']}, "
-                    f"Service: {appointment_info['service']}, Date: {appointment_info['date']}. "
+                    f"Service: {appointment_info['service']}, Date: {appointment_info['date']}, Time: {start_time}. "
                     f"Your appointment is confirmed! 🎉 Your ticket number is: {ticket_number}")
     
             return success_message
 
         else:
-            return f"✅ Your information is complete, but there was an issue saving to the database. Name: {appointment_info['name']}, Email: {appointment_info['email']}, Service: {appointment_info['service']}, Date: {appointment_info['date']}. Ticket: {ticket_number}"
+            return f"✅ Your information is complete, but there was an issue saving to the database. Name: {appointment_info['name']}, Email: {appointment_info['email']}, Service: {appointment_info['service']}, Date: {appointment_info['date']}. Please try again later."
     else:
         missing = [k.title() for k, v in appointment_info.items() if not v]
         return f"⏳ Still need: {', '.join(missing)}. Please provide this information."
 
+@timed("tool", "get_info")
 def get_current_info(_: str) -> str:
     """Return the current state of appointment information."""
+    return current_session().appointment_info.cached("info", _render_info)
+
+def _render_info(appointment_info):
     info_status = []
     for key, value in appointment_info.items():
         status = f"{key.title()}: {value}" if value else f"{key.title()}: Not provided yet"
@@ -232,95 +247,127 @@ def get_current_info(_: str) -> str:
     
     return "Current information:\n" + "\n".join(info_status)
 
+@timed("tool", "verify_staff")
 def verify_staff_passcode(text: str) -> str:
     """Check if the provided text contains the staff passcode."""
-    global is_staff_mode
+    session = current_session()
     
     # Look for a passcode pattern (4+ consecutive digits or characters)
     passcode_match = re.search(r"[a-zA-Z0-9]{4,}", text)
     
     if passcode_match and passcode_match.group(0) == STAFF_PASSCODE:
-        is_staff_mode = True
+        session.is_staff_mode = True
         return "✅ Staff authentication successful. You can now query appointments."
     elif passcode_match:
         return "❌ Invalid passcode. Please try again or continue as a customer."
     else:
         return "No passcode detected. Please enter the staff passcode to access staff features."
 
+# Rows per page of an appointment listing; the agent only ever sees one page
+APPOINTMENTS_PAGE_SIZE = int(os.environ.get("APPOINTMENTS_PAGE_SIZE", 20))
+APPOINTMENT_COLUMNS = "id, name, email, service, date, ticket_number, status, start_time"
+# The whole message must ask for the next page; "list more pending ones for
+# facial" or "... next week" is a new listing with its own filters
+NEXT_PAGE_PATTERN = re.compile(r"^\s*(?:show\s+)?(?:more|next(?:\s+page)?)(?:\s+appointments)?\s*[.!]*\s*$", re.IGNORECASE)
+
+def appointment_filters_sql(name=None, email=None, service=None, date=None, status=None):
+    """Build the WHERE clause and parameters for an appointment listing"""
+    clauses, params = [], []
+    if name:
+        clauses.append("name LIKE ?")
+        params.append(f"%{name}%")
+    if email:
+        clauses.append("email = ? COLLATE NOCASE")
+        params.append(email)
+    if service:
+        clauses.append("service = ?")
+        params.append(service)
+    if date:
+        clauses.append("date = ?")
+        params.append(date)
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    return " AND ".join(clauses) or "1=1", params
+
+def fetch_appointments_page(filters, page_size=APPOINTMENTS_PAGE_SIZE, after=None):
+    """Return one page of appointments ordered by (date, id) and the cursor for the next page.
+
+    filters are keyword arguments for appointment_filters_sql; after is the
+    (date, id) cursor of the previous page. The cursor is None on the last page.
+    """
+    where, params = appointment_filters_sql(**filters)
+    if after:
+        where += " AND (date, id) > (?, ?)"
+        params += list(after)
+    with database.connection() as conn:
+        # One extra row tells whether another page follows
+        rows = conn.execute(
+            f"SELECT {APPOINTMENT_COLUMNS} FROM appointments WHERE {where} ORDER BY date, id LIMIT ?",
+            params + [page_size + 1]
+        ).fetchall()
+    if len(rows) > page_size:
+        last = rows[page_size - 1]
+        return rows[:page_size], (last[4], last[0])
+    return rows, None
+
+def iter_appointments(filters, page_size=APPOINTMENTS_PAGE_SIZE, after=None):
+    """Yield matching appointment rows one page at a time, never holding more than a page"""
+    while True:
+        rows, after = fetch_appointments_page(filters, page_size, after)
+        yield from rows
+        if after is None:
+            return
+
+def count_appointments(filters):
+    """Number of appointments matching filters"""
+    where, params = appointment_filters_sql(**filters)
+    with database.connection() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM appointments WHERE {where}", params).fetchone()[0]
+
+@timed("tool", "query_appointments")
 def query_appointments(text: str) -> str:
     """Query the database for appointment information based on various criteria."""
-    global is_staff_mode
-
-    if not is_staff_mode:
+    session = current_session()
+    if not session.is_staff_mode:
         return "⛔ You need staff authentication to access this feature. Please enter the staff passcode first."
 
-    conn = sqlite3.connect("appointmentdb.db")
-    cursor = conn.cursor()
-
-    query = "SELECT name, email, service, date, ticket_number FROM appointments WHERE 1=1"
-    params = []
-
-    # Check for name
-    name_match = re.search(r"name\s*(is)?\s*([A-Za-z\s]+)", text, re.IGNORECASE)
-    if name_match:
-        query += " AND name LIKE ?"
-        params.append(f"%{name_match.group(2).strip()}%")
-
-    # Check for email
-    email_match = re.search(r"\b[\w.-]+@[\w.-]+\.\w+\b", text)
-    if email_match:
-        query += " AND email LIKE ?"
-        params.append(f"%{email_match.group(0)}%")
-
-    # Check for service
-    service_match = re.search(r"(haircut|manicure|pedicure|massage|facial|consultation|appointment|checkup|cleaning)", text, re.IGNORECASE)
-    if service_match:
-        query += " AND service LIKE ?"
-        params.append(f"%{service_match.group(1).strip()}%")
-
-    # Check for date (standard formats)
-    date_match = re.search(r"\b(\d{4}-\d{2}-\d{2}|\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\b", text)
-    if date_match:
-        date_text = date_match.group(1)
-        parsed_date = dateparser.parse(date_text)
-        if parsed_date:
-            formatted_date = parsed_date.strftime("%Y-%m-%d")
-            query += " AND date = ?"
-            params.append(formatted_date)
-
-    # Check for status keywords
-    status_filter = None
-    if re.search(r"\b(done|completed|finish|ended)\b", text, re.IGNORECASE):
-        status_filter = "done"
-    elif re.search(r"\b(pending|upcoming|scheduled|future)\b", text, re.IGNORECASE):
-        status_filter = "pending"
-    elif re.search(r"\b(cancel|cancelled|canceled)\b", text, re.IGNORECASE):
-        status_filter = "cancel"
-        
-    if status_filter:
-        query += " AND status = ?"
-        params.append(status_filter)
+    filters = extract_staff_filters(text)
+    sql_filters = {
+        "name": filters.name,
+        "email": filters.email,
+        "service": filters.service,
+        "date": resolve_date(filters.date_text) if filters.date_text else None,
+        "status": filters.status,
+    }
 
-        
-    cursor.execute(query, params)
-    results = cursor.fetchall()
-    conn.close()
-
-    if results:
-        response_lines = ["📋 Appointments found:"]
-        for row in results:
-            response_lines.append(f"- Name: {row[0]}, Email: {row[1]}, Service: {row[2]}, Date: {row[3]}, Ticket: {row[4]}")
-        return "\n".join(response_lines)
-    else:
+    # "more" / "next page" continues the previous listing where it stopped
+    after, shown = None, 0
+    if session.listing and NEXT_PAGE_PATTERN.match(text):
+        sql_filters, after, shown = session.listing
+
+    rows, next_cursor = fetch_appointments_page(sql_filters, APPOINTMENTS_PAGE_SIZE, after)
+    session.listing = (sql_filters, next_cursor, shown + len(rows)) if next_cursor else None
+
+    if not rows:
         return "🔎 No appointments found matching your criteria."
 
+    total = count_appointments(sql_filters)
+    response_lines = [f"📋 Appointments found (showing {shown + 1}-{shown + len(rows)} of {total}):"]
+    for row in rows:
+        response_lines.append(f"- Name: {row[1]}, Email: {row[2]}, Service: {row[3]}, Date: {row[4]}, Ticket: {row[5]}")
+    if next_cursor:
+        response_lines.append('➡️ Say "more appointments" for the next page.')
+    return "\n".join(response_lines)
 
+
+@timed("tool", "exit_staff_mode")
 def exit_staff_mode(_: str) -> str:
     """Exit staff mode and return to customer booking mode."""
-    global is_staff_mode
+    session = current_session()
     
-    if is_staff_mode:
-        is_staff_mode = False
+    if session.is_staff_mode:
+        session.is_staff_mode = False
 
         reset_appointment_info()
 
@@ -329,123 +376,306 @@ def exit_staff_mode(_: str) -> str:
         return "You're already in customer mode."
 
 def update_database_schema():
-    """Add ticket_number column to appointments table if it doesn't exist"""
+    """Bring the database schema up to the latest migration"""
     try:
-        conn = sqlite3.connect('appointmentdb.db')
-        cursor = conn.cursor()
-        
-        # First verify the table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='appointments'")
-        if not cursor.fetchone():
-            print("⚠️ appointments table doesn't exist! Creating it...")
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS appointments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    email TEXT NOT NULL,
-                    service TEXT NOT NULL,
-                    date TEXT NOT NULL,
-                    ticket_number TEXT NOT NULL,
-                    status TEXT DEFAULT 'pending',
-                    price REAL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            print("✅ appointments table created!")
-        else:
-            # Check if the ticket_number column exists
-            cursor.execute("PRAGMA table_info(appointments)")
-            columns = [column[1] for column in cursor.fetchall()]
-            
-            if "ticket_number" not in columns:
-                print("Adding ticket_number column to appointments table...")
-                cursor.execute('''
-                    ALTER TABLE appointments
-                    ADD COLUMN ticket_number TEXT
-                ''')
-                print("✅ ticket_number column added successfully!")
-            else:
-                print("✅ ticket_number column already exists!")
-        
-        conn.commit()
-        conn.close()
+        applied = migrations.migrate()
+        if not applied:
+            log.info("✅ Database schema is up to date (version %d)!", migrations.LATEST_VERSION)
         return True
     except Exception as e:
-        print(f"❌ Schema update error: {str(e)}")
+        log.error("❌ Schema update error: %s", e)
         return False
 
 def initialize_database():
-    """Create the appointments table if it doesn't exist"""
+    """Create the database and its schema if they don't exist"""
     try:
         # Make sure the database directory exists
-        db_path = 'appointmentdb.db'
-        db_dir = os.path.dirname(os.path.abspath(db_path))
+        db_dir = os.path.dirname(os.path.abspath(database.DB_PATH))
         if not os.path.exists(db_dir):
             os.makedirs(db_dir)
             
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS appointments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT NOT NULL,
-                service TEXT NOT NULL,
-                date TEXT NOT NULL,
-                ticket_number TEXT NOT NULL,
-                status TEXT DEFAULT 'pending',
-                price REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        migrations.migrate()
         
         # Verify the table was created
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='appointments'")
-        if not cursor.fetchone():
-            raise Exception("Failed to create appointments table")
+        with database.connection() as conn:
+            if not conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='appointments'").fetchone():
+                raise Exception("Failed to create appointments table")
+
+        if booking_queue is not None:
+            # Replays bookings a crash left in the journal. A journal locked by
+            # another process stops startup instead of failing each booking.
+            try:
+                booking_queue.start()
+            except RuntimeError as e:
+                log.critical("❌ %s", e)
+                raise SystemExit(str(e)) from e
             
-        conn.commit()
-        conn.close()
-        print("✅ Database initialized!")
+        log.info("✅ Database initialized!")
         return True
     except Exception as e:
-        print(f"❌ Database initialization error: {str(e)}")
+        log.error("❌ Database initialization error: %s", e)
         return False
 
-# In the save_appointment_to_db function, add the reset_appointment_info() call:
+# Attempts per booking if a ticket number turns out to be taken
+TICKET_RETRIES = 3
 
-def save_appointment_to_db(name, email, service, date, ticket_number):
-    """Save the appointment data to the database including ticket number"""
-    # Additional validation before saving to database
-    if not is_date_valid(date):
-        print("⚠️ Invalid date detected - booking canceled.")
-        return False
-        
+INSERT_APPOINTMENT_SQL = '''
+    INSERT INTO appointments (name, email, service, date, ticket_number, status, price, start_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+FIND_ACTIVE_BOOKING_SQL = '''
+    SELECT ticket_number, start_time FROM appointments
+    WHERE email = ? COLLATE NOCASE AND service = ? AND date = ? AND status = 'pending' LIMIT 1
+'''
+
+def _insert_appointment(conn, name, email, service, date, ticket_number, start_time=None):
+    conn.execute(INSERT_APPOINTMENT_SQL, (name, email, service, date, ticket_number, "pending", 0.0, start_time))
+
+def find_active_booking(conn, email, service, date):
+    """Return (ticket_number, start_time) of the pending booking for this email, service and date, or None"""
+    if booking_queue is not None:
+        queued = booking_queue.pending_booking(email, service, date)
+        if queued:
+            return queued
+    return conn.execute(FIND_ACTIVE_BOOKING_SQL, (email, service, date)).fetchone()
+
+def _queue_booking(name, email, service, date, start_time):
+    """Confirm a booking now and leave its insert to the write-behind queue; the caller holds the date's lock"""
+    ticket_number = ticket_allocator.allocate()
     try:
-        conn = sqlite3.connect('appointmentdb.db')
-        cursor = conn.cursor()
+        booking_queue.submit(name, email, service, date, ticket_number, start_time)
+    except (OSError, RuntimeError) as e:
+        log.error("❌ Booking queue error: %s", e)
+        return None, None
+    scheduler.reserve(date, start_time, service, committed=False)
+    recent_bookings.remember(email, service, date, ticket_number, start_time)
+    log.info("✅ appointment queued with ticket %s!", ticket_number, extra={"ticket": ticket_number})
+    return ticket_number, start_time
 
-        cursor.execute('''
-            INSERT INTO appointments (name, email, service, date, ticket_number, status, price)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (name, email, service, date, ticket_number, "pending", 0.0))
+def book_appointment(name, email, service, date, preferred_time=None):
+    """Allocate a ticket and a time slot and save the appointment.
 
-        conn.commit()
-        conn.close()
-        print(f"✅ appointment saved to database with ticket {ticket_number}!")
+    Returns (ticket_number, start_time), or (None, None) if it couldn't be
+    booked. This is the one booking entry point: every path that completes
+    an appointment goes through here so tickets always come from the
+    allocator and slots are never oversubscribed.
 
-        return True
-    except Exception as e:
-        print(f"❌ Database error: {str(e)}")
-        return False
+    Booking is idempotent per (email, service, date): while a pending
+    booking exists for them, its ticket and start time are returned again
+    instead of inserting another row.
+
+    With BOOKING_WRITES=write-behind the booking is handed to booking_queue
+    and committed by its writer shortly after this returns.
+    """
+    if not is_date_valid(date):
+        log.warning("⚠️ Invalid date detected - booking canceled.")
+        return None, None
+
+    if recent_bookings.get(email, service, date):
+        # Only a hint: another worker (or staff editing the table) may have
+        # cancelled it, so confirm on the active-booking index before answering
+        with database.connection() as conn:
+            booked = find_active_booking(conn, email, service, date)
+        if booked:
+            log.info("↩️ %s already booked as %s.", email, booked[0], extra={"ticket": booked[0]})
+            return tuple(booked)
+        recent_bookings.forget(email, service, date)
+
+    # The date's booking lock queues up other threads (and, with
+    # BOOKING_LOCKS=file, other workers) booking that day; the re-check
+    # inside BEGIN IMMEDIATE is the final guard.
+    with booking_locks.hold(date):
+        with database.connection() as conn:
+            booked = find_active_booking(conn, email, service, date)
+        if booked:
+            recent_bookings.remember(email, service, date, *booked)
+            log.info("↩️ %s already booked as %s.", email, booked[0], extra={"ticket": booked[0]})
+            return tuple(booked)
+
+        start_time = scheduler.find_start(date, service, preferred_time)
+        if start_time is None:
+            log.warning("⚠️ No free slot for %s on %s - booking canceled.", service, date)
+            return None, None
+
+        if booking_queue is not None:
+            return _queue_booking(name, email, service, date, start_time)
+
+        for _ in range(TICKET_RETRIES):
+            ticket_number = ticket_allocator.allocate()
+            try:
+                with database.connection() as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    # A batch booking (which takes no booking lock) may have got here first
+                    booked = find_active_booking(conn, email, service, date)
+                    if booked:
+                        recent_bookings.remember(email, service, date, *booked)
+                        return tuple(booked)
+                    if not scheduler.verify_in_db(conn, date, start_time, service):
+                        log.warning("⚠️ Slot %s %s was just taken - booking canceled.", date, start_time)
+                        return None, None
+                    _insert_appointment(conn, name, email, service, date, ticket_number, start_time)
+            except sqlite3.IntegrityError as e:
+                # The unique index caught a ticket that is already taken
+                # (e.g. inserted by hand); draw the next one.
+                log.warning("⚠️ Ticket %s already in use, retrying: %s", ticket_number, e)
+                continue
+            except Exception as e:
+                log.error("❌ Database error: %s", e)
+                return None, None
+            scheduler.reserve(date, start_time, service)
+            recent_bookings.remember(email, service, date, ticket_number, start_time)
+            log.info("✅ appointment saved to database with ticket %s!", ticket_number, extra={"ticket": ticket_number})
+            return ticket_number, start_time
+
+    log.error("❌ Could not allocate a free ticket number.")
+    return None, None
+
+# Largest batch accepted by the batch endpoint
+BATCH_MAX_ROWS = int(os.environ.get("BATCH_MAX_ROWS", 10000))
+BOOKING_FIELDS = ("name", "email", "service", "date")
+
+def validate_booking(row):
+    """Check one bulk booking row with the chat rules.
+
+    Returns ((name, email, service, date, preferred_time), None) for a valid
+    row or (None, error message) otherwise.
+    """
+    missing = [field for field in BOOKING_FIELDS if not str(row.get(field) or "").strip()]
+    if missing:
+        return None, f"missing {', '.join(missing)}"
+
+    name = str(row["name"]).strip()
+    email = str(row["email"]).strip()
+    if len(name) < 2:
+        return None, "name is too short"
+    if not EMAIL_PATTERN.fullmatch(email):
+        return None, f"invalid email {email!r}"
+
+    date = resolve_date(str(row["date"]))
+    if not date:
+        return None, f"unrecognized date {row['date']!r}"
+    if not is_date_valid(date):
+        return None, f"date {date} is today or in the past"
+
+    preferred_time = None
+    if str(row.get("time") or "").strip():
+        preferred_time = normalize_time(str(row["time"]).strip())
+        if not preferred_time:
+            return None, f"invalid time {row['time']!r}"
+
+    return (name.title(), email, canonical_service(str(row["service"]).strip()), date, preferred_time), None
+
+def book_appointments_batch(rows):
+    """Validate and book many appointments in one transaction.
+
+    Rows are dicts with name, email, service, date and an optional time.
+    Every valid row that has a free slot is inserted with one executemany;
+    the rest are reported per row. A row whose email, service and date are
+    already booked (earlier, or by a previous row of the batch) is not
+    inserted again: it is listed in "booked" with the existing ticket and
+    "alreadyBooked": true, so a retried batch books nothing twice. Returns a
+    summary dict with "booked", "errors" (each carrying its 0-based "row"
+    index) and throughput.
+    """
+    started = time.perf_counter()
+    errors = []
+    valid = []
+    for index, row in enumerate(rows):
+        booking, error = validate_booking(row)
+        if error:
+            errors.append({"row": index, "error": error})
+        else:
+            valid.append((index, booking))
+
+    booked = []
+    if valid:
+        # Tickets come from their own short transactions, so draw them before
+        # taking the write lock; numbers left unused by rejected rows are skipped.
+        tickets = ticket_allocator.allocate_many(len(valid))
+        dates = {booking[3] for _, booking in valid}
+        # Synchronous writes need no booking locks: plan_in_db reads every day
+        # under the write lock, and the version bump tells other workers'
+        # caches to reload. Queued bookings are not in the database yet, so
+        # with write-behind the dates are locked against book_appointment.
+        locks = booking_locks.hold(*dates) if booking_queue is not None else nullcontext()
+        try:
+            with locks, database.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # Rows repeating an existing booking or an earlier row are not planned
+                new, repeats, first_rows = [], [], {}
+                for index, booking in valid:
+                    _, email, service, date, _ = booking
+                    key = (email.lower(), service, date)
+                    existing = find_active_booking(conn, email, service, date)
+                    if existing:
+                        booked.append({"row": index, "ticketNumber": existing[0], "date": date,
+                                       "startTime": existing[1], "alreadyBooked": True})
+                    elif key in first_rows:
+                        repeats.append((index, key))
+                    else:
+                        first_rows[key] = index
+                        new.append((index, booking))
+
+                starts = scheduler.plan_in_db(conn, [(date, service, preferred_time)
+                                                     for _, (_, _, service, date, preferred_time) in new])
+                params, new_bookings = [], {}
+                for (index, booking), ticket_number, start_time in zip(new, tickets, starts):
+                    name, email, service, date, preferred_time = booking
+                    if start_time is None:
+                        wanted = f" at {preferred_time}" if preferred_time else ""
+                        errors.append({"row": index, "error": f"no free slot for {service} on {date}{wanted}"})
+                        continue
+                    params.append((name, email, service, date, ticket_number, "pending", 0.0, start_time))
+                    new_bookings[(email.lower(), service, date)] = (ticket_number, start_time)
+                    booked.append({"row": index, "ticketNumber": ticket_number, "date": date, "startTime": start_time})
+                for index, key in repeats:
+                    if key in new_bookings:
+                        ticket_number, start_time = new_bookings[key]
+                        booked.append({"row": index, "ticketNumber": ticket_number, "date": key[2],
+                                       "startTime": start_time, "alreadyBooked": True})
+                    else:
+                        errors.append({"row": index, "error": f"repeats row {first_rows[key]}, which was not booked"})
+                conn.executemany(INSERT_APPOINTMENT_SQL, params)
+            for (email, service, date), (ticket_number, start_time) in new_bookings.items():
+                recent_bookings.remember(email, service, date, ticket_number, start_time)
+        except sqlite3.Error as e:
+            # The whole batch was rolled back, so no row was booked
+            log.error("❌ Batch booking error: %s", e)
+            errors.extend({"row": entry["row"], "error": f"batch rolled back: {str(e)}"} for entry in booked)
+            booked = []
+        finally:
+            for date in dates:
+                scheduler.forget(date)
+
+    errors.sort(key=lambda entry: entry["row"])
+    booked.sort(key=lambda entry: entry["row"])
+    seconds = time.perf_counter() - started
+    return {
+        "rows": len(rows),
+        "booked": booked,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "rowsPerSecond": round(len(rows) / seconds, 1) if seconds else 0.0,
+    }
+
+def import_appointments_csv(path):
+    """Book every row of a CSV file with name, email, service, date and optional time columns"""
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    result = book_appointments_batch(rows)
+    for error in result["errors"]:
+        # +2: the header is line 1 and rows are counted from 0
+        print(f"❌ Line {error['row'] + 2}: {error['error']}")
+    print(f"✅ Imported {len(result['booked'])} of {result['rows']} appointments "
+          f"in {result['seconds']}s ({result['rowsPerSecond']} rows/s)")
+    return result
 
 # Function to cancel an appointment
+@timed("tool", "cancel_appointment")
 def cancel_appointment(text: str) -> str:
     """Cancel an appointment by updating its status in the database."""
-    global is_staff_mode
-    
-    if not is_staff_mode:
+    if not current_session().is_staff_mode:
         return "⛔ You need staff authentication to cancel appointments. Please enter the staff passcode first."
     
     # Try to extract a ticket number
@@ -456,96 +686,86 @@ def cancel_appointment(text: str) -> str:
     ticket = ticket_match.group(1)
     
     try:
-        conn = sqlite3.connect('appointmentdb.db')
-        cursor = conn.cursor()
-        
-        # First check if the ticket exists
-        cursor.execute("SELECT id, name FROM appointments WHERE ticket_number = ?", (ticket))
-        appointment = cursor.fetchone()
-        
-        if not appointment:
-            conn.close()
-            return f"❌ No appointment found with ticket number {ticket}."
-        
-        # Update the status to 'cancel'
-        cursor.execute(
-            "UPDATE appointments SET status = 'cancel' WHERE ticket_number = ?", 
-            (ticket,)
-        )
+        if booking_queue is not None:
+            # The ticket may still be waiting to be written
+            booking_queue.flush(timeout=10)
+        with database.connection() as conn:
+            # First check if the ticket exists
+            appointment = conn.execute(
+                "SELECT id, name, date, email, service FROM appointments WHERE ticket_number = ?", (ticket,)
+            ).fetchone()
+            
+            if not appointment:
+                return f"❌ No appointment found with ticket number {ticket}."
+            
+            # Update the status to 'cancel'
+            conn.execute(
+                "UPDATE appointments SET status = 'cancel' WHERE ticket_number = ?", 
+                (ticket,)
+            )
         
-        conn.commit()
-        conn.close()
+        # Free the slot in the availability index and let the customer book again
+        scheduler.forget(appointment[2])
+        recent_bookings.forget(appointment[3], appointment[4], appointment[2])
         
         return f"✅ Appointment with ticket {ticket} for {appointment[1]} has been successfully cancelled."
     
     except Exception as e:
-        print(f"❌ Database cancellation error: {str(e)}")
+        log.error("❌ Database cancellation error: %s", e)
         return f"⚠️ Error cancelling appointment: {str(e)}"
 
 
+def income_summary(date=None, date_range=None, service=None):
+    """Return (total income, appointment count) of done appointments, read from the income_daily rollup.
+
+    date_range is an inclusive (start, end) pair and takes precedence over date.
+    """
+    clauses, params = ["status = 'done'"], []
+    if date_range:
+        clauses.append("date BETWEEN ? AND ?")
+        params += list(date_range)
+    elif date:
+        clauses.append("date = ?")
+        params.append(date)
+    if service:
+        # Known services match exactly so the rollup's service index applies
+        if service in SERVICES:
+            clauses.append("service = ?")
+            params.append(service)
+        else:
+            clauses.append("service LIKE ?")
+            params.append(f"%{service}%")
+
+    with database.connection() as conn:
+        total_income, appointment_count = conn.execute(
+            f"SELECT SUM(income), SUM(appointments) FROM income_daily WHERE {' AND '.join(clauses)}", params
+        ).fetchone()
+    return total_income or 0, appointment_count or 0
+
+@timed("tool", "query_income")
 def query_income(text: str) -> str:
     """Query the database for income information based on various criteria."""
-    global is_staff_mode
-    
-    if not is_staff_mode:
+    if not current_session().is_staff_mode:
         return "⛔ You need staff authentication to access income information. Please enter the staff passcode first."
     
     try:
-        conn = sqlite3.connect('appointmentdb.db')
-        cursor = conn.cursor()
-        
-        # Default query: get total income from all pending appointments
-        query = "SELECT SUM(price) FROM appointments WHERE status = 'done'"
-        params = []
-        
+        filters = extract_income_filters(text)
+
         # Check if query is for a specific date
-        date_match = re.search(r"(?:date|on|for)\s+(.+?)(?:,|\.|$)", text, re.IGNORECASE)
-        if date_match:
-            date_text = date_match.group(1)
-            parsed_date = dateparser.parse(date_text)
-            if parsed_date:
-                query = "SELECT SUM(price) FROM appointments WHERE status = 'done' AND date = ?"
-                params = [parsed_date.strftime("%Y-%m-%d")]
-        
+        date = resolve_date(filters.date_text) if filters.date_text else None
+
         # Check if query is for a specific service
-        service_match = re.search(r"(?:service|type)\s+(.+?)(?:,|\.|$)", text, re.IGNORECASE)
-        if service_match:
-            service = service_match.group(1)
-            if params:  
-                query = query.replace("WHERE", "WHERE service LIKE ? AND")
-                params.insert(0, f"%{service}%")
-            else:
-                query = "SELECT SUM(price) FROM appointments WHERE status = 'done' AND service LIKE ?"
-                params = [f"%{service}%"]
-        
-        # Check for date range queries
-        start_date = None
-        end_date = None
-        
+        service = canonical_service(filters.service_text) if filters.service_text else None
+
         # Look for "between [date] and [date]" pattern
-        range_match = re.search(r"between\s+(.+?)\s+and\s+(.+?)(?:,|\.|$)", text, re.IGNORECASE)
-        if range_match:
-            start_text = range_match.group(1)
-            end_text = range_match.group(2)
-            
-            start_date = dateparser.parse(start_text)
-            end_date = dateparser.parse(end_text)
-            
+        date_range = None
+        if filters.range_texts:
+            start_date, end_date = (resolve_date(date_text) for date_text in filters.range_texts)
             if start_date and end_date:
-                query = "SELECT SUM(price) FROM appointments WHERE status = 'done' AND date BETWEEN ? AND ?"
-                params = [start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")]
-        
-        # Execute query
-        cursor.execute(query, params)
-        total_income = cursor.fetchone()[0] or 0
-        
-        # Get the count of appointments
-        count_query = query.replace("SUM(price)", "COUNT(*)")
-        cursor.execute(count_query, params)
-        appointment_count = cursor.fetchone()[0] or 0
-        
-        conn.close()
-        
+                date_range = (start_date, end_date)
+
+        total_income, appointment_count = income_summary(date, date_range, service)
+
         # Format results
         result = f"💰 Total Income: ${total_income:.2f}\n"
         result += f"📊 Appointments: {appointment_count}\n"
@@ -556,64 +776,232 @@ def query_income(text: str) -> str:
         return result
     
     except Exception as e:
-        print(f"❌ Income query error: {str(e)}")
+        log.error("❌ Income query error: %s", e)
         return f"⚠️ Error querying income data: {str(e)}"
 
 
-# Define tools list with the new tools
-tools = [
-    Tool(
-        name="extract_info",
-        func=extract_appointment_info,
-        description="Extract name, email, service, and date from user input."
-    ),
-    Tool(
-        name="check_goal",
-        func=check_appointment_goal,
-        description="Check if all required information has been provided."
-    ),
-    Tool(
-        name="get_info",
-        func=get_current_info,
-        description="Get the current status of collected information."
-    ),
-    Tool(
-        name="verify_staff",
-        func=verify_staff_passcode,
-        description="Verify if the provided passcode grants staff access."
-    ),
-    Tool(
-        name="query_appointments",
-        func=query_appointments,
-        description="Query appointments in the database (staff only)."
-    ),
-    Tool(
-        name="cancel_appointment",
-        func=cancel_appointment,
-        description="Cancel an appointment by updating its status (staff only)."
-    ),
-    Tool(
-        name="exit_staff_mode",
-        func=exit_staff_mode,
-        description="Exit staff mode and return to customer booking mode."
-    ),
-    Tool(
-    name="query_income",
-    func=query_income, 
-    description="Query income information from appointments (staff only)."
+def build_tools():
+    """Wrap the tool functions for the agent"""
+    from langchain.agents import Tool
+
+    return [
+        Tool(
+            name="extract_info",
+            func=extract_appointment_info,
+            description="Extract name, email, service, and date from user input."
+        ),
+        Tool(
+            name="check_goal",
+            func=check_appointment_goal,
+            description="Check if all required information has been provided."
+        ),
+        Tool(
+            name="get_info",
+            func=get_current_info,
+            description="Get the current status of collected information."
+        ),
+        Tool(
+            name="verify_staff",
+            func=verify_staff_passcode,
+            description="Verify if the provided passcode grants staff access."
+        ),
+        Tool(
+            name="query_appointments",
+            func=query_appointments,
+            description="Query appointments in the database (staff only)."
+        ),
+        Tool(
+            name="cancel_appointment",
+            func=cancel_appointment,
+            description="Cancel an appointment by updating its status (staff only)."
+        ),
+        Tool(
+            name="exit_staff_mode",
+            func=exit_staff_mode,
+            description="Exit staff mode and return to customer booking mode."
+        ),
+        Tool(
+        name="query_income",
+        func=query_income, 
+        description="Query income information from appointments (staff only)."
+        )
+    ]
+
+# The agent is shared by all sessions, so it carries no memory of its own;
+# each call passes the session's chat history in explicitly.
+agent = None
+_agent_lock = threading.Lock()
+
+def _build_agent():
+    from langchain.agents import AgentType, initialize_agent
+    from llm_backends import build_llm
+
+    # The backend is picked by LLM_BACKEND (Gemini unless configured otherwise)
+    return initialize_agent(
+        tools=build_tools(),
+        llm=build_llm(cache_context=response_cache_context),
+        agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
+        handle_parsing_errors=True
     )
-]
-
-agent = initialize_agent(
-    tools=tools,
-    llm=llm,
-    agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
-    memory=memory,
-    verbose=True,
-    handle_parsing_errors=True
-)
+
+def response_cache_context():
+    """Session state an LLM reply can depend on; part of every response cache key"""
+    session = current_session()
+    return [session.appointment_info.to_dict(), session.preferred_time, session.is_staff_mode]
+
+def get_agent():
+    """Return the shared agent, building it on first call"""
+    global agent
+    if agent is None:
+        with _agent_lock:
+            if agent is None:
+                agent = _build_agent()
+    return agent
+
+async def aget_agent():
+    """get_agent for coroutines; a first-time build runs off the event loop"""
+    if agent is not None:
+        return agent
+    return await asyncio.get_running_loop().run_in_executor(None, get_agent)
+
+def warm_up_agent():
+    """Build the agent on a background thread so the first chat turn does not wait for it"""
+    def build():
+        try:
+            get_agent()
+            log.info("✅ Agent ready")
+        except Exception as e:
+            log.warning("⚠️ Agent warm-up failed: %s", e)
+
+    thread = threading.Thread(target=build, name="agent-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def _agent_config(callbacks):
+    # Tracing replaces the old verbose=True and is chosen per request
+    if tracing_enabled():
+        callbacks = list(callbacks or []) + [new_agent_tracer()]
+    return {"callbacks": callbacks} if callbacks else None
+
+def chat_with_agent(session, user_input, callbacks=None):
+    """Run one agent turn for a session and record it in the session's history"""
+    with use_session(session):
+        response = get_agent().invoke(
+            {"input": user_input, "chat_history": session.history_messages()},
+            config=_agent_config(callbacks)
+        )
+    session.add_turn(user_input, response["output"])
+    return response["output"]
+
+async def achat_with_agent(session, user_input, callbacks=None):
+    """Async variant of chat_with_agent; sync tools run on the event loop's default executor"""
+    with use_session(session):
+        response = await (await aget_agent()).ainvoke(
+            {"input": user_input, "chat_history": session.history_messages()},
+            config=_agent_config(callbacks)
+        )
+    session.add_turn(user_input, response["output"])
+    return response["output"]
+
+# The conversational agent answers with a JSON blob; this marks the start of
+# the final answer text inside it.
+FINAL_ANSWER_START = re.compile(r'"action"\s*:\s*"Final Answer"\s*,\s*"action_input"\s*:\s*"')
+JSON_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", '"': '"', "\\": "\\", "/": "/"}
+
+class FinalAnswerStreamer:
+    """Pulls the Final Answer text out of the agent's JSON blob while the LLM is still streaming it"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None
+        self.finished = False
+
+    def feed(self, chunk):
+        """Add streamed LLM text and return any newly available final answer text"""
+        self.buffer += chunk
+        if self.finished:
+            return ""
+        if self.pos is None:
+            start_match = FINAL_ANSWER_START.search(self.buffer)
+            if not start_match:
+                return ""
+            self.pos = start_match.end()
+
+        buf = self.buffer
+        i = self.pos
+        out = []
+        while i < len(buf):
+            char = buf[i]
+            if char == '"':
+                self.finished = True
+                i += 1
+                break
+            if char == "\\":
+                # Wait for the rest of an escape sequence split across chunks
+                if i + 1 >= len(buf) or (buf[i + 1] == "u" and i + 6 > len(buf)):
+                    break
+                if buf[i + 1] == "u":
+                    try:
+                        out.append(chr(int(buf[i + 2:i + 6], 16)))
+                    except ValueError:
+                        pass
+                    i += 6
+                else:
+                    out.append(JSON_ESCAPES.get(buf[i + 1], buf[i + 1]))
+                    i += 2
+                continue
+            out.append(char)
+            i += 1
+        self.pos = i
+        return "".join(out)
+
+def _chunk_text(chunk):
+    content = getattr(chunk, "content", None)
+    if isinstance(content, str):
+        return content
+    text = getattr(chunk, "text", "")
+    return text() if callable(text) else (text or "")
+
+async def astream_agent_events(session, user_input, callbacks=None):
+    """Run one agent turn, yielding ("tool", ...) and ("token", ...) events as they happen and ("final", ...) last"""
+    output = None
+    streamer = None
+    agent = await aget_agent()
+    with use_session(session):
+        async for event in agent.astream_events(
+            {"input": user_input, "chat_history": session.history_messages()},
+            config=_agent_config(callbacks),
+            version="v2"
+        ):
+            kind = event["event"]
+            if kind in ("on_llm_start", "on_chat_model_start"):
+                # Each LLM call writes a new JSON blob
+                streamer = FinalAnswerStreamer()
+            elif kind in ("on_llm_stream", "on_chat_model_stream") and streamer is not None:
+                text = streamer.feed(_chunk_text(event["data"]["chunk"]))
+                if text:
+                    yield "token", {"text": text}
+            elif kind == "on_tool_end":
+                yield "tool", {"tool": event["name"], "output": str(event["data"].get("output", ""))}
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                output = event["data"]["output"]["output"]
+
+    session.add_turn(user_input, output)
+    yield "final", {"output": output}
 
 if __name__ == "__main__":
+    import sys
+
+    from app_logging import setup_logging
+
+    setup_logging()
+
+    # python appointment_create_agent.py import bookings.csv
+    if len(sys.argv) == 3 and sys.argv[1] == "import":
+        initialize_database()
+        result = import_appointments_csv(sys.argv[2])
+        sys.exit(1 if result["errors"] else 0)
+
     try:
         # Make sure database initialization happens first and is successful
         print("🔄 Initializing database...")
@@ -626,8 +1014,9 @@ if __name__ == "__main__":
         print("⚠️ Creating fresh database...")
  
         try:
-            if os.path.exists('appointmentdb.db'):
-                os.rename('appointmentdb.db', 'appointmentdb.db.bak')
+            database.close_connections()
+            if os.path.exists(database.DB_PATH):
+                os.rename(database.DB_PATH, database.DB_PATH + '.bak')
             initialize_database()
             print("✅ Fresh database created successfully!")
         except Exception as e2:
@@ -640,6 +1029,9 @@ if __name__ == "__main__":
     print("🗓️ Note: You must select a future date for your appointments.")
     print("👔 Staff: Enter staff passcode to access appointment information.")
 
+    session = cli_session
+    appointment_info = session.appointment_info
+
     while True:
         user_input = input("You: ")
         if user_input.lower() in ["exit", "quit"]:
@@ -650,7 +1042,7 @@ if __name__ == "__main__":
             # First, check if this might be a staff authentication attempt
             if "staff" in user_input.lower() or "passcode" in user_input.lower() or re.search(r"\b[a-zA-Z0-9]{4,}\b", user_input):
                 staff_result = verify_staff_passcode(user_input)
-                if is_staff_mode:
+                if session.is_staff_mode:
                     print("Bot:", staff_result)
                     print("🔐 Staff mode activated. You can now query appointment information.")
                     print("Available commands:")
@@ -662,7 +1054,7 @@ if __name__ == "__main__":
                     continue
             
             # If in staff mode, try to process staff-specific commands
-            if is_staff_mode:
+            if session.is_staff_mode:
                 if "exit" in user_input.lower() and "staff" in user_input.lower():
                     result = exit_staff_mode(user_input)
                     print("Bot:", result)
@@ -675,7 +1067,7 @@ if __name__ == "__main__":
                     continue
             
             # If not in staff mode use the normal flow
-            if not is_staff_mode:
+            if not session.is_staff_mode:
                 extract_result = extract_appointment_info(user_input)
                 
                 if extract_result and "today or a past date" in extract_result:
@@ -683,11 +1075,13 @@ if __name__ == "__main__":
                     continue
             
             # Use the agent for a conversational response
-            response = agent.invoke({"input": user_input})
+            output = chat_with_agent(session, user_input)
             
-            print("Bot:", response["output"])
+            print("Bot:", output)
             
-            if not is_staff_mode and all(appointment_info.values()):
+            # Tools may have replaced the slot dict (e.g. after a reset)
+            appointment_info = session.appointment_info
+            if not session.is_staff_mode and appointment_info.is_complete:
                 # Validate date once more before confirming booking
                 if not is_date_valid(appointment_info["date"]):
                     print("⚠️ I noticed you selected today or a past date. Please choose a future date for your appointment.")
@@ -697,18 +1091,16 @@ if __name__ == "__main__":
                     
                 print("🎉 Appointment info complete!")
                 
-                ticket_number = f"APPT-{random.randint(10000, 99999)}"
-                
-                db_result = save_appointment_to_db(
+                ticket_number, start_time = book_appointment(
                     appointment_info["name"],
                     appointment_info["email"],
                     appointment_info["service"],
                     appointment_info["date"],
-                    ticket_number)
+                    session.preferred_time)
                 
-                if db_result:
+                if ticket_number:
                     print(f"✅ Appointment for {appointment_info['name']} successfully stored in database.")
-                    print(f"📅 Your appointment has been confirmed! Ticket #: {ticket_number}")
+                    print(f"📅 Your appointment has been confirmed for {start_time}! Ticket #: {ticket_number}")
 
                     print("\n📝 Ready for new booking. How can I help you?")
                 else:
@@ -0,0 +1,307 @@
+"""Async (ASGI) serving mode for the booking assistant.
+
+Serves the same /chat, /chat/stream and /reset API as server.py, but agent turns await
+agent.ainvoke on the event loop instead of holding a thread each. Run with:
+
+    uvicorn asgi_server:app --host 0.0.0.0 --port 5000
+
+or `WEB_WORKERS=4 python asgi_server.py` for several worker processes, which
+then share sessions (SESSION_STORE=sqlite) and booking locks (BOOKING_LOCKS=file).
+"""
+import asyncio
+import functools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import metrics
+from app_logging import agent_tracing, get_logger
+from appointment_create_agent import session_store
+from chat_router import router
+from idempotency import IDEMPOTENCY_WAIT_SECONDS, chat_replies
+from server import (
+    REPLAYED_HEADERS, STILL_RUNNING_REPLY, appointment_listing, batch_booking, chat_payload, chat_stream_events,
+    idempotency_key, memory_policy_error, replayed_events, reset_payload, session_for, sse_event, staff_report,
+    stats_payload, wants_profile
+)
+
+log = get_logger("asgi")
+
+# Agent turns allowed to talk to the LLM at once
+MAX_CONCURRENT_LLM_CALLS = int(os.environ.get("MAX_CONCURRENT_LLM_CALLS", 32))
+# Chats allowed to wait for an LLM slot before new ones are turned away
+MAX_QUEUED_CHATS = int(os.environ.get("MAX_QUEUED_CHATS", 256))
+# Threads running the synchronous DB tools
+DB_WORKER_THREADS = int(os.environ.get("DB_WORKER_THREADS", 8))
+# Worker processes started by `python asgi_server.py`
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", 1))
+PORT = int(os.environ.get("PORT", 5000))
+
+BUSY_REPLY = "⏳ The assistant is busy right now. Please try again in a moment."
+REPLAYED = [(name.lower().encode(), value.encode()) for name, value in REPLAYED_HEADERS.items()]
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"Content-Type, X-Staff-Passcode, X-Profile, X-Agent-Trace, Idempotency-Key"),
+    (b"access-control-expose-headers", b"Server-Timing, Idempotent-Replayed"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+]
+
+
+class AsyncChatService:
+    """Admission control for chats: a bounded queue in front of a fixed number of LLM slots"""
+
+    def __init__(self, max_llm_calls, max_queued, db_workers):
+        self.llm_slots = asyncio.Semaphore(max_llm_calls)
+        self.max_in_flight = max_llm_calls + max_queued
+        self.in_flight = 0
+        self.db_pool = ThreadPoolExecutor(max_workers=db_workers, thread_name_prefix="db-tool")
+        self._loop = None
+
+    def _bind_loop(self):
+        # Tools called by agent.ainvoke run through the loop's default
+        # executor, so point it at the bounded DB pool as well.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            loop.set_default_executor(self.db_pool)
+            self._loop = loop
+
+    async def chat(self, body, profile=False, trace=False):
+        """Handle one /chat request body; returns (status, payload), with the turn's spans if profile"""
+        self._bind_loop()
+        if self.in_flight >= self.max_in_flight:
+            return 503, {"reply": BUSY_REPLY}
+
+        self.in_flight += 1
+        try:
+            session = session_for(body)
+            with metrics.profiled(profile) as spans, agent_tracing(trace):
+                bot_response, routing = await router.ahandle(
+                    session, body.get("message", ""), executor=self.db_pool, llm_slots=self.llm_slots
+                )
+            # A shared (SQLite) store writes the session back; keep that off the loop
+            await asyncio.get_running_loop().run_in_executor(self.db_pool, session_store.save, session)
+            return 200, chat_payload(session, bot_response, routing, spans, body)
+        except Exception as e:
+            metrics.errors_total.inc("request", "chat")
+            return 500, {"reply": f"Error: {str(e)}"}
+        finally:
+            self.in_flight -= 1
+
+    async def idempotent_chat(self, body, key, profile=False, trace=False):
+        """chat() for a request carrying an Idempotency-Key; returns (status, payload, replayed)"""
+        future, owner = chat_replies.claim(body.get("sessionId"), key)
+        if not owner:
+            status, payload = await self.replayed_reply(future)
+            return status, payload, True
+        status, payload = 500, {"reply": "Error: request failed"}
+        try:
+            status, payload = await self.chat(body, profile, trace)
+        finally:
+            chat_replies.finish(body.get("sessionId"), key, future, status, payload)
+        return status, payload, False
+
+    async def replayed_reply(self, future):
+        """(status, payload) of the first request with a repeated key, waiting for it if it is still running"""
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), IDEMPOTENCY_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            return 409, {"reply": STILL_RUNNING_REPLY}
+
+    async def chat_stream(self, body, send, trace=False, key=None):
+        """Handle one /chat/stream request, sending SSE events as the turn progresses"""
+        self._bind_loop()
+        future = None
+        if key:
+            future, owner = chat_replies.claim(body.get("sessionId"), key)
+            if not owner:
+                events = replayed_events(*await self.replayed_reply(future))
+                await send({
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")]
+                               + CORS_HEADERS + REPLAYED,
+                })
+                await send({"type": "http.response.body", "body": events.encode("utf-8")})
+                return
+        # Called with (status, payload) once the turn's reply is known
+        on_reply = functools.partial(chat_replies.finish, body.get("sessionId"), key, future) if key else None
+
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")] + CORS_HEADERS,
+            })
+            if self.in_flight >= self.max_in_flight:
+                busy = {"reply": BUSY_REPLY}
+                if on_reply:
+                    on_reply(503, busy)
+                await send({"type": "http.response.body", "body": sse_event("error", busy).encode("utf-8")})
+                return
+
+            self.in_flight += 1
+            try:
+                session = session_for(body)
+                with agent_tracing(trace):
+                    async for chunk in chat_stream_events(session, body.get("message", ""), on_reply, body,
+                                                          executor=self.db_pool, llm_slots=self.llm_slots):
+                        await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+            finally:
+                self.in_flight -= 1
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if on_reply:
+                # Releases waiting repeats if the client went away before the turn finished
+                on_reply(500, {"reply": "Error: request failed"})
+
+    async def appointments(self, scope, send):
+        """Handle one GET /appointments request, streaming the listing a page at a time"""
+        self._bind_loop()
+        loop = asyncio.get_running_loop()
+        args = {key: values[0] for key, values in parse_qs(scope.get("query_string", b"").decode()).items()}
+        headers = dict(scope.get("headers", []))
+        passcode = headers.get(b"x-staff-passcode", b"").decode() or None
+        status, payload = appointment_listing(args, passcode)
+        if status != 200:
+            await _send_json(send, status, payload)
+            return
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json")] + CORS_HEADERS,
+        })
+        # Each chunk is one page query; run it on the DB pool
+        while True:
+            chunk = await loop.run_in_executor(self.db_pool, next, payload, None)
+            if chunk is None:
+                break
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def reset(self, body):
+        """Handle one /reset request body; returns (status, payload)"""
+        session = session_for(body)
+        session.reset()
+        await asyncio.get_running_loop().run_in_executor(self.db_pool, session_store.save, session)
+        return 200, reset_payload(session)
+
+
+service = AsyncChatService(MAX_CONCURRENT_LLM_CALLS, MAX_QUEUED_CHATS, DB_WORKER_THREADS)
+
+
+async def _read_json(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    raw = b"".join(chunks)
+    try:
+        return json.loads(raw) if raw else {}
+    except ValueError:
+        return {}
+
+
+async def _send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                   + CORS_HEADERS + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                service.db_pool.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"]
+    if method == "OPTIONS":
+        await send({"type": "http.response.start", "status": 204, "headers": CORS_HEADERS})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    if method == "GET" and path == "/appointments":
+        await service.appointments(scope, send)
+        return
+    headers = dict(scope.get("headers", []))
+    trace = headers.get(b"x-agent-trace") == b"1"
+    key = idempotency_key(headers.get(b"idempotency-key", b"").decode())
+    body = await _read_json(receive) if method == "POST" else {}
+    invalid = memory_policy_error(body) if path in ("/chat", "/chat/stream", "/reset") else None
+    if invalid:
+        await _send_json(send, *invalid)
+        return
+    if method == "POST" and path == "/chat/stream":
+        await service.chat_stream(body, send, trace, key)
+        return
+    if method == "GET" and path == "/metrics":
+        body = metrics.render().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; version=0.0.4")] + CORS_HEADERS,
+        })
+        await send({"type": "http.response.body", "body": body})
+        return
+    if method == "POST" and path == "/chat":
+        profile = wants_profile(headers.get(b"x-profile", b"").decode())
+        if key:
+            status, payload, replayed = await service.idempotent_chat(body, key, profile, trace)
+            if replayed:
+                await _send_json(send, status, payload, REPLAYED)
+                return
+        else:
+            status, payload = await service.chat(body, profile, trace)
+        if "profile" in payload:
+            await _send_json(send, status, payload, [(b"server-timing", metrics.server_timing(payload["profile"]).encode())])
+            return
+    elif method == "POST" and path == "/reset":
+        status, payload = await service.reset(body)
+    elif method == "POST" and path == "/appointments/batch":
+        # One write transaction; keep it off the event loop
+        status, payload = await asyncio.get_running_loop().run_in_executor(service.db_pool, batch_booking, body)
+    elif method == "GET" and path.startswith("/reports/"):
+        args = {key: values[0] for key, values in parse_qs(scope.get("query_string", b"").decode()).items()}
+        passcode = headers.get(b"x-staff-passcode", b"").decode() or None
+        report = functools.partial(staff_report, path[len("/reports/"):], args, passcode)
+        status, payload = await asyncio.get_running_loop().run_in_executor(service.db_pool, report)
+    elif method == "GET" and path == "/stats":
+        status, payload = 200, stats_payload()
+    else:
+        status, payload = 404, {"reply": "Not found"}
+    await _send_json(send, status, payload)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    log.info("Starting async appointment booking server on port %d with %d worker(s)...", PORT, WEB_WORKERS)
+    if WEB_WORKERS > 1:
+        # Workers are fresh processes that read these when they import the app
+        os.environ.setdefault("SESSION_STORE", "sqlite")
+        os.environ.setdefault("BOOKING_LOCKS", "file")
+        if os.environ["SESSION_STORE"] == "memory":
+            log.warning("⚠️ SESSION_STORE=memory with several workers: a session only exists on the worker that made it")
+        if os.environ.get("BOOKING_WRITES") == "write-behind":
+            raise SystemExit("BOOKING_WRITES=write-behind keeps pending bookings in one process; run a single worker")
+        uvicorn.run("asgi_server:app", host="0.0.0.0", port=PORT, workers=WEB_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=PORT)
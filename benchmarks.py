@@ -0,0 +1,331 @@
+"""Benchmark suite for the chat and booking pipeline.
+
+    python benchmarks.py                          # every suite
+    python benchmarks.py micro db --rows 10000    # pick suites and table sizes
+    python benchmarks.py http --server asgi --users 100 --concurrency 20
+    python benchmarks.py --compare benchmark_results/<earlier run>.json
+
+Suites:
+
+    micro  slot extraction, extract_appointment_info, date resolution,
+           get_appointment_status and get_current_info, in microseconds per call
+    db     bulk insert, booking, listing queries and income aggregation on a
+           scratch database seeded with 10k, 100k and 1M appointments
+    http   closed-loop load test (see load_test.py) against /chat and /reset
+           of a server started on a scratch database with the offline LLM,
+           or of --url; p50/p95/p99 latency and requests per second
+
+Everything runs on scratch databases in a temporary directory. Results are
+written to benchmark_results/<UTC time>.json (or --output); --compare prints
+each figure's change against an earlier result file.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import load_test
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SUITES = ("micro", "db", "http")
+DEFAULT_ROWS = (10_000, 100_000, 1_000_000)
+STARTUP_TIMEOUT_SECONDS = 60
+
+# Messages for extract_appointment_info; none completes a booking on its own
+EXTRACTION_MESSAGES = [
+    "my name is Jane Doe",
+    "jane.doe@example.com",
+    "I'd like a haircut",
+    "name: Sam Lee, email sam.lee@example.com, service massage",
+    "hello there",
+]
+FAST_PATH_DATES = ["2031-05-12", "12/05/2031", "5/12/2031"]
+PHRASE_DATES = ["tomorrow", "next week", "next month", "friday"]
+
+# Figures compared by --compare, and whether a higher value is better
+METRICS = {
+    "usPerCall": False,
+    "rowsPerSecond": True,
+    "requestsPerSecond": True,
+    "p50Ms": False,
+    "p95Ms": False,
+    "p99Ms": False,
+}
+
+
+def measure(func, inputs, min_seconds=0.2, repeats=5):
+    """Median cost of func(input) in microseconds over several timed runs through inputs"""
+    for value in inputs:
+        func(value)
+    # Size the rounds so one run lasts about min_seconds
+    rounds = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for value in inputs:
+                func(value)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds / 4 or rounds >= 1_000_000:
+            break
+        rounds *= 4
+    rounds = max(1, int(rounds * min_seconds / max(elapsed, 1e-9)))
+
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for value in inputs:
+                func(value)
+        samples.append((time.perf_counter() - started) / (rounds * len(inputs)) * 1e6)
+    return {"usPerCall": round(statistics.median(samples), 3), "calls": rounds * len(inputs) * repeats}
+
+
+def use_scratch_database(path):
+    """Point the app at a fresh, migrated database file"""
+    import database
+    import migrations
+    from idempotency import recent_bookings
+    from tickets import ticket_allocator
+
+    database.set_db_path(path)
+    ticket_allocator.reset()
+    recent_bookings.clear()
+    migrations.migrate(verbose=False)
+
+
+def micro_suite(workdir):
+    """Per-call costs of the hot-path helpers"""
+    import dateparser
+
+    from appointment_create_agent import extract_appointment_info, get_appointment_status, get_current_info, use_session
+    from date_resolution import resolve_date
+    from session_store import Session
+    from slot_extractor import BENCHMARK_MESSAGES, extract_slots
+
+    use_scratch_database(os.path.join(workdir, "micro.db"))
+
+    def extract_with_fresh_session(message):
+        with use_session(Session("benchmark")):
+            return extract_appointment_info(message)
+
+    status_session = Session("benchmark")
+    status_session.appointment_info.update(name="Jane Doe", email="jane.doe@example.com")
+
+    def status(_):
+        with use_session(status_session):
+            return get_appointment_status()
+
+    def current_info(_):
+        with use_session(status_session):
+            return get_current_info("")
+
+    return {
+        "extract_slots": measure(extract_slots, BENCHMARK_MESSAGES),
+        "extract_appointment_info": measure(extract_with_fresh_session, EXTRACTION_MESSAGES),
+        "resolve_date (numeric/ISO)": measure(resolve_date, FAST_PATH_DATES),
+        "resolve_date (phrase, cached)": measure(resolve_date, PHRASE_DATES),
+        "dateparser.parse (uncached)": measure(dateparser.parse, PHRASE_DATES, repeats=3),
+        "get_appointment_status": measure(status, [None]),
+        "get_current_info": measure(current_info, [None]),
+    }
+
+
+def db_suite(workdir, rows, bookings=200):
+    """Insert, booking, query and income aggregation costs on a table of `rows` appointments"""
+    from appointment_create_agent import book_appointment, count_appointments, fetch_appointments_page, income_summary
+    from reports import seed_synthetic, summary_report, trend_report
+
+    use_scratch_database(os.path.join(workdir, f"db-{rows}.db"))
+    results = {}
+
+    started = time.perf_counter()
+    seed_synthetic(rows)
+    seconds = time.perf_counter() - started
+    results["bulk insert"] = {"rowsPerSecond": round(rows / seconds), "seconds": round(seconds, 3)}
+
+    # Dates past the seeded range, 30 bookings each so no day fills up
+    first_day = date.today() + timedelta(days=400)
+    booked = []
+    started = time.perf_counter()
+    for n in range(bookings):
+        booking_date = (first_day + timedelta(days=n // 30)).isoformat()
+        ticket, _ = book_appointment(f"Bench User{n}", f"bench{n}@example.com", "haircut", booking_date)
+        if ticket:
+            booked.append(ticket)
+    seconds = time.perf_counter() - started
+    results["book_appointment"] = {
+        "usPerCall": round(seconds / bookings * 1e6, 3),
+        "calls": bookings,
+        "booked": len(booked),
+    }
+
+    today = date.today()
+    last_year = ((today - timedelta(days=365)).isoformat(), today.isoformat())
+    a_day = (today - timedelta(days=30)).isoformat()
+    queries = {
+        "list by date": lambda _: fetch_appointments_page({"date": a_day}),
+        "list by status and date": lambda _: fetch_appointments_page({"status": "done", "date": a_day}),
+        "list by email": lambda _: fetch_appointments_page({"email": "customer4242@example.com"}),
+        "list all, page after a cursor": lambda _: fetch_appointments_page({}, after=(a_day, 0)),
+        "count by service and date": lambda _: count_appointments({"service": "haircut", "date": a_day}),
+        "income, last year": lambda _: income_summary(date_range=last_year),
+        "income, one service": lambda _: income_summary(service="massage"),
+        "summary report, all time": lambda _: summary_report(),
+        "monthly trend, all time": lambda _: trend_report(granularity="month"),
+    }
+    for label, query in queries.items():
+        results[label] = measure(query, [None], min_seconds=0.1, repeats=3)
+    return results
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, workdir, llm_latency_ms):
+    """Start the Flask or ASGI server on a scratch database with the offline LLM; returns (process, url)"""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        APPOINTMENT_DB_PATH=os.path.join(workdir, f"http-{kind}.db"),
+        LLM_BACKEND="fake",
+        FAKE_LLM_LATENCY_MS=str(llm_latency_ms),
+        LOG_LEVEL="WARNING",
+        PORT=str(port),
+    )
+    if kind == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "asgi_server:app", "--port", str(port), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "server.py"]
+    process = subprocess.Popen(command, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    load_test.wait_for_server(url, process, STARTUP_TIMEOUT_SECONDS)
+    return process, url
+
+
+def http_suite(workdir, server, url, users, concurrency, llm_latency_ms):
+    """Closed-loop load test against /chat and /reset"""
+    if url:
+        return load_test.run(url.rstrip("/"), users, concurrency)
+    process, url = start_server(server, workdir, llm_latency_ms)
+    try:
+        return load_test.run(url, users, concurrency)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def flatten(results, prefix=""):
+    """{"db.10000.bulk insert.rowsPerSecond": value, ...} for every compared figure"""
+    figures = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            figures.update(flatten(value, path + "."))
+        elif key in METRICS and isinstance(value, (int, float)):
+            figures[path] = value
+    return figures
+
+
+def compare(previous, current):
+    """Lines showing how every figure present in both runs changed"""
+    before, after = flatten(previous["results"]), flatten(current["results"])
+    lines = []
+    for path in after:
+        if path not in before or not before[path]:
+            continue
+        change = (after[path] - before[path]) / before[path] * 100
+        better = change > 0 if METRICS[path.rsplit(".", 1)[1]] else change < 0
+        mark = "  " if abs(change) < 5 else ("✅" if better else "❌")
+        lines.append(f"{mark} {path}: {before[path]} -> {after[path]} ({change:+.1f}%)")
+    return lines
+
+
+def _print_results(results):
+    for label, entry in results.items():
+        if "usPerCall" in entry:
+            print(f"  {label}: {entry['usPerCall']:.1f} µs")
+        elif "rowsPerSecond" in entry:
+            print(f"  {label}: {entry['rowsPerSecond']} rows/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("suites", nargs="*", help=f"any of {', '.join(SUITES)} (default: all)")
+    parser.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS), help="table sizes for the db suite")
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask", help="server the http suite starts")
+    parser.add_argument("--url", help="load test a running server instead of starting one")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--llm-latency-ms", type=int, default=300)
+    parser.add_argument("--output", help="result file (default: benchmark_results/<UTC time>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args()
+    suites = args.suites or list(SUITES)
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(sorted(unknown))}")
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    workdir = tempfile.mkdtemp(prefix="benchmarks-")
+    # In-process suites must never touch the real database
+    os.environ["APPOINTMENT_DB_PATH"] = os.path.join(workdir, "default.db")
+
+    started_at = datetime.now(timezone.utc)
+    results = {}
+    if "micro" in suites:
+        print("⏱️ micro", flush=True)
+        results["micro"] = micro_suite(workdir)
+        _print_results(results["micro"])
+    if "db" in suites:
+        results["db"] = {}
+        for rows in args.rows:
+            print(f"⏱️ db, {rows} rows", flush=True)
+            results["db"][str(rows)] = db_suite(workdir, rows)
+            _print_results(results["db"][str(rows)])
+    if "http" in suites:
+        print(f"⏱️ http, {args.url or args.server}", flush=True)
+        summary = http_suite(workdir, args.server, args.url, args.users, args.concurrency, args.llm_latency_ms)
+        results["http"] = {args.url or args.server: summary}
+        for path, entry in summary["endpoints"].items():
+            print(f"  {path}: {entry['requestsPerSecond']} req/s, p50 {entry['p50Ms']} ms, "
+                  f"p95 {entry['p95Ms']} ms, p99 {entry['p99Ms']} ms")
+        if summary["errors"]:
+            print(f"  ❌ {summary['errors']} errors, e.g. {summary['firstErrors'][0]}")
+
+    report = {
+        "startedAt": started_at.isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "rows": args.rows,
+            "server": args.url or args.server,
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "llmLatencyMs": args.llm_latency_ms,
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join("benchmark_results", started_at.strftime("%Y%m%dT%H%M%SZ") + ".json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"✅ Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as handle:
+            previous = json.load(handle)
+        print(f"Compared with {args.compare} ({previous.get('startedAt')}):")
+        for line in compare(previous, report):
+            print(line)
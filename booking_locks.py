@@ -0,0 +1,110 @@
+"""Per-date booking locks, shared by threads or by every worker process on a host.
+
+Check-and-book for a date runs under its lock, so two requests booking the
+same day queue up instead of racing for the last chair:
+
+    BOOKING_LOCKS=thread  threading locks, enough for one process (default)
+    BOOKING_LOCKS=file    fcntl.flock on lock files in BOOKING_LOCK_DIR
+                          (default: "<database file>-locks"), for several
+                          workers sharing one database file. Dates are
+                          hashed onto BOOKING_LOCK_STRIPES files, so the
+                          directory does not grow with the dates booked;
+                          dates sharing a file just queue up together.
+
+The SQLite write lock (BEGIN IMMEDIATE) and Scheduler.verify_in_db remain the
+final guard against double booking; the lock keeps concurrent workers from
+turning that guard into "slot was just taken" failures.
+"""
+import os
+import threading
+import zlib
+from contextlib import ExitStack, contextmanager
+
+import database
+
+BOOKING_LOCKS = os.environ.get("BOOKING_LOCKS", "thread")
+BOOKING_LOCK_DIR = os.environ.get("BOOKING_LOCK_DIR")
+# Lock files FileLocks spreads keys over
+BOOKING_LOCK_STRIPES = int(os.environ.get("BOOKING_LOCK_STRIPES", 64))
+
+
+class ThreadLocks:
+    """One threading lock per key, existing only while some thread holds or waits for it"""
+
+    def __init__(self):
+        # key -> [lock, threads holding or waiting for it]
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def _hold_one(self, key):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    @contextmanager
+    def hold(self, *keys):
+        """Hold the locks for keys; taken in sorted order so overlapping sets cannot deadlock"""
+        with ExitStack() as stack:
+            for key in sorted(set(keys)):
+                stack.enter_context(self._hold_one(key))
+            yield
+
+
+class FileLocks(ThreadLocks):
+    """A fixed set of lock files, each key locking the one its hash picks.
+
+    flock works across processes, and across threads since each opens its
+    own file.
+    """
+
+    def __init__(self, directory=None, stripes=BOOKING_LOCK_STRIPES):
+        super().__init__()
+        self.directory = directory or BOOKING_LOCK_DIR or database.DB_PATH + "-locks"
+        self.stripes = stripes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def stripe(self, key):
+        """Lock file number for key; crc32 rather than hash() so every process agrees"""
+        return zlib.crc32(key.encode("utf-8")) % self.stripes
+
+    def hold(self, *keys):
+        """Hold the lock files of keys; each file once, in file order, so overlapping sets cannot deadlock"""
+        return super().hold(*(self.stripe(key) for key in keys))
+
+    @contextmanager
+    def _hold_one(self, stripe):
+        import fcntl
+
+        path = os.path.join(self.directory, f"stripe-{stripe:03d}.lock")
+        with open(path, "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+LOCK_STORES = {
+    "thread": ThreadLocks,
+    "file": FileLocks,
+}
+
+
+def build_booking_locks(kind=None):
+    """Build the lock store named by kind (BOOKING_LOCKS if not given)"""
+    kind = kind or BOOKING_LOCKS
+    if kind not in LOCK_STORES:
+        raise ValueError(f"Unknown BOOKING_LOCKS {kind!r}; expected one of {', '.join(LOCK_STORES)}")
+    return LOCK_STORES[kind]()
+
+
+booking_locks = build_booking_locks()
@@ -0,0 +1,348 @@
+"""Write-behind booking queue with group commit.
+
+With BOOKING_WRITES=write-behind, book_appointment does not insert and commit
+inside the request. The booking gets its ticket and start time under the
+date's booking lock, is appended to a local journal and joins an in-memory
+pending set. A background writer then inserts the pending bookings in one
+transaction every BOOKING_FLUSH_INTERVAL_MS (or as soon as
+BOOKING_FLUSH_MAX_ROWS are waiting). Pending bookings count toward the
+scheduler's view of their day, so slots are never handed out twice before
+they reach the database.
+
+BOOKING_DURABILITY says what a confirmed ticket survives:
+
+    fsync  the journal entry is on disk before the ticket is returned
+           (concurrent bookings share one fsync), and every group commit is
+           synced: survives a process crash and power loss (default)
+    flush  the journal entry is handed to the OS: survives a process crash,
+           not an OS crash or power loss
+    none   no journal: bookings not yet committed are lost if the process dies
+
+On start the journal is replayed (INSERT OR IGNORE on the unique ticket
+number, so replaying committed bookings is harmless) and cleared whenever
+the queue is empty. The queue lives in one process: the journal is locked
+while it runs, so run write-behind with a single worker.
+
+    python booking_queue.py [bookings] [threads]    # per-row vs group commit benchmark
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import database
+from app_logging import get_logger
+from scheduling import scheduler
+
+BOOKING_WRITES = os.environ.get("BOOKING_WRITES", "sync")
+BOOKING_DURABILITY = os.environ.get("BOOKING_DURABILITY", "fsync")
+BOOKING_FLUSH_INTERVAL_MS = float(os.environ.get("BOOKING_FLUSH_INTERVAL_MS", 50))
+BOOKING_FLUSH_MAX_ROWS = int(os.environ.get("BOOKING_FLUSH_MAX_ROWS", 500))
+BOOKING_JOURNAL_PATH = os.environ.get("BOOKING_JOURNAL_PATH")
+
+DURABILITY_LEVELS = ("fsync", "flush", "none")
+# Seconds to wait before retrying a group commit that failed
+RETRY_SECONDS = 0.5
+
+INSERT_SQL = '''
+    INSERT OR IGNORE INTO appointments (name, email, service, date, ticket_number, status, price, start_time)
+    VALUES (?, ?, ?, ?, ?, 'pending', 0.0, ?)
+'''
+FIELDS = ("name", "email", "service", "date", "ticket", "startTime")
+
+log = get_logger("booking_queue")
+
+
+class WriteBehindQueue:
+    """Bookings confirmed in memory and journaled, inserted by a background writer in group commits"""
+
+    def __init__(self, journal_path=None, durability=BOOKING_DURABILITY,
+                 flush_interval_ms=BOOKING_FLUSH_INTERVAL_MS, max_rows=BOOKING_FLUSH_MAX_ROWS):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown BOOKING_DURABILITY {durability!r}; expected one of {', '.join(DURABILITY_LEVELS)}")
+        self.journal_path = journal_path or BOOKING_JOURNAL_PATH or database.DB_PATH + "-bookings.journal"
+        self.durability = durability
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_rows = max_rows
+        self._lock = threading.Condition()
+        self._sync_lock = threading.Lock()
+        self._journal = None
+        self._thread = None
+        self._stopping = False
+        # Bookings waiting for the writer, and every booking not yet committed
+        # (by ticket, date and (email, service, date))
+        self._queue = deque()
+        self._pending = {}
+        self._by_date = {}
+        self._by_key = {}
+        # Journal lines written and known to be on disk
+        self._appended = 0
+        self._synced = 0
+        self.committed_rows = 0
+        self.commits = 0
+        self._atexit_registered = False
+
+    def start(self):
+        """Replay the journal and start the writer; does nothing if it is already running"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self.durability != "none":
+                self._open_journal()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="booking-writer", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                # Commit what is pending on a clean shutdown
+                atexit.register(self.stop)
+                self._atexit_registered = True
+        scheduler.pending_source = self.pending_for
+
+    def _open_journal(self):
+        import fcntl
+
+        self._journal = open(self.journal_path, "a+b")
+        try:
+            fcntl.flock(self._journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._journal.close()
+            self._journal = None
+            raise RuntimeError(f"Booking journal {self.journal_path} is in use by another process; "
+                               "write-behind needs a single worker")
+        self._journal.seek(0)
+        rows = []
+        for line in self._journal:
+            try:
+                entry = json.loads(line)
+                rows.append(tuple(entry[field] for field in FIELDS))
+            except (ValueError, KeyError):
+                # A line torn by a crash; its booking was never confirmed
+                continue
+        if rows:
+            with database.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                inserted = conn.executemany(INSERT_SQL, rows).rowcount
+            for date in {row[3] for row in rows}:
+                scheduler.forget(date)
+            log.info("✅ Replayed booking journal: %d of %d bookings were missing", inserted, len(rows))
+        self._truncate_journal()
+
+    def submit(self, name, email, service, date, ticket_number, start_time):
+        """Queue a booking whose ticket and slot were just assigned; returns once it is as durable as configured.
+
+        Raises RuntimeError if the queue is not running (not started yet, or stopped).
+        """
+        row = (name, email, service, date, ticket_number, start_time)
+        line = 0
+        with self._lock:
+            if self._thread is None or self._stopping:
+                raise RuntimeError("Booking queue is not running")
+            if self._journal is not None:
+                entry = dict(zip(FIELDS, row))
+                self._journal.write((json.dumps(entry) + "\n").encode("utf-8"))
+                self._journal.flush()
+                self._appended += 1
+                line = self._appended
+            self._queue.append(row)
+            self._pending[ticket_number] = row
+            self._by_date.setdefault(date, {})[ticket_number] = (service, start_time)
+            self._by_key[(email.lower(), service, date)] = (ticket_number, start_time)
+            self._lock.notify_all()
+        if self.durability == "fsync":
+            self._sync_journal(line)
+
+    def _sync_journal(self, line):
+        # Group fsync: whoever syncs covers every line written so far, so
+        # bookings waiting here meanwhile return without another fsync
+        with self._sync_lock:
+            if self._synced >= line:
+                return
+            with self._lock:
+                target = self._appended
+                journal = self._journal
+            if journal is not None:
+                os.fsync(journal.fileno())
+            self._synced = target
+
+    def pending_for(self, date):
+        """(service, start_time) of the bookings on date that are not committed yet"""
+        with self._lock:
+            return list(self._by_date.get(date, {}).values())
+
+    def pending_booking(self, email, service, date):
+        """(ticket_number, start_time) of an uncommitted booking for these details, or None"""
+        with self._lock:
+            return self._by_key.get((email.lower(), service, date))
+
+    def flush(self, timeout=None):
+        """Wait until every submitted booking is committed; False if timeout ran out first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._lock.notify_all()
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+        return True
+
+    def stop(self, timeout=30):
+        """Commit what is pending, stop the writer and release the journal"""
+        self.flush(timeout)
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._lock.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        if scheduler.pending_source == self.pending_for:
+            scheduler.pending_source = None
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "committedRows": self.committed_rows,
+                "commits": self.commits,
+                "rowsPerCommit": round(self.committed_rows / self.commits, 1) if self.commits else 0.0,
+            }
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._stopping:
+                    self._lock.wait()
+                if not self._queue:
+                    return
+                # Give concurrent bookings a moment to join this commit
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._queue) < self.max_rows and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._lock.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(self.max_rows, len(self._queue)))]
+            while not self._commit(batch):
+                time.sleep(RETRY_SECONDS)
+
+    def _commit(self, batch):
+        try:
+            with database.connection() as conn:
+                if self.durability == "fsync":
+                    conn.execute("PRAGMA synchronous=FULL")
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    inserted = conn.executemany(INSERT_SQL, batch).rowcount
+                    conn.commit()
+                finally:
+                    if self.durability == "fsync":
+                        conn.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error as e:
+            log.error("❌ Group commit of %d bookings failed, retrying: %s", len(batch), e)
+            return False
+        if inserted != len(batch):
+            log.warning("⚠️ %d of %d queued bookings were already in the database", len(batch) - inserted, len(batch))
+
+        # Under the scheduler's lock, so no day is loaded while a committed
+        # booking is both in the database and still pending (it would count twice)
+        with scheduler.lock, self._lock:
+            for name, email, service, date, ticket_number, start_time in batch:
+                self._pending.pop(ticket_number, None)
+                day = self._by_date.get(date)
+                if day is not None:
+                    day.pop(ticket_number, None)
+                    if not day:
+                        del self._by_date[date]
+                key = (email.lower(), service, date)
+                if self._by_key.get(key, (None,))[0] == ticket_number:
+                    del self._by_key[key]
+                scheduler.forget(date)
+            self.committed_rows += len(batch)
+            self.commits += 1
+            if not self._pending:
+                self._truncate_journal()
+            self._lock.notify_all()
+        return True
+
+    def _truncate_journal(self):
+        # Callers hold self._lock or have not started the writer yet
+        if self._journal is not None:
+            self._journal.flush()
+            os.ftruncate(self._journal.fileno(), 0)
+            if self.durability == "fsync":
+                os.fsync(self._journal.fileno())
+
+
+def build_booking_queue(writes=None):
+    """The write-behind queue if BOOKING_WRITES (or writes) is "write-behind", None for synchronous writes"""
+    writes = writes or BOOKING_WRITES
+    if writes == "sync":
+        return None
+    if writes != "write-behind":
+        raise ValueError(f"Unknown BOOKING_WRITES {writes!r}; expected sync or write-behind")
+    return WriteBehindQueue()
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    import migrations
+
+    bookings = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    workdir = tempfile.mkdtemp(prefix="booking-queue-")
+
+    def rows(run):
+        return [(f"Customer {n}", f"customer{n}@example.com", "haircut", f"2031-{1 + n % 12:02d}-{1 + n % 28:02d}",
+                 f"BENCH-{run}-{n}", "09:00") for n in range(bookings)]
+
+    def per_row(run, synchronous):
+        database.set_db_path(os.path.join(workdir, f"{run}.db"))
+        migrations.migrate(verbose=False)
+
+        def insert(row):
+            with database.connection() as conn:
+                conn.execute(f"PRAGMA synchronous={synchronous}")
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute(INSERT_SQL, row)
+                    conn.commit()
+                finally:
+                    conn.execute("PRAGMA synchronous=NORMAL")
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(insert, rows(run)))
+
+    def write_behind(run, durability):
+        database.set_db_path(os.path.join(workdir, f"{run}.db"))
+        migrations.migrate(verbose=False)
+        writer = WriteBehindQueue(os.path.join(workdir, f"{run}.journal"), durability)
+        writer.start()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda row: writer.submit(*row), rows(run)))
+        writer.stop()
+        return writer.stats()
+
+    cases = [
+        ("per-row commit, synchronous=NORMAL", lambda: per_row("normal", "NORMAL")),
+        ("per-row commit, synchronous=FULL", lambda: per_row("full", "FULL")),
+        ("write-behind, durability=none", lambda: write_behind("none", "none")),
+        ("write-behind, durability=flush", lambda: write_behind("flush", "flush")),
+        ("write-behind, durability=fsync", lambda: write_behind("fsync", "fsync")),
+    ]
+    print(f"{bookings} bookings from {threads} threads")
+    for label, case in cases:
+        started = time.perf_counter()
+        stats = case()
+        seconds = time.perf_counter() - started
+        detail = f", {stats['commits']} commits of {stats['rowsPerCommit']} rows" if stats else ""
+        print(f"  {label}: {bookings / seconds:,.0f} bookings/s{detail}")
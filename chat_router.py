@@ -0,0 +1,262 @@
+import asyncio
+import contextvars
+import re
+import threading
+import time
+
+from appointment_create_agent import (
+    NEXT_PAGE_PATTERN,
+    STAFF_PASSCODE,
+    achat_with_agent,
+    astream_agent_events,
+    cancel_appointment,
+    chat_with_agent,
+    exit_staff_mode,
+    extract_appointment_info,
+    get_current_info,
+    query_appointments,
+    query_income,
+    use_session,
+    verify_staff_passcode,
+)
+from metrics import record_request, span
+from slot_extractor import EMAIL_PATTERN
+
+# A ReAct turn that uses one tool costs two LLM calls: one to pick the tool
+# and one to write the final answer. Used until real agent turns are observed.
+DEFAULT_LLM_CALLS_PER_TURN = 2.0
+
+DATE_PATTERN = re.compile(r"\b(?:\d{4}-\d{2}-\d{2}|\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\b")
+SLOT_CUE_PATTERN = re.compile(r"\b(?:my name is|name is|name\s*[:-]|service is|service\s*[:-]|date is|date\s*[:-])", re.IGNORECASE)
+STATUS_PATTERN = re.compile(
+    r"^\s*(?:status|my status|what(?:'s| is) my status|what do you (?:still )?need|what(?:'s| is) missing"
+    r"|what (?:info|information|details) do you have|show my (?:info|information|details))\s*[?.!]*\s*$",
+    re.IGNORECASE
+)
+# Anything that reads like a question or a request the slot extractor cannot
+# answer goes to the agent.
+FREE_FORM_PATTERN = re.compile(r"\?|\b(?:cancel|change|reschedule|why|how|help|price|cost|hours|open)\b", re.IGNORECASE)
+PASSCODE_PATTERN = re.compile(r"^\s*(?:staff\s+)?(?:passcode\s*(?:is|:)?\s*)?([A-Za-z0-9]{4,})\s*$", re.IGNORECASE)
+EXIT_STAFF_PATTERN = re.compile(r"\bexit\b.*\bstaff\b", re.IGNORECASE)
+CANCEL_TICKET_PATTERN = re.compile(r"\bcancel\b.*(?:ticket|number|#)\s*APPT-\d+", re.IGNORECASE)
+INCOME_PATTERN = re.compile(r"\b(?:income|revenue|earnings?)\b", re.IGNORECASE)
+LIST_APPOINTMENTS_PATTERN = re.compile(r"\b(?:show|list|find|get)\b.*\bappointments?\b", re.IGNORECASE)
+
+
+_counter_class = None
+
+
+def new_llm_call_counter():
+    """Return a callback handler that counts the LLM round trips made during one agent turn.
+
+    The class is defined on first use so importing the router does not pull in LangChain.
+    """
+    global _counter_class
+    if _counter_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class LLMCallCounter(BaseCallbackHandler):
+            def __init__(self):
+                self.calls = 0
+                # Time spent inside LLM calls only, so a cold agent build or a
+                # wait for an LLM slot does not count as LLM latency
+                self.llm_seconds = 0.0
+                self._started = {}
+
+            def on_llm_start(self, serialized, prompts, **kwargs):
+                self._start(kwargs.get("run_id"))
+
+            def on_chat_model_start(self, serialized, messages, **kwargs):
+                self._start(kwargs.get("run_id"))
+
+            def on_llm_end(self, response, **kwargs):
+                self._finish(kwargs.get("run_id"))
+
+            def on_llm_error(self, error, **kwargs):
+                self._finish(kwargs.get("run_id"))
+
+            def _start(self, run_id):
+                self.calls += 1
+                self._started[run_id] = time.perf_counter()
+
+            def _finish(self, run_id):
+                started = self._started.pop(run_id, None)
+                if started is not None:
+                    self.llm_seconds += time.perf_counter() - started
+
+        _counter_class = LLMCallCounter
+    return _counter_class()
+
+
+class ChatRouter:
+    """Answers turns the Python tools can handle alone and sends the rest to the agent"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.llm_calls_per_turn = DEFAULT_LLM_CALLS_PER_TURN
+        # Average time inside one LLM call; None until an agent turn has been
+        # timed, and no time savings are reported before then
+        self.llm_call_ms = None
+        self.fast_turns = 0
+        self.agent_turns = 0
+        self.llm_calls_saved = 0.0
+        # Time spent answering fast-path turns, netted out of the savings
+        self.fast_ms = 0.0
+
+    def pick_tool(self, session, text):
+        """Return the tool that answers this turn on its own, or None if the agent is needed"""
+        with span("router", "route"):
+            return self._pick_tool(session, text)
+
+    def _pick_tool(self, session, text):
+        if session.is_staff_mode:
+            if EXIT_STAFF_PATTERN.search(text):
+                return exit_staff_mode
+            if CANCEL_TICKET_PATTERN.search(text):
+                return cancel_appointment
+            if INCOME_PATTERN.search(text):
+                return query_income
+            if LIST_APPOINTMENTS_PATTERN.search(text) or (session.listing and NEXT_PAGE_PATTERN.match(text)):
+                return query_appointments
+            return None
+
+        passcode_match = PASSCODE_PATTERN.match(text)
+        if passcode_match and (passcode_match.group(1) == STAFF_PASSCODE or "passcode" in text.lower()):
+            return verify_staff_passcode
+        if STATUS_PATTERN.match(text):
+            return get_current_info
+        if FREE_FORM_PATTERN.search(text):
+            return None
+        if EMAIL_PATTERN.search(text) or DATE_PATTERN.search(text) or SLOT_CUE_PATTERN.search(text):
+            return extract_appointment_info
+        return None
+
+    def handle(self, session, text):
+        """Answer one chat turn and return (reply, routing stats for this request)"""
+        started = time.perf_counter()
+        tool = self.pick_tool(session, text)
+
+        if tool is not None:
+            reply = self._run_tool(session, tool, text)
+            return reply, self._record_fast(tool, started)
+
+        counter = new_llm_call_counter()
+        reply = chat_with_agent(session, text, callbacks=[counter])
+        return reply, self._record_agent(counter, started)
+
+    async def ahandle(self, session, text, executor=None, llm_slots=None):
+        """Async variant of handle: tools run on executor, agent turns wait for a free llm_slots permit"""
+        started = time.perf_counter()
+        tool = self.pick_tool(session, text)
+
+        if tool is not None:
+            loop = asyncio.get_running_loop()
+            # run_in_executor does not carry contextvars over; copy them so
+            # spans reach a profile the request is collecting
+            reply = await loop.run_in_executor(
+                executor, contextvars.copy_context().run, self._run_tool, session, tool, text
+            )
+            return reply, self._record_fast(tool, started)
+
+        counter = new_llm_call_counter()
+        if llm_slots is None:
+            reply = await achat_with_agent(session, text, callbacks=[counter])
+        else:
+            async with llm_slots:
+                reply = await achat_with_agent(session, text, callbacks=[counter])
+        return reply, self._record_agent(counter, started)
+
+    async def astream(self, session, text, executor=None, llm_slots=None):
+        """Streaming variant of ahandle yielding (event, data) pairs: tool outputs, answer tokens, then "done"."""
+        started = time.perf_counter()
+        tool = self.pick_tool(session, text)
+
+        if tool is not None:
+            loop = asyncio.get_running_loop()
+            reply = await loop.run_in_executor(
+                executor, contextvars.copy_context().run, self._run_tool, session, tool, text
+            )
+            yield "tool", {"tool": tool.__name__, "output": reply}
+            yield "done", {"reply": reply, "routing": self._record_fast(tool, started)}
+            return
+
+        counter = new_llm_call_counter()
+        if llm_slots is not None:
+            await llm_slots.acquire()
+        try:
+            async for event, data in astream_agent_events(session, text, callbacks=[counter]):
+                if event == "final":
+                    reply = data["output"]
+                else:
+                    yield event, data
+        finally:
+            if llm_slots is not None:
+                llm_slots.release()
+        yield "done", {"reply": reply, "routing": self._record_agent(counter, started)}
+
+    def _run_tool(self, session, tool, text):
+        with use_session(session):
+            reply = tool(text)
+        session.add_turn(text, reply)
+        return reply
+
+    def _record_fast(self, tool, started):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        record_request("fast", elapsed_ms / 1000, 0)
+        with self._lock:
+            calls_saved = self.llm_calls_per_turn
+            ms_saved = self._ms_saved(calls_saved, elapsed_ms)
+            self.fast_turns += 1
+            self.llm_calls_saved += calls_saved
+            self.fast_ms += elapsed_ms
+        return {
+            "route": "fast",
+            "tool": tool.__name__,
+            "llmCalls": 0,
+            "llmCallsSaved": round(calls_saved, 2),
+            "msSaved": ms_saved,
+            "elapsedMs": round(elapsed_ms, 1)
+        }
+
+    def _record_agent(self, counter, started):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        record_request("agent", elapsed_ms / 1000, counter.calls)
+        with self._lock:
+            self.agent_turns += 1
+            if counter.calls:
+                # Moving averages of what an agent turn really costs, used to
+                # estimate the savings of fast-path turns.
+                self.llm_calls_per_turn = 0.9 * self.llm_calls_per_turn + 0.1 * counter.calls
+                call_ms = counter.llm_seconds * 1000 / counter.calls
+                if self.llm_call_ms is None:
+                    self.llm_call_ms = call_ms
+                else:
+                    self.llm_call_ms = 0.9 * self.llm_call_ms + 0.1 * call_ms
+        return {
+            "route": "agent",
+            "tool": None,
+            "llmCalls": counter.calls,
+            "llmCallsSaved": 0,
+            "msSaved": 0.0,
+            "elapsedMs": round(elapsed_ms, 1)
+        }
+
+    def stats(self):
+        """Cumulative routing counters since startup"""
+        with self._lock:
+            return {
+                "fastTurns": self.fast_turns,
+                "agentTurns": self.agent_turns,
+                "llmCallsSaved": round(self.llm_calls_saved, 2),
+                "msSaved": self._ms_saved(self.llm_calls_saved, self.fast_ms)
+            }
+
+    def _ms_saved(self, llm_calls, elapsed_ms):
+        # LLM time the skipped calls would have taken, less the time the fast
+        # path spent instead; None while no agent turn has been timed
+        if self.llm_call_ms is None:
+            return None
+        return round(max(llm_calls * self.llm_call_ms - elapsed_ms, 0.0), 1)
+
+
+router = ChatRouter()
@@ -0,0 +1,14 @@
+"""Test settings, applied before any test module imports the app.
+
+Tests run against scratch databases in a temporary directory and the
+offline fake LLM, so they never touch appointmentdb.db or the network.
+"""
+import os
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="appointment-tests-")
+os.environ["APPOINTMENT_DB_PATH"] = os.path.join(_scratch, "appointments.db")
+os.environ["SESSION_DB_PATH"] = os.path.join(_scratch, "sessions.db")
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["AGENT_WARMUP"] = "lazy"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
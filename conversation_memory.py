@@ -0,0 +1,131 @@
+"""Memory policies that bound how much chat history a session keeps.
+
+After every turn the session's policy compacts its history, so both the
+prompt sent to the LLM and the memory held per session stay bounded:
+
+    window   keep the last MEMORY_WINDOW_TURNS turns
+    tokens   keep the most recent turns that fit in MEMORY_TOKEN_BUDGET tokens
+    summary  keep the last MEMORY_SUMMARY_TURNS turns and fold older ones into
+             a short rolling summary (at most MEMORY_SUMMARY_CHARS characters)
+
+The slots themselves (name, email, service, date) live on the session and are
+never dropped, so older turns are only needed for conversational context.
+"""
+import os
+import re
+
+MEMORY_POLICY = os.environ.get("MEMORY_POLICY", "window")
+MEMORY_WINDOW_TURNS = int(os.environ.get("MEMORY_WINDOW_TURNS", 10))
+MEMORY_TOKEN_BUDGET = int(os.environ.get("MEMORY_TOKEN_BUDGET", 1500))
+MEMORY_SUMMARY_TURNS = int(os.environ.get("MEMORY_SUMMARY_TURNS", 4))
+MEMORY_SUMMARY_CHARS = int(os.environ.get("MEMORY_SUMMARY_CHARS", 600))
+
+# Rough English average; good enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+# Longest excerpt of one message kept in a summary line
+SUMMARY_EXCERPT_CHARS = 80
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s|\n")
+
+
+def estimate_tokens(text):
+    """Approximate token count of text"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _excerpt(text):
+    first = SENTENCE_END.split(text.strip(), 1)[0]
+    if len(first) > SUMMARY_EXCERPT_CHARS:
+        first = first[:SUMMARY_EXCERPT_CHARS - 3].rstrip() + "..."
+    return first
+
+
+class WindowMemory:
+    """Keep the last `turns` user/bot exchanges"""
+
+    name = "window"
+
+    def __init__(self, turns=MEMORY_WINDOW_TURNS):
+        self.turns = turns
+
+    def compact(self, history, summary):
+        return history[-2 * self.turns:] if self.turns else [], summary
+
+
+class TokenBudgetMemory:
+    """Keep the most recent exchanges whose combined size fits in max_tokens"""
+
+    name = "tokens"
+
+    def __init__(self, max_tokens=MEMORY_TOKEN_BUDGET):
+        self.max_tokens = max_tokens
+
+    def compact(self, history, summary):
+        used = 0
+        keep_from = len(history)
+        # Walk back one exchange (user + bot message) at a time
+        for start in range(len(history) - 2, -1, -2):
+            used += sum(estimate_tokens(text) for _, text in history[start:start + 2])
+            if used > self.max_tokens:
+                break
+            keep_from = start
+        return history[keep_from:], summary
+
+
+class SummaryMemory:
+    """Keep the last `turns` exchanges and a rolling extractive summary of the rest.
+
+    Each folded exchange becomes one line with the first sentence of each
+    side, so summarizing costs no LLM call; the oldest lines are dropped once
+    the summary exceeds max_chars.
+    """
+
+    name = "summary"
+
+    def __init__(self, turns=MEMORY_SUMMARY_TURNS, max_chars=MEMORY_SUMMARY_CHARS):
+        self.turns = turns
+        self.max_chars = max_chars
+
+    def compact(self, history, summary):
+        overflow = len(history) - 2 * self.turns
+        if overflow <= 0:
+            return history, summary
+
+        lines = summary.split("\n") if summary else []
+        for start in range(0, overflow - overflow % 2, 2):
+            (_, user_text), (_, bot_text) = history[start], history[start + 1]
+            lines.append(f"User: {_excerpt(user_text)} / Assistant: {_excerpt(bot_text)}")
+        while lines and sum(len(line) + 1 for line in lines) > self.max_chars:
+            lines.pop(0)
+        return history[overflow - overflow % 2:], "\n".join(lines)
+
+
+POLICIES = {
+    "window": WindowMemory,
+    "tokens": TokenBudgetMemory,
+    "summary": SummaryMemory,
+}
+
+
+def build_memory_policy(name=None):
+    """Build the named policy (MEMORY_POLICY if not given) with its configured limits"""
+    name = name or MEMORY_POLICY
+    if name not in POLICIES:
+        raise ValueError(f"Unknown MEMORY_POLICY {name!r}; expected one of {', '.join(POLICIES)}")
+    return POLICIES[name]()
+
+
+# Policies keep no per-session state, so sessions share one instance per name
+_shared_policies = {}
+
+
+def get_memory_policy(name=None):
+    """The shared instance of the named policy (MEMORY_POLICY if not given)"""
+    name = name or MEMORY_POLICY
+    policy = _shared_policies.get(name)
+    if policy is None:
+        policy = _shared_policies[name] = build_memory_policy(name)
+    return policy
+
+
+default_memory_policy = get_memory_policy()
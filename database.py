@@ -0,0 +1,117 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from metrics import span, statement_label
+
+DB_PATH = os.environ.get("APPOINTMENT_DB_PATH", "appointmentdb.db")
+
+APPOINTMENTS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS appointments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        service TEXT NOT NULL,
+        date TEXT NOT NULL,
+        ticket_number TEXT NOT NULL,
+        status TEXT DEFAULT 'pending',
+        price REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# Idle connections kept open for reuse
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 16))
+
+# sqlite3 keeps an LRU cache of prepared statements per connection; the tools
+# reuse the same SQL text, so long-lived connections skip re-preparing it.
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Most recently returned connection is handed out first, so a small hot set
+# stays warm.
+_idle = queue.LifoQueue()
+_lock = threading.Lock()
+# Bumped whenever the pool is closed so connections checked out before that
+# are closed instead of returned
+_generation = 0
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection that records each statement and commit as a "db" span (see metrics.py)"""
+
+    def execute(self, sql, parameters=(), /):
+        with span("db", statement_label(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, parameters, /):
+        with span("db", statement_label(sql)):
+            return super().executemany(sql, parameters)
+
+    def commit(self):
+        with span("db", "commit"):
+            super().commit()
+
+
+def _open():
+    conn = sqlite3.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False,
+                           factory=TimedConnection)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection; commits on success and rolls back on error"""
+    with _lock:
+        generation = _generation
+    try:
+        conn = _idle.get_nowait()
+    except queue.Empty:
+        conn = _open()
+
+    try:
+        yield conn
+        if conn.in_transaction:
+            conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        with _lock:
+            keep = generation == _generation and _idle.qsize() < POOL_SIZE
+        if keep:
+            _idle.put(conn)
+        else:
+            conn.close()
+
+
+def close_connections():
+    """Close idle connections and retire checked-out ones, e.g. before moving the database file"""
+    global _generation
+    with _lock:
+        _generation += 1
+    while True:
+        try:
+            _idle.get_nowait().close()
+        except queue.Empty:
+            break
+
+
+def set_db_path(path):
+    """Point the pool at another database file"""
+    global DB_PATH
+    DB_PATH = path
+    close_connections()
@@ -0,0 +1,113 @@
+"""Date resolution for chat and staff queries, memoized in front of dateparser.
+
+ISO and numeric dates are handled without dateparser. Everything else goes
+through one DateDataParser pinned to English (no language detection), and
+the result is cached per (normalized text, today). The cache is cleared when
+the day changes so "tomorrow" never resolves against yesterday.
+"""
+import os
+import re
+from datetime import date
+from functools import lru_cache
+
+DATE_CACHE_SIZE = int(os.environ.get("DATE_CACHE_SIZE", 4096))
+DATE_LANGUAGES = ["en"]
+
+ISO_DATE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+# Four-digit years only; two-digit years are left to dateparser's century rules
+NUMERIC_DATE = re.compile(r"(\d{1,2})[/-](\d{1,2})[/-](\d{4})")
+WHITESPACE = re.compile(r"\s+")
+
+_parser = None
+_cache_day = None
+
+
+def _date_parser():
+    global _parser
+    if _parser is None:
+        from dateparser.date import DateDataParser
+
+        _parser = DateDataParser(languages=DATE_LANGUAGES)
+    return _parser
+
+
+def _fast_path(text):
+    # Mirrors dateparser for these formats: month first, day first when the
+    # first number cannot be a month
+    iso_match = ISO_DATE.fullmatch(text)
+    if iso_match:
+        year, month, day = (int(part) for part in iso_match.groups())
+        orders = [(month, day)]
+    else:
+        numeric_match = NUMERIC_DATE.fullmatch(text)
+        if not numeric_match:
+            return None
+        first, second, year = (int(part) for part in numeric_match.groups())
+        orders = [(first, second), (second, first)]
+
+    for month, day in orders:
+        try:
+            return date(year, month, day).isoformat()
+        except ValueError:
+            continue
+    # Not a real calendar date (e.g. 31/02/2031)
+    return ""
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _resolve(normalized, today):
+    # today is only part of the key: relative phrases resolve differently per day
+    date_obj = _date_parser().get_date_data(normalized).date_obj
+    return date_obj.strftime("%Y-%m-%d") if date_obj else None
+
+
+def resolve_date(text):
+    """Resolve free text such as "tomorrow" or "12/05/2031" to YYYY-MM-DD, or None"""
+    global _cache_day
+    if not text:
+        return None
+    normalized = WHITESPACE.sub(" ", text.strip().lower())
+
+    fast = _fast_path(normalized)
+    if fast is not None:
+        return fast or None
+
+    today = date.today().isoformat()
+    if today != _cache_day:
+        # Midnight passed: every cached relative date is stale
+        _resolve.cache_clear()
+        _cache_day = today
+    return _resolve(normalized, today)
+
+
+def cache_info():
+    """lru_cache statistics for the dateparser-backed path"""
+    return _resolve.cache_info()
+
+
+BENCHMARK_INPUTS = ["tomorrow", "next week", "12/05/2031", "2031-05-12", "next month", "a haircut", "friday"]
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: cold dateparser calls vs memoized resolution
+    import time
+
+    import dateparser
+
+    rounds = 200
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in BENCHMARK_INPUTS:
+            dateparser.parse(text)
+    uncached = (time.perf_counter() - started) / (rounds * len(BENCHMARK_INPUTS)) * 1e6
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in BENCHMARK_INPUTS:
+            resolve_date(text)
+    cached = (time.perf_counter() - started) / (rounds * len(BENCHMARK_INPUTS)) * 1e6
+
+    print(f"dateparser.parse: {uncached:.1f} µs per call")
+    print(f"resolve_date:     {cached:.1f} µs per call ({cache_info()})")
+    for text in BENCHMARK_INPUTS:
+        print(f"  {text!r} -> {resolve_date(text)}")
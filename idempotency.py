@@ -0,0 +1,151 @@
+"""De-duplication of retried chat requests and repeated bookings.
+
+Browsers retry requests and users press Enter twice, so one chat turn can
+arrive more than once:
+
+- `chat_replies` keeps the reply to each (session, Idempotency-Key) pair. A
+  retry gets the stored reply without running the turn again; a retry that
+  arrives while the first request is still running waits for its reply.
+- `recent_bookings` maps (email, service, date) to the ticket booked for it,
+  so book_appointment can answer a repeated booking with one index lookup
+  instead of queueing for the date's booking lock. An entry is only a hint:
+  a cancellation in another worker leaves it behind, so the booking is
+  confirmed on idx_appointments_active_booking before it is returned. The
+  lookup under the write lock stays the guard across workers and restarts.
+
+Both are bounded LRU maps with a TTL, local to the process.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 600))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get("IDEMPOTENCY_MAX_KEYS", 10000))
+# Seconds a retry waits for the first request with its key to finish
+IDEMPOTENCY_WAIT_SECONDS = int(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", 120))
+RECENT_BOOKINGS_SIZE = int(os.environ.get("RECENT_BOOKINGS_SIZE", 10000))
+# Entries are confirmed against the database before use; the TTL only bounds memory
+RECENT_BOOKINGS_TTL_SECONDS = int(os.environ.get("RECENT_BOOKINGS_TTL_SECONDS", 600))
+
+
+class ExpiringLRU:
+    """Thread-safe LRU map whose entries expire ttl_seconds after they were stored"""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (value, stored_at)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the live value for key, or None"""
+        now = time.monotonic()
+        with self._lock:
+            return self._get(key, now)
+
+    def put(self, key, value):
+        with self._lock:
+            self._put(key, value, time.monotonic())
+
+    def setdefault(self, key, value):
+        """Return the live value for key, storing value first if there is none"""
+        now = time.monotonic()
+        with self._lock:
+            existing = self._get(key, now)
+            if existing is not None:
+                return existing
+            self._put(key, value, now)
+            return value
+
+    def pop(self, key, value=None):
+        """Drop key; if value is given, only while key still maps to it"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (value is None or entry[0] is value):
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry[1] > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _put(self, key, value, now):
+        self._entries[key] = (value, now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class ReplyCache:
+    """Replies to chat requests by (session id, Idempotency-Key)"""
+
+    def __init__(self, max_entries=IDEMPOTENCY_MAX_KEYS, ttl_seconds=IDEMPOTENCY_TTL_SECONDS):
+        self._replies = ExpiringLRU(max_entries, ttl_seconds)
+
+    def claim(self, session_id, key):
+        """Return (future, owner) for a request carrying key.
+
+        The first request gets owner=True and must call finish(); every
+        repeat gets owner=False and the first request's future, which
+        resolves to its (status, payload).
+        """
+        future = Future()
+        stored = self._replies.setdefault((session_id, key), future)
+        return stored, stored is future
+
+    def finish(self, session_id, key, future, status, payload):
+        """Hand the owner's reply to waiting repeats; only successful replies are kept for later ones.
+
+        Only the first call for a future counts, so a cleanup path can call it unconditionally.
+        """
+        if future.done():
+            return
+        if status != 200:
+            # Let a retry run the turn again
+            self._replies.pop((session_id, key), future)
+        future.set_result((status, payload))
+
+
+class RecentBookings:
+    """Ticket and start time of recent bookings by (email, service, date)"""
+
+    def __init__(self, max_entries=RECENT_BOOKINGS_SIZE, ttl_seconds=RECENT_BOOKINGS_TTL_SECONDS):
+        self._bookings = ExpiringLRU(max_entries, ttl_seconds)
+
+    @staticmethod
+    def _key(email, service, date):
+        return email.lower(), service, date
+
+    def get(self, email, service, date):
+        """Return (ticket_number, start_time) of a recent booking, or None"""
+        return self._bookings.get(self._key(email, service, date))
+
+    def remember(self, email, service, date, ticket_number, start_time):
+        self._bookings.put(self._key(email, service, date), (ticket_number, start_time))
+
+    def forget(self, email, service, date):
+        """Drop a booking, e.g. after it was cancelled"""
+        self._bookings.pop(self._key(email, service, date))
+
+    def clear(self):
+        """Forget every booking, e.g. after switching databases"""
+        self._bookings.clear()
+
+
+chat_replies = ReplyCache()
+recent_bookings = RecentBookings()
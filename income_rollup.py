@@ -0,0 +1,56 @@
+"""Consistency check for the income_daily rollup.
+
+income_daily is maintained by triggers on appointments (see migration 9).
+This compares it with a fresh aggregate of the raw table and can rebuild it:
+
+    python income_rollup.py            # report mismatches, exit 1 if any
+    python income_rollup.py --repair   # rebuild the rollup from the raw table
+"""
+import sys
+
+import database
+import migrations
+
+# Income sums are floating point; differences below this are rounding
+INCOME_TOLERANCE = 0.005
+
+
+def check_income_rollup(conn=None):
+    """Return a list of (date, service, status, expected (count, income), actual (count, income)) mismatches"""
+    if conn is None:
+        with database.connection() as conn:
+            return check_income_rollup(conn)
+
+    expected = {row[:3]: row[3:] for row in conn.execute(migrations.INCOME_ROLLUP_SQL)}
+    actual = {row[:3]: row[3:] for row in conn.execute(
+        "SELECT date, service, status, appointments, income FROM income_daily WHERE appointments != 0"
+    )}
+
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys()):
+        want, have = expected.get(key, (0, 0.0)), actual.get(key, (0, 0.0))
+        if want[0] != have[0] or abs(want[1] - have[1]) > INCOME_TOLERANCE:
+            mismatches.append(key + (want, have))
+    return mismatches
+
+
+def rebuild_income_rollup():
+    """Recompute income_daily from the appointments table in one transaction"""
+    with database.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM income_daily")
+        conn.execute("INSERT INTO income_daily " + migrations.INCOME_ROLLUP_SQL)
+
+
+if __name__ == "__main__":
+    migrations.migrate()
+    if "--repair" in sys.argv:
+        rebuild_income_rollup()
+        print("✅ Income rollup rebuilt")
+    mismatches = check_income_rollup()
+    for date, service, status, want, have in mismatches:
+        print(f"❌ {date} {service} {status or '(no status)'}: "
+              f"appointments {have[0]} vs {want[0]}, income {have[1]:.2f} vs {want[1]:.2f}")
+    if not mismatches:
+        print("✅ Income rollup matches the appointments table")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,271 @@
+"""LLM backends for the booking agent, selected with LLM_BACKEND.
+
+    gemini  Google Gemini over the network (default; needs GOOGLE_API_KEY)
+    fake    ScriptedReActChatModel: no network, deterministic tool calls and a
+            fixed per-call latency, for load tests and offline runs
+
+This module imports LangChain, so the agent only imports it when the agent
+is built.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from metrics import observe
+from response_cache import cache_key, normalize, response_cache
+
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
+# Simulated round trip of one fake LLM call
+FAKE_LLM_LATENCY_MS = float(os.environ.get("FAKE_LLM_LATENCY_MS", 0))
+# Characters per chunk when a whole reply is replayed as a stream
+STREAM_CHUNK_CHARS = 8
+
+# Markers from LangChain's conversational chat agent prompt
+USER_INPUT_MARKER = "and NOTHING else):\n\n"
+TOOL_RESPONSE_PATTERN = re.compile(r"^TOOL RESPONSE:\s*-+\s*(.*?)\n\nUSER'S INPUT", re.DOTALL)
+
+# (pattern, tool) tried in order; the first match decides the tool call
+TOOL_SCRIPT = [
+    (re.compile(r"\bexit\b.*\bstaff\b", re.IGNORECASE), "exit_staff_mode"),
+    (re.compile(r"\b(?:income|revenue|earnings?)\b", re.IGNORECASE), "query_income"),
+    (re.compile(r"\bcancel\b.*APPT-\d+", re.IGNORECASE), "cancel_appointment"),
+    (re.compile(r"\bappointments\b", re.IGNORECASE), "query_appointments"),
+    (re.compile(r"\b(?:staff|passcode)\b", re.IGNORECASE), "verify_staff"),
+    (re.compile(r"\b(?:status|missing|what do you need)\b", re.IGNORECASE), "get_info"),
+]
+DEFAULT_TOOL = "extract_info"
+
+
+def _action_blob(action, action_input):
+    return "```json\n" + json.dumps({"action": action, "action_input": action_input}) + "\n```"
+
+
+class ScriptedReActChatModel(BaseChatModel):
+    """Offline stand-in for the agent's LLM.
+
+    A user turn is answered with one tool call picked by TOOL_SCRIPT, and the
+    tool's response is handed back as the final answer, so every agent turn
+    costs two calls, each taking latency_ms.
+    """
+
+    latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-react"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        last = messages[-1].content if messages else ""
+        tool_response = TOOL_RESPONSE_PATTERN.match(last)
+        if tool_response:
+            return _action_blob("Final Answer", tool_response.group(1).strip())
+
+        user_input = last.rsplit(USER_INPUT_MARKER, 1)[-1].strip()
+        for pattern, tool in TOOL_SCRIPT:
+            if pattern.search(user_input):
+                return _action_blob(tool, user_input)
+        return _action_blob(DEFAULT_TOOL, user_input)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency_ms / 1000)
+        return _result(self._respond(messages))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return _result(self._respond(messages))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency_ms / 1000)
+        for chunk in _chunks(self._respond(messages)):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        for chunk in _chunks(self._respond(messages)):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def _result(text):
+    return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+def _chunks(text):
+    for start in range(0, len(text), STREAM_CHUNK_CHARS):
+        yield ChatGenerationChunk(message=AIMessageChunk(content=text[start:start + STREAM_CHUNK_CHARS]))
+
+
+class CachedChatModel(BaseChatModel):
+    """Serves repeated LLM calls from the response cache.
+
+    The key is the user's normalized input, this turn's earlier tool calls and
+    tool responses, and context() (the session's slots and staff mode). Chat
+    history is deliberately left out so the same request hits across sessions.
+    """
+
+    inner: Any
+    context: Callable[[], Any]
+    response_cache: Any = response_cache
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.inner._llm_type}"
+
+    def _key(self, messages):
+        for index in range(len(messages) - 1, -1, -1):
+            content = messages[index].content
+            if isinstance(content, str) and USER_INPUT_MARKER in content:
+                user_input = content.rsplit(USER_INPUT_MARKER, 1)[-1]
+                turn = [normalize(message.content) for message in messages[index + 1:]]
+                model = getattr(self.inner, "model", None) or getattr(self.inner, "model_name", None)
+                return cache_key(self.inner._llm_type, model, normalize(user_input), turn, self.context())
+        # Not an agent prompt; do not guess at a key
+        return None
+
+    def _inner_streams(self):
+        return type(self.inner)._stream is not BaseChatModel._stream
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages)
+        cached = self.response_cache.get(key) if key else None
+        if cached is not None:
+            return _result(cached)
+        started = time.perf_counter()
+        result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        if key:
+            self.response_cache.put(key, result.generations[0].message.content, (time.perf_counter() - started) * 1000)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages)
+        cached = self.response_cache.get(key) if key else None
+        if cached is not None:
+            return _result(cached)
+        started = time.perf_counter()
+        result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        if key:
+            self.response_cache.put(key, result.generations[0].message.content, (time.perf_counter() - started) * 1000)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        key = self._key(messages)
+        cached = self.response_cache.get(key) if key else None
+        if cached is None and not self._inner_streams():
+            started = time.perf_counter()
+            cached = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs).generations[0].text
+            if key:
+                self.response_cache.put(key, cached, (time.perf_counter() - started) * 1000)
+        if cached is not None:
+            for chunk in _chunks(cached):
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+
+        # The inner model reports its own tokens to run_manager
+        started = time.perf_counter()
+        parts = []
+        for chunk in self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            parts.append(chunk.text)
+            yield chunk
+        if key:
+            self.response_cache.put(key, "".join(parts), (time.perf_counter() - started) * 1000)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        key = self._key(messages)
+        cached = self.response_cache.get(key) if key else None
+        if cached is None and not self._inner_streams():
+            started = time.perf_counter()
+            result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            cached = result.generations[0].text
+            if key:
+                self.response_cache.put(key, cached, (time.perf_counter() - started) * 1000)
+        if cached is not None:
+            for chunk in _chunks(cached):
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+
+        started = time.perf_counter()
+        parts = []
+        async for chunk in self.inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            parts.append(chunk.text)
+            yield chunk
+        if key:
+            self.response_cache.put(key, "".join(parts), (time.perf_counter() - started) * 1000)
+
+
+class LLMTimer(BaseCallbackHandler):
+    """Records each LLM round trip of a model as an "llm" span named after its backend"""
+
+    def __init__(self, name):
+        self.name = name
+        self._started = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, error=False)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error=True)
+
+    def _finish(self, run_id, error):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            observe("llm", self.name, time.perf_counter() - started, error)
+
+
+def _gemini():
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        raise RuntimeError("GOOGLE_API_KEY is not set, so the assistant cannot answer this message.")
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    # A chat model, so the agent's answers can be streamed token by token
+    return ChatGoogleGenerativeAI(model=GEMINI_MODEL, google_api_key=api_key)
+
+
+def _fake():
+    return ScriptedReActChatModel(latency_ms=FAKE_LLM_LATENCY_MS)
+
+
+BACKENDS = {
+    "gemini": _gemini,
+    "fake": _fake,
+}
+
+
+def build_llm(backend: Optional[str] = None, cache_context: Optional[Callable[[], Any]] = None):
+    """Build the chat model for backend (LLM_BACKEND if not given).
+
+    With cache_context, replies are served from the response cache (unless it
+    is turned off); cache_context() returns the state replies depend on.
+    Every round trip, cached or not, is recorded as an "llm" span.
+    """
+    backend = backend or LLM_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+    llm = BACKENDS[backend]()
+    if cache_context is not None and response_cache.enabled:
+        llm = CachedChatModel(inner=llm, context=cache_context)
+    llm.callbacks = [LLMTimer(backend)]
+    return llm
@@ -0,0 +1,132 @@
+"""HTTP load test for the chat API.
+
+Start a server against a scratch database with the offline LLM, then point
+this script at it:
+
+    APPOINTMENT_DB_PATH=/tmp/load.db LLM_BACKEND=fake FAKE_LLM_LATENCY_MS=300 python server.py
+    python load_test.py --users 50 --concurrency 10
+
+Each simulated user holds one session, books an appointment over a few
+turns and then resets the session. Users are closed-loop: a user sends its
+next request only after the previous reply arrived. The run reports
+throughput and latency percentiles for all requests and per endpoint.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+
+def conversation(user, booking_date=None):
+    """Messages one simulated user sends; the first and last need the agent, the rest hit the fast path"""
+    booking_date = booking_date or date.today() + timedelta(days=30 + user % 300)
+    return [
+        "Hi, can you help me book an appointment?",
+        f"my name is Load User{user}",
+        f"loaduser{user}@example.com",
+        "service: haircut",
+        f"date: {booking_date.isoformat()}",
+        "Could you check what is missing?",
+    ]
+
+
+def post(url, payload, timeout):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def wait_for_server(base_url, process, timeout):
+    """Wait until the server started as process answers /stats; stop it and raise if it never does"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} before answering")
+        try:
+            urllib.request.urlopen(f"{base_url}/stats", timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server did not answer within {timeout}s")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def latency_summary(latencies, seconds):
+    """Request count, throughput and p50/p95/p99 of latencies (ms) measured over seconds"""
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "requestsPerSecond": round(len(latencies) / seconds, 1) if seconds else 0.0,
+        "p50Ms": round(percentile(latencies, 0.50), 1),
+        "p95Ms": round(percentile(latencies, 0.95), 1),
+        "p99Ms": round(percentile(latencies, 0.99), 1),
+    }
+
+
+def run(base_url, users, concurrency, timeout=60, booking_date=None, first_user=0, reset=True):
+    """Run every user's conversation against base_url and return the summary.
+
+    Users book on spread-out dates, or all on booking_date if given, and end
+    with a /reset unless reset is False.
+    """
+    latencies, routes, errors = {"/chat": [], "/reset": []}, {}, []
+    lock = threading.Lock()
+
+    def timed_post(path, payload):
+        started = time.perf_counter()
+        try:
+            body = post(f"{base_url}{path}", payload, timeout)
+        except Exception as e:
+            with lock:
+                errors.append(f"{path}: {e}")
+            return None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies[path].append(elapsed_ms)
+        return body
+
+    def simulate(user):
+        session_id = None
+        for message in conversation(user, booking_date):
+            body = timed_post("/chat", {"message": message, "sessionId": session_id})
+            if body is None:
+                return
+            session_id = body.get("sessionId", session_id)
+            route = (body.get("routing") or {}).get("route", "unknown")
+            with lock:
+                routes[route] = routes.get(route, 0) + 1
+        if reset:
+            timed_post("/reset", {"sessionId": session_id})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(simulate, range(first_user, first_user + users)))
+    wall_seconds = time.perf_counter() - started
+
+    summary = latency_summary(latencies["/chat"] + latencies["/reset"], wall_seconds)
+    summary.update({
+        "errors": len(errors),
+        "seconds": round(wall_seconds, 3),
+        "endpoints": {path: latency_summary(values, wall_seconds) for path, values in latencies.items() if values},
+        "routes": routes,
+        "firstErrors": errors[:5],
+    })
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps(run(args.url.rstrip("/"), args.users, args.concurrency), indent=2))
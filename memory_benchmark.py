@@ -0,0 +1,81 @@
+"""Prompt size and per-turn latency over a 50-turn conversation, per memory policy.
+
+Runs the real agent stack against the offline scripted LLM and a scratch
+database, so it needs no API key:
+
+    python memory_benchmark.py
+
+"unbounded" keeps every turn, as the old ConversationBufferMemory did, for
+comparison.
+"""
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["AGENT_WARMUP"] = "lazy"
+# Every turn should reach the LLM
+os.environ["RESPONSE_CACHE_SIZE"] = "0"
+os.environ.setdefault("APPOINTMENT_DB_PATH", os.path.join(tempfile.mkdtemp(), "memory_benchmark.db"))
+
+from conversation_memory import POLICIES, WindowMemory, estimate_tokens  # noqa: E402
+
+TURNS = 50
+REPORT_TURNS = (1, 10, 25, 50)
+MESSAGES = [
+    "Hi, can you help me book an appointment?",
+    "What services do you offer and how long do they take?",
+    "I think I'd like a haircut, is that right for short hair?",
+    "Could you check what is missing?",
+    "Actually, what are your opening hours on weekends?",
+]
+
+
+def run_policy(memory):
+    """Run TURNS agent turns in a fresh session; returns prompt tokens and latency per turn"""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    from appointment_create_agent import chat_with_agent
+    from session_store import Session
+
+    class PromptSize(BaseCallbackHandler):
+        def __init__(self):
+            self.tokens = 0
+
+        def on_chat_model_start(self, serialized, messages, **kwargs):
+            # The first call of a turn carries the whole prompt
+            if not self.tokens:
+                self.tokens = sum(estimate_tokens(str(message.content)) for message in messages[0])
+
+    session = Session("memory-benchmark", memory)
+    prompt_tokens, latencies = [], []
+    for turn in range(TURNS):
+        counter = PromptSize()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            chat_with_agent(session, MESSAGES[turn % len(MESSAGES)], callbacks=[counter])
+        latencies.append((time.perf_counter() - started) * 1000)
+        prompt_tokens.append(counter.tokens)
+    return prompt_tokens, latencies, len(session.history) // 2
+
+
+if __name__ == "__main__":
+    from appointment_create_agent import get_agent, initialize_database
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_database()
+        get_agent()
+
+    policies = {"unbounded": WindowMemory(turns=TURNS)}
+    policies.update((name, policy()) for name, policy in POLICIES.items())
+
+    header = " ".join(f"turn {turn:>2} tok" for turn in REPORT_TURNS)
+    print(f"{'policy':<10} {header}  mean ms  last10 ms  kept turns")
+    for name, memory in policies.items():
+        prompt_tokens, latencies, kept = run_policy(memory)
+        sizes = " ".join(f"{prompt_tokens[turn - 1]:>11}" for turn in REPORT_TURNS)
+        mean_ms = sum(latencies) / len(latencies)
+        last_ms = sum(latencies[-10:]) / 10
+        print(f"{name:<10} {sizes}  {mean_ms:7.1f}  {last_ms:9.1f}  {kept:>10}")
@@ -0,0 +1,194 @@
+"""Latency spans and counters for the chat hot path, in the Prometheus text format.
+
+Spans are recorded per stage and name:
+
+    router  route                          picking a tool for the turn
+    tool    extract_info, query_income...  one tool call (fast path or agent)
+    llm     gemini, fake                   one LLM round trip (cache hits included)
+    db      "select appointments", ...     one statement execution or commit
+
+A request can also collect its own spans (see `profiled`); the servers do so
+when it sends `X-Profile: 1` and return them in a Server-Timing header.
+"""
+import functools
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Honor X-Profile request headers; set to 0 to ignore them
+PROFILE_HEADER_ENABLED = os.environ.get("PROFILE_HEADER_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LLM_CALL_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16)
+
+STATEMENT_VERB = re.compile(r"^\s*(\w+)")
+STATEMENT_TABLE = re.compile(
+    r"\b(?:FROM|INTO|UPDATE|TABLE|INDEX|TRIGGER)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+)", re.IGNORECASE
+)
+
+# Spans of the current request while it is being profiled
+_profile = ContextVar("profile", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label tuple"""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (plus +Inf), then sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            base = _labels(self.labels, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {values[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with one series per label tuple"""
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for labels, value in sorted(series.items()):
+            lines.append(f"{self.name}{{{_labels(self.labels, labels)}}} {value}")
+        return lines
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+stage_seconds = Histogram("chat_stage_seconds", "Latency of one router, tool, LLM or DB span.",
+                          ("stage", "name"), LATENCY_BUCKETS)
+request_seconds = Histogram("chat_request_seconds", "Latency of one chat turn by route (fast or agent).",
+                            ("route",), LATENCY_BUCKETS)
+llm_calls_per_request = Histogram("chat_llm_calls_per_request", "LLM round trips made by one chat turn.",
+                                  ("route",), LLM_CALL_BUCKETS)
+errors_total = Counter("chat_errors_total", "Spans and requests that raised, by stage and name.", ("stage", "name"))
+
+REGISTRY = (request_seconds, llm_calls_per_request, stage_seconds, errors_total)
+
+
+def observe(stage, name, seconds, error=False):
+    """Record one finished span"""
+    stage_seconds.observe(seconds, stage, name)
+    if error:
+        errors_total.inc(stage, name)
+    spans = _profile.get()
+    if spans is not None:
+        spans.append({"stage": stage, "name": name, "ms": round(seconds * 1000, 3), "error": error})
+
+
+@contextmanager
+def span(stage, name):
+    """Time the enclosed block as one span"""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe(stage, name, time.perf_counter() - started, error)
+
+
+def timed(stage, name):
+    """Decorator recording every call of the function as a span"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_request(route, seconds, llm_calls):
+    """Record one finished chat turn"""
+    request_seconds.observe(seconds, route)
+    llm_calls_per_request.observe(llm_calls, route)
+
+
+@functools.lru_cache(maxsize=512)
+def statement_label(sql):
+    """Low-cardinality name for a SQL statement: its verb and first table (or created object), e.g. "select appointments" """
+    verb = STATEMENT_VERB.match(sql)
+    table = STATEMENT_TABLE.search(sql)
+    label = verb.group(1).lower() if verb else "sql"
+    return f"{label} {table.group(1)}" if table else label
+
+
+@contextmanager
+def profiled(enabled=True):
+    """Collect the spans recorded in this context into the yielded list (None when not enabled)"""
+    if not enabled:
+        yield None
+        return
+    spans = []
+    token = _profile.set(spans)
+    try:
+        yield spans
+    finally:
+        _profile.reset(token)
+
+
+def server_timing(spans):
+    """Server-Timing header value totalling the spans per stage and name"""
+    totals = {}
+    for entry in spans:
+        key = f"{entry['stage']}.{re.sub(r'[^A-Za-z0-9_.-]', '_', entry['name'])}"
+        total, count = totals.get(key, (0.0, 0))
+        totals[key] = (total + entry["ms"], count + 1)
+    return ", ".join(f'{key};dur={total:.3f};desc="x{count}"' for key, (total, count) in totals.items())
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,282 @@
+import sqlite3
+import sys
+
+import database
+from app_logging import get_logger, setup_logging
+from tickets import TICKET_PREFIX
+
+log = get_logger("migrations")
+
+# Canonical service names; bookings and staff filters are stored and matched
+# against these so service lookups can use an index.
+SERVICES = ["haircut", "manicure", "pedicure", "massage", "facial", "consultation", "appointment", "checkup", "cleaning"]
+
+
+def _create_appointments_table(conn):
+    conn.execute(database.APPOINTMENTS_TABLE_SQL)
+
+
+def _add_ticket_number_column(conn):
+    # Databases created before tickets existed lack the column
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(appointments)")]
+    if "ticket_number" not in columns:
+        conn.execute("ALTER TABLE appointments ADD COLUMN ticket_number TEXT")
+
+
+def _canonicalize_services(conn):
+    # Free-text services that name one service ("a haircut", "haircut
+    # appointment") become that service, by the rule new bookings use. Text
+    # naming none or several ("haircut and massage") is left as it is.
+    from slot_extractor import canonical_service  # slot_extractor imports SERVICES from here
+
+    placeholders = ", ".join("?" * len(SERVICES))
+    rows = conn.execute(f"SELECT id, service FROM appointments WHERE service NOT IN ({placeholders})", SERVICES)
+    updates = []
+    for row_id, text in rows.fetchall():
+        service = canonical_service(text)
+        if service != text:
+            updates.append((service, row_id))
+    conn.executemany("UPDATE appointments SET service = ? WHERE id = ?", updates)
+
+
+def _highest_ticket_value(conn):
+    return conn.execute(
+        "SELECT MAX(CAST(SUBSTR(ticket_number, 6) AS INTEGER)) FROM appointments WHERE ticket_number LIKE 'APPT-%'"
+    ).fetchone()[0] or 0
+
+
+def _dedupe_ticket_numbers(conn):
+    # Random tickets could collide. The first booking keeps its ticket and
+    # later duplicates get new numbers above every existing ticket, where the
+    # ticket sequence (migration 6) will start too, so the unique index can
+    # be built and every ticket stays addressable as APPT-<digits>.
+    duplicates = conn.execute('''
+        SELECT id, ticket_number FROM appointments
+        WHERE id NOT IN (SELECT MIN(id) FROM appointments GROUP BY ticket_number)
+          AND ticket_number IS NOT NULL
+        ORDER BY id
+    ''').fetchall()
+    next_value = max(_highest_ticket_value(conn) + 1, 100000)
+    for offset, (row_id, ticket) in enumerate(duplicates):
+        new_ticket = f"{TICKET_PREFIX}{next_value + offset}"
+        conn.execute("UPDATE appointments SET ticket_number = ? WHERE id = ?", (new_ticket, row_id))
+        log.warning("⚠️ Duplicate ticket %s (appointment %d) renumbered to %s", ticket, row_id, new_ticket)
+
+
+def _add_indexes(conn):
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_ticket ON appointments(ticket_number)")
+    # price is carried in the index so income sums never touch the table
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_status_date ON appointments(status, date, price)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_service_date ON appointments(service, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_email ON appointments(email COLLATE NOCASE)")
+    conn.execute("ANALYZE appointments")
+
+
+def _add_ticket_sequence(conn):
+    # Tickets are handed out from this counter; it starts above every legacy
+    # random ticket so new ones can never collide with them.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ticket_sequence (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            next_value INTEGER NOT NULL
+        )
+    ''')
+    highest = _highest_ticket_value(conn)
+    conn.execute("INSERT OR IGNORE INTO ticket_sequence (id, next_value) VALUES (1, ?)", (max(highest + 1, 100000),))
+
+
+def _add_start_time_column(conn):
+    # Bookings now occupy a time slot; older rows keep a NULL start time
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(appointments)")]
+    if "start_time" not in columns:
+        conn.execute("ALTER TABLE appointments ADD COLUMN start_time TEXT")
+
+
+def _add_date_index(conn):
+    # Listings page through appointments in (date, id) order
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments(date)")
+
+
+# Per (date, service, status) totals of the appointments table, as stored in income_daily
+INCOME_ROLLUP_SQL = '''
+    SELECT date, service, COALESCE(status, ''), COUNT(*), COALESCE(SUM(price), 0)
+    FROM appointments GROUP BY date, service, COALESCE(status, '')
+'''
+
+
+def _add_income_rollup(conn):
+    # Daily income totals kept up to date by triggers, so every writer
+    # (chat bookings, batch imports, staff edits in the sqlite shell)
+    # updates them in the same transaction as the appointment row.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS income_daily (
+            date TEXT NOT NULL,
+            service TEXT NOT NULL,
+            status TEXT NOT NULL,
+            appointments INTEGER NOT NULL,
+            income REAL NOT NULL,
+            PRIMARY KEY (status, date, service)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_income_daily_status_service ON income_daily(status, service, date)")
+    conn.execute("DELETE FROM income_daily")
+    conn.execute("INSERT INTO income_daily " + INCOME_ROLLUP_SQL)
+
+    add_new = '''
+        INSERT INTO income_daily (date, service, status, appointments, income)
+        VALUES (NEW.date, NEW.service, COALESCE(NEW.status, ''), 1, COALESCE(NEW.price, 0))
+        ON CONFLICT (status, date, service) DO UPDATE
+        SET appointments = appointments + 1, income = income + excluded.income;
+    '''
+    remove_old = '''
+        UPDATE income_daily SET appointments = appointments - 1, income = income - COALESCE(OLD.price, 0)
+        WHERE date = OLD.date AND service = OLD.service AND status = COALESCE(OLD.status, '');
+        DELETE FROM income_daily
+        WHERE date = OLD.date AND service = OLD.service AND status = COALESCE(OLD.status, '') AND appointments <= 0;
+    '''
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS appointments_rollup_insert AFTER INSERT ON appointments BEGIN {add_new} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS appointments_rollup_delete AFTER DELETE ON appointments BEGIN {remove_old} END")
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS appointments_rollup_update "
+        f"AFTER UPDATE OF date, service, status, price ON appointments BEGIN {remove_old} {add_new} END"
+    )
+
+
+def _add_schedule_versions(conn):
+    # A per-date counter bumped by every change to that date's appointments.
+    # Each worker caches day schedules; comparing the cached version with
+    # this table tells it when another process has booked or cancelled.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schedule_versions (
+            date TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    bump = '''
+        INSERT INTO schedule_versions (date, version) VALUES ({date}, 1)
+        ON CONFLICT (date) DO UPDATE SET version = version + 1;
+    '''
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS appointments_schedule_insert AFTER INSERT ON appointments "
+        f"BEGIN {bump.format(date='NEW.date')} END"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS appointments_schedule_delete AFTER DELETE ON appointments "
+        f"BEGIN {bump.format(date='OLD.date')} END"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS appointments_schedule_update "
+        "AFTER UPDATE OF date, service, status, start_time ON appointments "
+        f"BEGIN {bump.format(date='OLD.date')} {bump.format(date='NEW.date')} END"
+    )
+
+
+def _add_active_booking_index(conn):
+    # One pending booking per (email, service, date): book_appointment looks
+    # the slot set up here under the write lock before inserting, so retried
+    # or repeated bookings return the original ticket. Not UNIQUE, so existing
+    # databases with duplicates still migrate.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_appointments_active_booking "
+        "ON appointments(email COLLATE NOCASE, service, date) WHERE status = 'pending'"
+    )
+
+
+# (version, description, step); a database at PRAGMA user_version N has
+# every step up to N applied. Only ever append to this list.
+MIGRATIONS = [
+    (1, "create appointments table", _create_appointments_table),
+    (2, "add ticket_number column", _add_ticket_number_column),
+    (3, "canonical service names", _canonicalize_services),
+    (4, "unique ticket numbers", _dedupe_ticket_numbers),
+    (5, "appointments indexes", _add_indexes),
+    (6, "ticket number sequence", _add_ticket_sequence),
+    (7, "appointment start times", _add_start_time_column),
+    (8, "appointments date index", _add_date_index),
+    (9, "daily income rollup", _add_income_rollup),
+    (10, "schedule versions", _add_schedule_versions),
+    (11, "active booking index", _add_active_booking_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Representative tool queries and the index each must use
+QUERY_PLAN_CHECKS = [
+    ("SELECT id, name FROM appointments WHERE ticket_number = ?", ("APPT-10000",), "idx_appointments_ticket"),
+    ("SELECT name, email, service, date, ticket_number FROM appointments WHERE 1=1 AND status = ? AND date = ?",
+     ("pending", "2030-01-01"), "idx_appointments_status_date"),
+    ("SELECT name, email, service, date, ticket_number FROM appointments WHERE 1=1 AND service = ? AND date = ?",
+     ("haircut", "2030-01-01"), "idx_appointments_service_date"),
+    ("SELECT name, email, service, date, ticket_number FROM appointments WHERE 1=1 AND email = ? COLLATE NOCASE",
+     ("ann@example.com",), "idx_appointments_email"),
+    ("SELECT SUM(income), SUM(appointments) FROM income_daily WHERE status = ? AND date BETWEEN ? AND ?",
+     ("done", "2030-01-01", "2030-12-31"), "sqlite_autoindex_income_daily_1"),
+    ("SELECT SUM(income), SUM(appointments) FROM income_daily WHERE status = ? AND service = ?",
+     ("done", "haircut"), "idx_income_daily_status_service"),
+    ("SELECT id, name FROM appointments WHERE 1=1 AND (date, id) > (?, ?) ORDER BY date, id LIMIT ?",
+     ("2030-01-01", 10, 21), "idx_appointments_date"),
+    ("SELECT ticket_number, start_time FROM appointments "
+     "WHERE email = ? COLLATE NOCASE AND service = ? AND date = ? AND status = 'pending' LIMIT 1",
+     ("ann@example.com", "haircut", "2030-01-01"), "idx_appointments_active_booking"),
+]
+
+
+def schema_version(conn):
+    """Return the migration version the database is at"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn=None, verbose=True):
+    """Apply pending migrations in order, one transaction each; returns the list of applied versions"""
+    if conn is None:
+        with database.connection() as conn:
+            return migrate(conn, verbose)
+
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if schema_version(conn) >= version:
+            continue
+        # IMMEDIATE takes the write lock, so concurrent workers migrate once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) < version:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                applied.append(version)
+                if verbose:
+                    log.info("✅ Migration %d applied: %s", version, description)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+
+def check_query_plans():
+    """Run EXPLAIN QUERY PLAN for the tool queries on a freshly migrated schema.
+
+    Returns a list of (sql, expected index, plan, ok). A scratch in-memory
+    database is used so the result reflects the schema, not the statistics of
+    whatever data happens to be in the live file.
+    """
+    conn = sqlite3.connect(":memory:")
+    try:
+        migrate(conn, verbose=False)
+        results = []
+        for sql, params, index in QUERY_PLAN_CHECKS:
+            plan = " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+            results.append((sql, index, plan, index in plan))
+        return results
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # Migrates the configured database, then verifies the query plans
+    setup_logging()
+    migrate()
+    failures = 0
+    for sql, index, plan, ok in check_query_plans():
+        print(f"{'✅' if ok else '❌'} {index}: {plan}")
+        failures += not ok
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,173 @@
+"""Staff reports computed from the income_daily rollup.
+
+Each report reads the rollup rows of its date range with one query and
+aggregates them in a single pass, so the cost depends on the number of
+days x services x statuses in the range, not on the number of appointments.
+
+    python reports.py   # seed 1M synthetic appointments and time the reports
+"""
+from datetime import datetime, timedelta
+
+import database
+
+GRANULARITIES = ("day", "week", "month")
+CANCELLED = "cancel"
+# Revenue counts finished appointments only, as in query_income
+REVENUE_STATUS = "done"
+
+
+def _rollup_rows(start, end):
+    where, params = "1=1", []
+    if start:
+        where += " AND date >= ?"
+        params.append(start)
+    if end:
+        where += " AND date <= ?"
+        params.append(end)
+    with database.connection() as conn:
+        return conn.execute(
+            f"SELECT date, service, status, appointments, income FROM income_daily WHERE {where}", params
+        ).fetchall()
+
+
+def _period(date, granularity, cache):
+    period = cache.get(date)
+    if period is None:
+        if granularity == "day":
+            period = date
+        elif granularity == "month":
+            period = date[:7]
+        else:
+            day = datetime.strptime(date, "%Y-%m-%d")
+            period = (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d")
+        cache[date] = period
+    return period
+
+
+def _rate(part, whole):
+    return round(part / whole, 4) if whole else 0.0
+
+
+def summary_report(start=None, end=None):
+    """Bookings by status and service, cancellation rate and revenue over [start, end] (inclusive, open if None)"""
+    by_status = {}
+    by_service = {}
+    total = cancelled = 0
+    revenue = 0.0
+    first = last = None
+    for date, service, status, appointments, income in _rollup_rows(start, end):
+        total += appointments
+        by_status[status] = by_status.get(status, 0) + appointments
+        entry = by_service.get(service)
+        if entry is None:
+            entry = by_service[service] = {"service": service, "bookings": 0, "cancelled": 0, "revenue": 0.0}
+        entry["bookings"] += appointments
+        if status == CANCELLED:
+            cancelled += appointments
+            entry["cancelled"] += appointments
+        elif status == REVENUE_STATUS:
+            revenue += income
+            entry["revenue"] += income
+        first = date if first is None or date < first else first
+        last = date if last is None or date > last else last
+
+    services = sorted(by_service.values(), key=lambda entry: -entry["bookings"])
+    for entry in services:
+        entry["cancellationRate"] = _rate(entry["cancelled"], entry["bookings"])
+        entry["revenue"] = round(entry["revenue"], 2)
+    return {
+        "from": start or first,
+        "to": end or last,
+        "bookings": total,
+        "byStatus": by_status,
+        "byService": services,
+        "cancellationRate": _rate(cancelled, total),
+        "revenue": round(revenue, 2),
+    }
+
+
+def trend_report(start=None, end=None, granularity="day"):
+    """Bookings, cancellations and revenue per day, ISO week (by its Monday) or month"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+    periods = {}
+    cache = {}
+    first = last = None
+    for date, _, status, appointments, income in _rollup_rows(start, end):
+        first = date if first is None or date < first else first
+        last = date if last is None or date > last else last
+        period = _period(date, granularity, cache)
+        entry = periods.get(period)
+        if entry is None:
+            entry = periods[period] = {"period": period, "bookings": 0, "cancelled": 0, "revenue": 0.0}
+        entry["bookings"] += appointments
+        if status == CANCELLED:
+            entry["cancelled"] += appointments
+        elif status == REVENUE_STATUS:
+            entry["revenue"] += income
+
+    trend = [periods[period] for period in sorted(periods)]
+    for entry in trend:
+        entry["cancellationRate"] = _rate(entry["cancelled"], entry["bookings"])
+        entry["revenue"] = round(entry["revenue"], 2)
+    return {"from": start or first, "to": end or last, "granularity": granularity, "trend": trend}
+
+
+def seed_synthetic(rows, days=730, batch=50000):
+    """Insert `rows` random appointments spread over `days` days from today (benchmark data)"""
+    import random
+
+    services = ["haircut", "manicure", "pedicure", "massage", "facial", "consultation"]
+    statuses = ["pending", "done", "done", "done", "cancel"]
+    today = datetime.now()
+    dates = [(today + timedelta(days=offset - days // 2)).strftime("%Y-%m-%d") for offset in range(days)]
+    with database.connection() as conn:
+        conn.execute("BEGIN")
+        for offset in range(0, rows, batch):
+            conn.executemany(
+                "INSERT INTO appointments (name, email, service, date, ticket_number, status, price) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((f"Customer {n}", f"customer{n}@example.com", random.choice(services), random.choice(dates),
+                  f"SEED-{n}", random.choice(statuses), float(random.randrange(20, 120)))
+                 for n in range(offset, min(offset + batch, rows)))
+            )
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    import tempfile
+    import time
+
+    import migrations
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    database.set_db_path(os.path.join(tempfile.mkdtemp(), "reports_benchmark.db"))
+    migrations.migrate(verbose=False)
+
+    started = time.perf_counter()
+    seed_synthetic(rows)
+    print(f"Seeded {rows} appointments in {time.perf_counter() - started:.1f}s")
+
+    end = datetime.now().strftime("%Y-%m-%d")
+    start = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
+    cases = [
+        ("summary, all time", lambda: summary_report()),
+        ("summary, last year", lambda: summary_report(start, end)),
+        ("daily trend, last year", lambda: trend_report(start, end, "day")),
+        ("weekly trend, all time", lambda: trend_report(granularity="week")),
+        ("monthly trend, all time", lambda: trend_report(granularity="month")),
+    ]
+    failures = 0
+    for label, report in cases:
+        report()
+        runs = 20
+        started = time.perf_counter()
+        for _ in range(runs):
+            report()
+        elapsed_ms = (time.perf_counter() - started) / runs * 1000
+        ok = elapsed_ms < 100
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {label}: {elapsed_ms:.1f} ms")
+    sys.exit(1 if failures else 0)
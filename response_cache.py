@@ -0,0 +1,145 @@
+"""Cache of LLM replies keyed on what the reply depends on.
+
+Entries live in an in-memory LRU with a TTL. When RESPONSE_CACHE_PATH is set
+they are also written to a small SQLite file, so a restarted worker starts
+warm. The cache stores LLM output only (which tool to call, what to answer);
+tools still run on every turn, so bookings and staff queries are never
+served stale.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_TTL_SECONDS = int(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 600))
+# 0 turns the cache off
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 1000))
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH")
+
+# Expired rows are purged from the SQLite store once every this many writes
+PURGE_EVERY = 100
+
+WHITESPACE = re.compile(r"\s+")
+TRAILING_PUNCTUATION = re.compile(r"[\s.!?]+$")
+
+
+def normalize(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation, so "Hi!" and "hi" share an entry"""
+    return TRAILING_PUNCTUATION.sub("", WHITESPACE.sub(" ", text.strip().lower()))
+
+
+def cache_key(*parts):
+    """Stable key for any JSON-serializable parts"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL cache of LLM replies with hit and saved-latency counters"""
+
+    def __init__(self, ttl_seconds=600, max_entries=1000, path=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # key -> (response, latency_ms, stored_at)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+        if path and max_entries > 0:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    latency_ms REAL NOT NULL,
+                    stored_at REAL NOT NULL
+                )
+            ''')
+            self._db.commit()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        """Return the cached reply for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[2] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, latency_ms, stored_at FROM response_cache WHERE key = ? AND stored_at > ?",
+                    (key, now - self.ttl_seconds)
+                ).fetchone()
+                if row:
+                    entry = tuple(row)
+                    self._remember(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_ms += entry[1]
+            return entry[0]
+
+    def put(self, key, response, latency_ms):
+        """Store a reply along with how long the LLM took to produce it"""
+        entry = (response, latency_ms, time.time())
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?)", (key,) + entry)
+                self._writes += 1
+                if self._writes % PURGE_EVERY == 0:
+                    self._purge(entry[2])
+                self._db.commit()
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM response_cache")
+                self._db.commit()
+            self.hits = self.misses = 0
+            self.saved_ms = 0.0
+
+    def stats(self):
+        """Cumulative cache counters since startup"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "msSaved": round(self.saved_ms, 1),
+                "entries": len(self._entries),
+            }
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _purge(self, now):
+        self._db.execute("DELETE FROM response_cache WHERE stored_at <= ?", (now - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM response_cache WHERE key IN "
+            "(SELECT key FROM response_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_PATH)
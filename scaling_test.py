@@ -0,0 +1,153 @@
+"""Multi-worker throughput scaling and double-booking check.
+
+For each worker count this starts `uvicorn asgi_server:app --workers N` on a
+scratch database with the offline LLM, sessions in SQLite and file booking
+locks, then:
+
+1. runs the load test with every user booking on its own date and records
+   throughput;
+2. sends more users at one date than it has room for, and checks the
+   database: no slot above SALON_CHAIRS, no day above SALON_DAILY_CAPACITY,
+   no duplicate ticket, and one booking per user from the first phase.
+
+Each worker admits MAX_CONCURRENT_LLM_CALLS agent turns at once and every LLM
+call takes FAKE_LLM_LATENCY_MS, so a worker's capacity is fixed (as with a
+per-worker LLM quota) and throughput should grow close to linearly with the
+number of workers until the host runs out of CPU.
+
+    python scaling_test.py --workers 1 2 4
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
+
+import load_test
+from scheduling import CHAIRS, DAILY_CAPACITY, SLOTS_PER_DAY, slot_index, slots_needed
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STARTUP_TIMEOUT_SECONDS = 60
+# First user number of the contention phase, so its emails differ from phase one
+CONTENTION_FIRST_USER = 100000
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_workers(workers, workdir, port, llm_latency_ms, llm_slots):
+    env = dict(
+        os.environ,
+        APPOINTMENT_DB_PATH=os.path.join(workdir, "appointments.db"),
+        SESSION_STORE="sqlite",
+        SESSION_DB_PATH=os.path.join(workdir, "sessions.db"),
+        BOOKING_LOCKS="file",
+        LLM_BACKEND="fake",
+        FAKE_LLM_LATENCY_MS=str(llm_latency_ms),
+        MAX_CONCURRENT_LLM_CALLS=str(llm_slots),
+        # Every agent turn should reach the (simulated) LLM
+        RESPONSE_CACHE_SIZE="0",
+        LOG_LEVEL="WARNING",
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "asgi_server:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    load_test.wait_for_server(f"http://127.0.0.1:{port}", process, STARTUP_TIMEOUT_SECONDS)
+    return process
+
+
+def check_bookings(db_path, users, contended_date):
+    """Return a list of problems found in the booked appointments"""
+    problems = []
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT date, service, start_time, ticket_number, email FROM appointments WHERE status = 'pending'"
+        ).fetchall()
+    finally:
+        conn.close()
+
+    days = {}
+    for booking_date, service, start_time, _, _ in rows:
+        occupancy, count = days.setdefault(booking_date, ([0] * SLOTS_PER_DAY, [0]))
+        count[0] += 1
+        start = slot_index(start_time)
+        if start is None:
+            problems.append(f"{booking_date}: booking without a valid start time ({start_time!r})")
+            continue
+        for slot in range(start, min(start + slots_needed(service), SLOTS_PER_DAY)):
+            occupancy[slot] += 1
+    for booking_date, (occupancy, count) in sorted(days.items()):
+        if max(occupancy) > CHAIRS:
+            problems.append(f"{booking_date}: {max(occupancy)} bookings in one slot (chairs: {CHAIRS})")
+        if count[0] > DAILY_CAPACITY:
+            problems.append(f"{booking_date}: {count[0]} bookings (daily capacity: {DAILY_CAPACITY})")
+
+    tickets = [row[3] for row in rows]
+    if len(tickets) != len(set(tickets)):
+        problems.append(f"{len(tickets) - len(set(tickets))} duplicate ticket numbers")
+    spread_booked = {row[4] for row in rows if row[0] != contended_date}
+    if len(spread_booked) != users:
+        problems.append(f"{len(spread_booked)} of {users} spread-out users booked")
+    return problems
+
+
+def run(workers, users, concurrency, contention_users, llm_latency_ms, llm_slots):
+    """Measure one worker count; returns its summary"""
+    workdir = tempfile.mkdtemp(prefix=f"scaling-{workers}-")
+    port = _free_port()
+    process = start_workers(workers, workdir, port, llm_latency_ms, llm_slots)
+    try:
+        url = f"http://127.0.0.1:{port}"
+        spread = load_test.run(url, users, concurrency)
+        contended_date = date.today() + timedelta(days=400)
+        contention = load_test.run(url, contention_users, concurrency, booking_date=contended_date,
+                                   first_user=CONTENTION_FIRST_USER)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    problems = check_bookings(os.path.join(workdir, "appointments.db"), users, contended_date.isoformat())
+    problems += [f"request error: {error}" for error in spread["firstErrors"] + contention["firstErrors"]]
+    return {
+        "workers": workers,
+        "requestsPerSecond": spread["requestsPerSecond"],
+        "p50Ms": spread["p50Ms"],
+        "p95Ms": spread["p95Ms"],
+        "p99Ms": spread["p99Ms"],
+        "requests": spread["requests"] + contention["requests"],
+        "problems": problems,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=80)
+    parser.add_argument("--contention-users", type=int, default=60)
+    parser.add_argument("--llm-latency-ms", type=int, default=200)
+    parser.add_argument("--llm-slots", type=int, default=2, help="MAX_CONCURRENT_LLM_CALLS per worker")
+    args = parser.parse_args()
+
+    results = []
+    for workers in args.workers:
+        result = run(workers, args.users, args.concurrency, args.contention_users,
+                     args.llm_latency_ms, args.llm_slots)
+        result["speedup"] = round(result["requestsPerSecond"] / results[0]["requestsPerSecond"], 2) if results else 1.0
+        results.append(result)
+        print(f"{'✅' if not result['problems'] else '❌'} {workers} worker(s): "
+              f"{result['requestsPerSecond']} req/s (x{result['speedup']}), p95 {result['p95Ms']} ms", flush=True)
+        for problem in result["problems"][:10]:
+            print(f"   {problem}")
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if any(result["problems"] for result in results) else 0)
@@ -0,0 +1,245 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import database
+
+OPENING_TIME = os.environ.get("SALON_OPENING_TIME", "09:00")
+CLOSING_TIME = os.environ.get("SALON_CLOSING_TIME", "18:00")
+SLOT_MINUTES = 30
+# Bookings that can run at the same time (chairs / staff on shift)
+CHAIRS = int(os.environ.get("SALON_CHAIRS", 3))
+# Bookings accepted per day regardless of free chairs
+DAILY_CAPACITY = int(os.environ.get("SALON_DAILY_CAPACITY", 40))
+
+SERVICE_DURATIONS = {
+    "haircut": 30,
+    "manicure": 45,
+    "pedicure": 60,
+    "massage": 60,
+    "facial": 60,
+    "consultation": 30,
+    "appointment": 30,
+    "checkup": 30,
+    "cleaning": 60,
+}
+DEFAULT_DURATION = 30
+
+# Days kept in the in-memory index before it is cleared
+MAX_CACHED_DAYS = 400
+
+
+def _minutes(time_str):
+    hours, minutes = time_str.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _time_str(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+OPEN_MINUTES = _minutes(OPENING_TIME)
+CLOSE_MINUTES = _minutes(CLOSING_TIME)
+SLOTS_PER_DAY = (CLOSE_MINUTES - OPEN_MINUTES) // SLOT_MINUTES
+
+
+def slots_needed(service):
+    """Number of consecutive slots a service occupies"""
+    duration = SERVICE_DURATIONS.get(service, DEFAULT_DURATION)
+    return -(-duration // SLOT_MINUTES)
+
+
+def slot_index(start_time):
+    """Slot number for an HH:MM start time, or None if it is not on the slot grid within opening hours"""
+    try:
+        offset = _minutes(start_time) - OPEN_MINUTES
+    except (ValueError, AttributeError):
+        return None
+    if offset < 0 or offset % SLOT_MINUTES or offset // SLOT_MINUTES >= SLOTS_PER_DAY:
+        return None
+    return offset // SLOT_MINUTES
+
+
+class DaySchedule:
+    """Occupancy of one day: bookings running in each slot, plus the day's booking count"""
+
+    __slots__ = ("occupancy", "bookings")
+
+    def __init__(self):
+        self.occupancy = [0] * SLOTS_PER_DAY
+        self.bookings = 0
+
+    def add(self, start_slot, length):
+        self.bookings += 1
+        if start_slot is None:
+            # Bookings made before times existed only count toward the day
+            return
+        for slot in range(start_slot, min(start_slot + length, SLOTS_PER_DAY)):
+            self.occupancy[slot] += 1
+
+    def fits(self, start_slot, length):
+        if self.bookings >= DAILY_CAPACITY or start_slot + length > SLOTS_PER_DAY:
+            return False
+        return all(self.occupancy[slot] < CHAIRS for slot in range(start_slot, start_slot + length))
+
+
+def _first_fit(day, length, preferred_time=None):
+    # preferred_time if it fits, else (without a preference) the earliest start that fits
+    preferred_slot = slot_index(preferred_time) if preferred_time else None
+    if preferred_slot is not None and day.fits(preferred_slot, length):
+        return preferred_time
+    if preferred_time:
+        return None
+    for start_slot in range(SLOTS_PER_DAY - length + 1):
+        if day.fits(start_slot, length):
+            return _time_str(OPEN_MINUTES + start_slot * SLOT_MINUTES)
+    return None
+
+
+def _schedule_version(conn, date):
+    row = conn.execute("SELECT version FROM schedule_versions WHERE date = ?", (date,)).fetchone()
+    return row[0] if row else 0
+
+
+def _load_day(conn, date, pending=()):
+    # pending: (service, start_time) of bookings not in the database yet
+    day = DaySchedule()
+    rows = conn.execute(
+        "SELECT service, start_time FROM appointments WHERE status IN ('pending', 'done') AND date = ?",
+        (date,)
+    )
+    for service, start_time in list(rows) + list(pending):
+        day.add(slot_index(start_time) if start_time else None, slots_needed(service))
+    return day
+
+
+class Scheduler:
+    """In-memory availability index over existing bookings, loaded from the database one day at a time.
+
+    Cached days are checked against schedule_versions on every use, so
+    bookings and cancellations made by other worker processes are seen.
+    Bookings confirmed but not yet written (see booking_queue) come from
+    pending_source and count as booked.
+    """
+
+    def __init__(self):
+        # Guards the cache; booking_locks serializes check-and-book per date
+        self.lock = threading.RLock()
+        # date -> (DaySchedule, schedule version it was loaded at)
+        self._days = {}
+        # date -> [(service, start_time)] of uncommitted bookings, or None
+        self.pending_source = None
+
+    def _pending(self, date):
+        # Read before the database: a booking committed in between is then
+        # counted twice at worst (the writer forgets the day afterwards),
+        # never missed
+        return self.pending_source(date) if self.pending_source else ()
+
+    def _day(self, date):
+        with database.connection() as conn:
+            version = _schedule_version(conn, date)
+            cached = self._days.get(date)
+            if cached is not None and cached[1] == version:
+                return cached[0]
+            if len(self._days) >= MAX_CACHED_DAYS:
+                self._days.clear()
+            pending = self._pending(date)
+            # Day and version from one snapshot, so a concurrent booking
+            # cannot slip in between them
+            conn.execute("BEGIN")
+            version = _schedule_version(conn, date)
+            day = _load_day(conn, date, pending)
+        self._days[date] = (day, version)
+        return day
+
+    def is_free(self, date, start_time, service):
+        """Check whether a service can start at start_time on date"""
+        start_slot = slot_index(start_time)
+        if start_slot is None:
+            return False
+        with self.lock:
+            return self._day(date).fits(start_slot, slots_needed(service))
+
+    def find_start(self, date, service, preferred_time=None):
+        """Return preferred_time if it is free, else the earliest free start time that day, else None"""
+        with self.lock:
+            return _first_fit(self._day(date), slots_needed(service), preferred_time)
+
+    def suggest_times(self, date, service, around_time=None, limit=3):
+        """Free start times on date, nearest to around_time first (earliest first without one)"""
+        length = slots_needed(service)
+        around_slot = 0
+        if around_time:
+            try:
+                around_slot = (_minutes(around_time) - OPEN_MINUTES) // SLOT_MINUTES
+            except ValueError:
+                pass
+        with self.lock:
+            day = self._day(date)
+            free = [slot for slot in range(SLOTS_PER_DAY - length + 1) if day.fits(slot, length)]
+        free.sort(key=lambda slot: (abs(slot - around_slot), slot))
+        return [_time_str(OPEN_MINUTES + slot * SLOT_MINUTES) for slot in free[:limit]]
+
+    def suggest_dates(self, date, service, limit=3, horizon_days=30):
+        """The next dates after date that still have a free start time for service"""
+        suggestions = []
+        day = datetime.strptime(date, "%Y-%m-%d").date()
+        for offset in range(1, horizon_days + 1):
+            candidate = (day + timedelta(days=offset)).strftime("%Y-%m-%d")
+            if self.find_start(candidate, service):
+                suggestions.append(candidate)
+                if len(suggestions) >= limit:
+                    break
+        return suggestions
+
+    def verify_in_db(self, conn, date, start_time, service):
+        """Re-check a slot against the database inside the booking transaction.
+
+        Other worker processes book into the same file, so the cached day is
+        refreshed from conn (which should hold the write lock) before deciding.
+        """
+        with self.lock:
+            day = _load_day(conn, date, self._pending(date))
+            self._days[date] = (day, _schedule_version(conn, date))
+            return day.fits(slot_index(start_time), slots_needed(service))
+
+    def plan_in_db(self, conn, bookings):
+        """Pick start times for many bookings inside one transaction.
+
+        bookings is a list of (date, service, preferred_time). Days are read
+        from conn (which should hold the write lock) and each placed booking
+        counts against the ones after it. Returns a start time or None per
+        booking; call forget() for the dates once the transaction commits.
+        """
+        days = {}
+        starts = []
+        for date, service, preferred_time in bookings:
+            day = days.get(date)
+            if day is None:
+                day = days[date] = _load_day(conn, date, self._pending(date))
+            length = slots_needed(service)
+            start_time = _first_fit(day, length, preferred_time)
+            if start_time is not None:
+                day.add(slot_index(start_time), length)
+            starts.append(start_time)
+        return starts
+
+    def reserve(self, date, start_time, service, committed=True):
+        """Record a booking that has been committed (or, with committed=False, queued for writing)"""
+        with self.lock:
+            # A day that is not cached will be loaded with this booking in it
+            cached = self._days.get(date)
+            if cached is not None:
+                day, version = cached
+                day.add(slot_index(start_time), slots_needed(service))
+                # The insert bumped the version once; keep the cache valid
+                self._days[date] = (day, version + 1 if committed else version)
+
+    def forget(self, date):
+        """Drop a cached day so it is reloaded, e.g. after a cancellation"""
+        with self.lock:
+            self._days.pop(date, None)
+
+
+scheduler = Scheduler()
@@ -7,6 +7,46 @@ document.addEventListener('DOMContentLoaded', function () {
     // Backend URL
     const backendUrl = 'http://localhost:5000';
 
+    // Session id handed out by the server; sent back so each browser keeps its own conversation
+    let sessionId = null;
+    // True while a message is waiting for its reply, so a double Enter sends it once
+    let sending = false;
+    // Slots as last reported by the server and their version; sending the
+    // version lets the server answer with only the slots that changed
+    let appointmentInfo = {};
+    let infoVersion = null;
+
+    // Network failures are retried with the same Idempotency-Key, so the
+    // server answers a retry with the original reply instead of a second turn
+    const SEND_ATTEMPTS = 3;
+
+    function newIdempotencyKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
+    async function postWithRetry(url, body, idempotencyKey) {
+        for (let attempt = 1; ; attempt++) {
+            try {
+                return await fetch(url, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'Idempotency-Key': idempotencyKey
+                    },
+                    body: JSON.stringify(body)
+                });
+            } catch (error) {
+                if (attempt >= SEND_ATTEMPTS) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+            }
+        }
+    }
+
     function addMessage(text, isUser) {
         const messageDiv = document.createElement('div');
         messageDiv.classList.add('message');
@@ -14,6 +54,39 @@ document.addEventListener('DOMContentLoaded', function () {
         messageDiv.textContent = text;
         messagesContainer.appendChild(messageDiv);
         messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        return messageDiv;
+    }
+
+    function setMessageText(messageDiv, text) {
+        messageDiv.textContent = text;
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    }
+
+    // Parse one Server-Sent Event block ("event: ...\ndata: ...")
+    function parseEvent(block) {
+        let event = 'message';
+        let data = '';
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                data += line.slice(5).trim();
+            }
+        }
+        return { event, data: data ? JSON.parse(data) : {} };
+    }
+
+    // Take the slots from a response: the full set, or a delta to apply to ours
+    function applyAppointmentInfo(data) {
+        if (data.appointmentInfo) {
+            appointmentInfo = Object.assign({}, data.appointmentInfo);
+        } else if (data.appointmentInfoDelta) {
+            Object.assign(appointmentInfo, data.appointmentInfoDelta);
+        } else {
+            return;
+        }
+        infoVersion = data.infoVersion === undefined ? null : data.infoVersion;
+        updateStatus(appointmentInfo);
     }
 
     function updateStatus(appInfo) {
@@ -64,39 +137,77 @@ document.addEventListener('DOMContentLoaded', function () {
 
     async function sendMessage() {
         const message = userInput.value.trim();
-        if (!message) return;
+        if (!message || sending) return;
 
+        sending = true;
         addMessage(message, true);
         userInput.value = '';
 
         try {
-            const response = await fetch(`${backendUrl}/chat`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({ message })
-            });
-
-            const data = await response.json();
-            addMessage(data.reply, false);
-
-            if (data.appointmentInfo) {
-                updateStatus(data.appointmentInfo);
+            const body = { message, sessionId };
+            if (infoVersion !== null) {
+                body.infoVersion = infoVersion;
+            }
+            const response = await postWithRetry(`${backendUrl}/chat/stream`, body, newIdempotencyKey());
+
+            // Show tool results as they arrive, then the answer token by token
+            const botMessage = addMessage('…', false);
+            let toolText = '';
+            let answerText = '';
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const { event, data } = parseEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+
+                    if (event === 'tool') {
+                        toolText += (toolText ? '\n' : '') + data.output;
+                        setMessageText(botMessage, toolText);
+                    } else if (event === 'token') {
+                        answerText += data.text;
+                        setMessageText(botMessage, answerText);
+                    } else if (event === 'done') {
+                        if (data.sessionId) {
+                            sessionId = data.sessionId;
+                        }
+                        setMessageText(botMessage, data.reply);
+                        applyAppointmentInfo(data);
+                    } else if (event === 'error') {
+                        setMessageText(botMessage, data.reply);
+                    }
+                }
             }
         } catch (error) {
             console.error('Error:', error);
             addMessage('Sorry, there was an error processing your request.', false);
+        } finally {
+            sending = false;
         }
     }
 
     async function resetChat() {
         try {
             const response = await fetch(`${backendUrl}/reset`, {
-                method: 'POST'
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ sessionId })
             });
 
             const data = await response.json();
+            if (data.sessionId) {
+                sessionId = data.sessionId;
+            }
 
             // Clear messages except the first one
             while (messagesContainer.childNodes.length > 1) {
@@ -107,9 +218,7 @@ document.addEventListener('DOMContentLoaded', function () {
             addMessage(data.reply, false);
 
             // Reset status
-            if (data.appointmentInfo) {
-                updateStatus(data.appointmentInfo);
-            }
+            applyAppointmentInfo(data);
 
             document.getElementById('ticket-number').style.display = 'none';
 
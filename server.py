@@ -1,53 +1,379 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-print("Starting script...")
+import asyncio
+import functools
+import json
+import os
+import queue
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import metrics
+from app_logging import agent_tracing, get_logger, setup_logging
+from conversation_memory import POLICIES
+from idempotency import IDEMPOTENCY_WAIT_SECONDS, chat_replies
+
+setup_logging()
+log = get_logger("server")
+log.info("Starting script...")
 
 try:
-    from appointment_create_agent import agent, appointment_info
-    print("Imported agent successfully.")
+    from appointment_create_agent import (
+        AGENT_WARMUP, BATCH_MAX_ROWS, STAFF_PASSCODE, book_appointments_batch, booking_queue,
+        fetch_appointments_page, initialize_database, session_store, warm_up_agent
+    )
+    from date_resolution import resolve_date
+    from slot_extractor import canonical_service
+    from chat_router import router
+    from response_cache import response_cache
+    from reports import GRANULARITIES, summary_report, trend_report
+    log.info("Imported agent successfully.")
+    initialize_database()
+    if AGENT_WARMUP == "background":
+        warm_up_agent()
 except Exception as e:
-    print(f"Failed to import agent: {e}")
-    agent = None
-    appointment_info = {}
+    log.exception("Failed to import agent: %s", e)
+    session_store = None
+    router = None
+    response_cache = None
 
 
 
 app = Flask(__name__)
 
 # Enable CORS for the Flask app
-CORS(app)
+CORS(app, expose_headers=["Server-Timing", "Idempotent-Replayed"])
+
+
+RESET_REPLY = "Appointment reset successfully. 📝 Hi! I'm your appointment booking assistant. Please tell me your name, email, service, and preferred date. 🔐 If you want to log in as staff member, then enter the passcode."
+
+
+def chat_payload(session, bot_response, routing, profile=None, body=None):
+    """Build the /chat response body; shared with the async server.
+
+    A request body carrying the infoVersion of the slots the client already
+    has gets appointmentInfoDelta (the slots changed since) instead of the
+    full appointmentInfo. A version the session does not recognize (e.g.
+    from an expired session) gets the full slots.
+    """
+    appointment_info = session.appointment_info
+    
+    payload = {
+        "reply": bot_response,
+        "isComplete": appointment_info.is_complete,
+        "infoVersion": appointment_info.tag,
+        "sessionId": session.session_id,
+        "routing": routing
+    }
+    delta = appointment_info.delta_since(body.get("infoVersion")) if body else None
+    if delta is None:
+        payload["appointmentInfo"] = appointment_info.to_dict()
+    else:
+        payload["appointmentInfoDelta"] = delta
+    if profile is not None:
+        payload["profile"] = profile
+    return payload
+
+
+STILL_RUNNING_REPLY = "⏳ Your previous message is still being processed. Please wait a moment."
+# Marks a response that repeats the stored reply to an earlier request with the same key
+REPLAYED_HEADERS = {"Idempotent-Replayed": "true"}
+
+
+def idempotency_key(header_value):
+    """The request's Idempotency-Key, or None; overlong keys are ignored"""
+    return header_value if header_value and len(header_value) <= 255 else None
+
+
+def replayed_reply(future):
+    """(status, payload) of the first request with a repeated key, waiting for it if it is still running"""
+    try:
+        return future.result(timeout=IDEMPOTENCY_WAIT_SECONDS)
+    except FutureTimeoutError:
+        return 409, {"reply": STILL_RUNNING_REPLY}
+
+
+def memory_policy_error(body):
+    """(400, payload) if the body names an unknown memoryPolicy, else None; shared with the async server"""
+    name = body.get("memoryPolicy")
+    if name is not None and name not in POLICIES:
+        return 400, {"reply": f"Unknown memoryPolicy {name!r}; expected one of {', '.join(POLICIES)}."}
+    return None
+
+
+def session_for(body):
+    """Load or create the session a request body names, applying its memoryPolicy choice"""
+    return session_store.get_or_create(body.get("sessionId"), memory_policy=body.get("memoryPolicy"))
+
+
+def wants_profile(header_value):
+    """Whether a request's X-Profile header asks for its spans"""
+    return metrics.PROFILE_HEADER_ENABLED and header_value == "1"
+
+
+def reset_payload(session):
+    """Build the /reset response body; shared with the async server"""
+    return {"reply": RESET_REPLY, "appointmentInfo": session.appointment_info.to_dict(),
+            "infoVersion": session.appointment_info.tag, "sessionId": session.session_id}
+
+
+def stats_payload():
+    """Build the /stats response body; shared with the async server"""
+    payload = {"routing": router.stats(), "responseCache": response_cache.stats()}
+    if booking_queue is not None:
+        payload["bookingQueue"] = booking_queue.stats()
+    return payload
+
+
+def batch_booking(body):
+    """Handle a /appointments/batch request body; returns (status, payload). Shared with the async server"""
+    if body.get("passcode") != STAFF_PASSCODE:
+        return 401, {"error": "Staff passcode required."}
+    rows = body.get("appointments")
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return 400, {"error": "appointments must be a list of objects."}
+    if len(rows) > BATCH_MAX_ROWS:
+        return 413, {"error": f"At most {BATCH_MAX_ROWS} appointments per batch."}
+    return 200, book_appointments_batch(rows)
+
+
+# Rows fetched per query while streaming a listing
+STREAM_PAGE_SIZE = 500
+LISTING_FILTERS = ("name", "email", "service", "date", "status")
+
+
+def _listing_row(row):
+    _, name, email, service, date, ticket_number, status, start_time = row
+    return {"ticketNumber": ticket_number, "name": name, "email": email, "service": service,
+            "date": date, "startTime": start_time, "status": status}
+
+
+def appointment_listing(args, passcode):
+    """Validate a GET /appointments request; returns (status, payload) or (200, generator of JSON chunks).
+
+    Shared with the async server. The generator fetches one page per chunk,
+    so a listing of any size is streamed without being loaded at once.
+    """
+    if passcode != STAFF_PASSCODE:
+        return 401, {"error": "Staff passcode required."}
+
+    filters = {key: args.get(key) or None for key in LISTING_FILTERS}
+    if filters["service"]:
+        filters["service"] = canonical_service(filters["service"])
+    if filters["date"]:
+        filters["date"] = resolve_date(filters["date"])
+        if not filters["date"]:
+            return 400, {"error": "Unrecognized date."}
 
-print("Starting script...")  # Should print no matter what
+    after = None
+    if args.get("after"):
+        date, _, row_id = args["after"].rpartition(":")
+        if not date or not row_id.isdigit():
+            return 400, {"error": "Invalid cursor."}
+        after = (date, int(row_id))
+
+    limit = None
+    if args.get("limit"):
+        if not str(args["limit"]).isdigit() or int(args["limit"]) < 1:
+            return 400, {"error": "limit must be a positive integer."}
+        limit = int(args["limit"])
+
+    def chunks():
+        yield '{"appointments": ['
+        cursor, sent = after, 0
+        while True:
+            page_size = STREAM_PAGE_SIZE if limit is None else min(STREAM_PAGE_SIZE, limit - sent)
+            rows, cursor = fetch_appointments_page(filters, page_size, cursor)
+            if rows:
+                yield ("," if sent else "") + ",".join(json.dumps(_listing_row(row)) for row in rows)
+            sent += len(rows)
+            if cursor is None or (limit is not None and sent >= limit):
+                break
+        next_cursor = f"{cursor[0]}:{cursor[1]}" if cursor else None
+        yield f'], "nextCursor": {json.dumps(next_cursor)}}}'
+
+    return 200, chunks()
+
+
+def staff_report(kind, args, passcode):
+    """Build GET /reports/<kind> for staff; returns (status, payload). Shared with the async server."""
+    if passcode != STAFF_PASSCODE:
+        return 401, {"error": "Staff passcode required."}
+    if kind not in ("summary", "trend"):
+        return 404, {"error": "Unknown report."}
+
+    bounds = {}
+    for key in ("from", "to"):
+        if args.get(key):
+            bounds[key] = resolve_date(args[key])
+            if not bounds[key]:
+                return 400, {"error": f"Unrecognized {key} date."}
+    start, end = bounds.get("from"), bounds.get("to")
+    if start and end and start > end:
+        return 400, {"error": "from must not be after to."}
+
+    if kind == "summary":
+        return 200, summary_report(start, end)
+    granularity = args.get("granularity") or "day"
+    if granularity not in GRANULARITIES:
+        return 400, {"error": f"granularity must be one of {', '.join(GRANULARITIES)}."}
+    return 200, trend_report(start, end, granularity)
+
+
+def sse_event(event, data):
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def replayed_events(status, payload):
+    """The SSE events repeating a stored reply"""
+    return sse_event("done" if status == 200 else "error", payload)
+
+
+async def chat_stream_events(session, user_input, on_reply=None, body=None, **kwargs):
+    """Yield a chat turn as encoded SSE events; shared with the async server.
+
+    on_reply, if given, is called with the turn's (status, payload) once it
+    is known; body is the request body, for chat_payload.
+    """
+    try:
+        async for event, data in router.astream(session, user_input, **kwargs):
+            if event == "done":
+                await asyncio.get_running_loop().run_in_executor(None, session_store.save, session)
+                data = chat_payload(session, data["reply"], data["routing"], body=body)
+                if on_reply:
+                    on_reply(200, data)
+            yield sse_event(event, data)
+    except Exception as e:
+        metrics.errors_total.inc("request", "chat_stream")
+        if on_reply:
+            on_reply(500, {"reply": f"Error: {str(e)}"})
+        yield sse_event("error", {"reply": f"Error: {str(e)}"})
+
+
+def run_chat(body, profile_enabled, trace):
+    """Answer one /chat request body; returns (status, payload)"""
+    try:
+        session = session_for(body)
+        with metrics.profiled(profile_enabled) as profile, agent_tracing(trace):
+            bot_response, routing = router.handle(session, body.get('message', ''))
+        session_store.save(session)
+        return 200, chat_payload(session, bot_response, routing, profile, body)
+    except Exception as e:
+        metrics.errors_total.inc("request", "chat")
+        return 500, {"reply": f"Error: {str(e)}"}
 
 
 @app.route('/chat', methods=['POST'])
 def chat():
-    user_input = request.json.get('message', '')
+    body = request.get_json(silent=True) or {}
+    invalid = memory_policy_error(body)
+    if invalid:
+        return jsonify(invalid[1]), invalid[0]
+    key = idempotency_key(request.headers.get('Idempotency-Key'))
+    if key:
+        future, owner = chat_replies.claim(body.get('sessionId'), key)
+        if not owner:
+            status, payload = replayed_reply(future)
+            return jsonify(payload), status, REPLAYED_HEADERS
+
+    status, payload = 500, {"reply": "Error: request failed"}
     try:
-        response = agent.invoke({"input": user_input})
-        bot_response = response["output"]
-        
-        # Check if appointment is complete
-        is_complete = all(appointment_info.values())
-        
-        return jsonify({
-            "reply": bot_response,
-            "isComplete": is_complete,
-            "appointmentInfo": appointment_info
-        })
-    except Exception as e:
-        return jsonify({"reply": f"Error: {str(e)}"}), 500
+        status, payload = run_chat(body, wants_profile(request.headers.get('X-Profile')),
+                                   request.headers.get('X-Agent-Trace') == '1')
+    finally:
+        if key:
+            chat_replies.finish(body.get('sessionId'), key, future, status, payload)
+    response = jsonify(payload)
+    if "profile" in payload:
+        response.headers['Server-Timing'] = metrics.server_timing(payload["profile"])
+    return response, status
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    body = request.get_json(silent=True) or {}
+    invalid = memory_policy_error(body)
+    if invalid:
+        return jsonify(invalid[1]), invalid[0]
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    key = idempotency_key(request.headers.get('Idempotency-Key'))
+    future = None
+    if key:
+        future, owner = chat_replies.claim(body.get('sessionId'), key)
+        if not owner:
+            return Response(replayed_events(*replayed_reply(future)), mimetype='text/event-stream',
+                            headers=dict(headers, **REPLAYED_HEADERS))
+    # Called with (status, payload) once the turn's reply is known
+    on_reply = functools.partial(chat_replies.finish, body.get('sessionId'), key, future) if key else None
+
+    session = session_for(body)
+    trace = request.headers.get('X-Agent-Trace') == '1'
+    events = queue.Queue()
+
+    # The agent streams through asyncio; run it on its own loop and hand the
+    # encoded events to the response generator as they are produced.
+    async def produce():
+        try:
+            with agent_tracing(trace):
+                async for chunk in chat_stream_events(session, body.get('message', ''), on_reply, body):
+                    events.put(chunk)
+        finally:
+            if on_reply:
+                # Releases waiting repeats if the turn never finished
+                on_reply(500, {"reply": "Error: request failed"})
+            events.put(None)
+
+    threading.Thread(target=asyncio.run, args=(produce(),), daemon=True).start()
+
+    def generate():
+        while True:
+            chunk = events.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    return Response(generate(), mimetype='text/event-stream', headers=headers)
+
+@app.route('/appointments/batch', methods=['POST'])
+def appointments_batch():
+    status, payload = batch_booking(request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+@app.route('/appointments', methods=['GET'])
+def appointments():
+    status, payload = appointment_listing(request.args, request.headers.get('X-Staff-Passcode'))
+    if status != 200:
+        return jsonify(payload), status
+    return Response(payload, mimetype='application/json')
+
+@app.route('/reports/<kind>', methods=['GET'])
+def reports(kind):
+    status, payload = staff_report(kind, request.args, request.headers.get('X-Staff-Passcode'))
+    return jsonify(payload), status
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify(stats_payload())
 
 @app.route('/reset', methods=['POST'])
 def reset():
-    # Reset appointment info
-    for key in appointment_info:
-        appointment_info[key] = None
-    return jsonify({"reply": "Appointment reset successfully. 📝 Hi! I'm your appointment booking assistant. Please tell me your name, email, service, and preferred date. 🔐 If you want to log in as staff member, then enter the passcode.", "appointmentInfo": appointment_info})
+    # Reset appointment info, staff mode and chat history for this session
+    body = request.get_json(silent=True) or {}
+    invalid = memory_policy_error(body)
+    if invalid:
+        return jsonify(invalid[1]), invalid[0]
+    session = session_for(body)
+    session.reset()
+    session_store.save(session)
+    return jsonify(reset_payload(session))
 
 if __name__ == '__main__':
-    print("Starting appointment booking server on port 5000...")
-    app.run(host='0.0.0.0', port=5000)
+    port = int(os.environ.get("PORT", 5000))
+    log.info("Starting appointment booking server on port %d...", port)
+    app.run(host='0.0.0.0', port=port)
 
 
 
@@ -0,0 +1,365 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from conversation_memory import default_memory_policy, get_memory_policy
+
+# "memory" keeps sessions in this process; "sqlite" shares them between
+# worker processes through SESSION_DB_PATH
+SESSION_STORE = os.environ.get("SESSION_STORE", "memory")
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "sessions.db")
+# Seconds between sweeps of expired rows in the SQLite store
+SESSION_PURGE_INTERVAL = int(os.environ.get("SESSION_PURGE_INTERVAL", 60))
+
+
+SLOT_FIELDS = ("name", "email", "service", "date")
+
+
+class AppointmentInfo:
+    """The booking slots of one session, read like the dict it replaced.
+
+    Every change bumps version and stamps the slot with it, so delta_since
+    tells a client which slots moved since the version it last saw, and
+    renderings kept with cached() are rebuilt only after a slot changes.
+    Versions are told apart from those of other slot sets (say, an expired
+    session whose id was reused) by a random epoch.
+    """
+
+    __slots__ = ("version", "_values", "_versions", "_epoch", "_cache")
+
+    def __init__(self, values=None, versions=None, epoch=None):
+        self._values = dict.fromkeys(SLOT_FIELDS)
+        # field -> version of its last change
+        self._versions = dict.fromkeys(SLOT_FIELDS, 0)
+        if values:
+            for field in SLOT_FIELDS:
+                self._values[field] = values.get(field)
+        if versions:
+            self._versions.update((field, versions[field]) for field in SLOT_FIELDS if field in versions)
+        self.version = max(self._versions.values())
+        # Made on first use; most slot sets are never sent to a client
+        self._epoch = epoch
+        # name -> (version it was built at, value)
+        self._cache = {}
+
+    def __getitem__(self, field):
+        return self._values[field]
+
+    def __setitem__(self, field, value):
+        if field not in self._values:
+            raise KeyError(field)
+        if self._values[field] != value:
+            self._values[field] = value
+            self.version += 1
+            self._versions[field] = self.version
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, field):
+        return field in self._values
+
+    def __repr__(self):
+        return f"AppointmentInfo({self._values!r}, version={self.version})"
+
+    def keys(self):
+        return self._values.keys()
+
+    def values(self):
+        return self._values.values()
+
+    def items(self):
+        return self._values.items()
+
+    def get(self, field, default=None):
+        return self._values.get(field, default)
+
+    def update(self, values=(), **more):
+        for field, value in dict(values, **more).items():
+            self[field] = value
+
+    def clear(self):
+        """Empty every slot; versions keep counting so clients see the reset as a change"""
+        for field in SLOT_FIELDS:
+            self[field] = None
+
+    def copy(self):
+        """A plain dict of the slots"""
+        return self._values.copy()
+
+    def cached(self, name, build):
+        """build(self), reused until a slot changes"""
+        entry = self._cache.get(name)
+        if entry is None or entry[0] != self.version:
+            entry = self._cache[name] = (self.version, build(self))
+        return entry[1]
+
+    def to_dict(self):
+        """The slots as a dict, shared until they change; do not modify it"""
+        return self.cached("dict", AppointmentInfo.copy)
+
+    @property
+    def is_complete(self):
+        return all(self._values.values())
+
+    @property
+    def epoch(self):
+        if self._epoch is None:
+            self._epoch = secrets.token_hex(4)
+        return self._epoch
+
+    @property
+    def tag(self):
+        """Opaque "<epoch>.<version>" handed to clients"""
+        return f"{self.epoch}.{self.version}"
+
+    def changed_since(self, version):
+        """The slots changed after version, as a dict"""
+        return {field: self._values[field] for field, changed in self._versions.items() if changed > version}
+
+    def delta_since(self, tag):
+        """The slots changed since the version tagged tag, or None if tag is not a version of these slots"""
+        if not isinstance(tag, str):
+            return None
+        epoch, _, version = tag.partition(".")
+        if epoch != self.epoch or not version.isdigit() or int(version) > self.version:
+            return None
+        return self.changed_since(int(version))
+
+    def versions(self):
+        """field -> version of its last change"""
+        return dict(self._versions)
+
+
+def empty_appointment_info():
+    """Return a fresh, empty set of appointment slots"""
+    return AppointmentInfo()
+
+
+class Session:
+    """Conversation state for one chat user: slots, staff mode and chat history"""
+
+    __slots__ = ("session_id", "appointment_info", "preferred_time", "is_staff_mode", "history", "summary",
+                 "memory", "listing", "last_seen")
+
+    def __init__(self, session_id, memory=None):
+        self.session_id = session_id
+        self.appointment_info = empty_appointment_info()
+        # Optional HH:MM start time the customer asked for
+        self.preferred_time = None
+        self.is_staff_mode = False
+        # Chat history is kept as (is_user, text) tuples and only turned into
+        # LangChain message objects when the agent is invoked.
+        self.history = []
+        # Rolling summary of turns the memory policy folded out of history
+        self.summary = ""
+        # Policy that bounds history after each turn (see conversation_memory)
+        self.memory = memory or default_memory_policy
+        # (filters, next page cursor, rows shown) of an unfinished staff listing
+        self.listing = None
+        self.last_seen = time.monotonic()
+
+    def reset(self):
+        """Clear slots, staff mode and chat history"""
+        self.appointment_info.clear()
+        self.preferred_time = None
+        self.is_staff_mode = False
+        self.history = []
+        self.summary = ""
+        self.listing = None
+
+    def add_turn(self, user_text, bot_text):
+        """Record one user/bot exchange in the chat history, then apply the memory policy"""
+        self.history.append((True, user_text))
+        self.history.append((False, bot_text))
+        self.history, self.summary = self.memory.compact(self.history, self.summary)
+
+    def to_state(self):
+        """JSON-serializable copy of what the session remembers"""
+        return {
+            "appointmentInfo": self.appointment_info.to_dict(),
+            "slotVersions": self.appointment_info.versions(),
+            "slotEpoch": self.appointment_info.epoch,
+            "preferredTime": self.preferred_time,
+            "isStaffMode": self.is_staff_mode,
+            "history": self.history,
+            "summary": self.summary,
+            "listing": self.listing,
+            "memoryPolicy": self.memory.name,
+        }
+
+    @classmethod
+    def from_state(cls, session_id, state):
+        """Rebuild a session saved with to_state"""
+        session = cls(session_id)
+        # Sessions saved before slot versions were kept start a new epoch
+        session.appointment_info = AppointmentInfo(state["appointmentInfo"], state.get("slotVersions"),
+                                                   state.get("slotEpoch"))
+        session.preferred_time = state["preferredTime"]
+        session.is_staff_mode = state["isStaffMode"]
+        session.history = [tuple(turn) for turn in state["history"]]
+        session.summary = state["summary"]
+        # Sessions saved before the policy was kept use the default
+        session.memory = get_memory_policy(state.get("memoryPolicy"))
+        if state["listing"]:
+            filters, cursor, shown = state["listing"]
+            session.listing = (filters, tuple(cursor) if cursor else None, shown)
+        return session
+
+    def history_messages(self):
+        """Return the chat history as LangChain messages for the agent prompt"""
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        messages = [HumanMessage(content=f"(Summary of our earlier conversation)\n{self.summary}")] if self.summary else []
+        return messages + [HumanMessage(content=text) if is_user else AIMessage(content=text)
+                           for is_user, text in self.history]
+
+
+class SessionStore:
+    """In-memory session store with idle TTL and LRU eviction"""
+
+    def __init__(self, ttl_seconds=1800, max_sessions=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, session_id=None, memory_policy=None):
+        """Return the live session for session_id, creating a new one if it is unknown or expired.
+
+        memory_policy, if given, names the memory policy the session uses from
+        now on (ValueError if there is no such policy).
+        """
+        memory = get_memory_policy(memory_policy) if memory_policy else None
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None and now - session.last_seen > self.ttl_seconds:
+                del self._sessions[session_id]
+                session = None
+
+            if session is None:
+                session = Session(session_id or secrets.token_urlsafe(16))
+                self._sessions[session.session_id] = session
+                self._evict(now)
+            else:
+                self._sessions.move_to_end(session_id)
+
+            session.last_seen = now
+            if memory is not None:
+                session.memory = memory
+            return session
+
+    def save(self, session):
+        """Persist a session after a request; sessions here are live objects, so nothing to do"""
+
+    def discard(self, session_id):
+        """Drop a session if it exists"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self, now):
+        # Oldest entries sit at the front, so expired sessions are found there
+        # first; anything beyond max_sessions is dropped in LRU order.
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_seen > self.ttl_seconds or len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            else:
+                break
+
+
+class SQLiteSessionStore:
+    """Session store shared by worker processes through a SQLite file.
+
+    get_or_create loads a session at the start of a request and save writes
+    it back at the end. A user chats one turn at a time, so the last write
+    wins if two workers ever serve the same session at once.
+    """
+
+    def __init__(self, path=SESSION_DB_PATH, ttl_seconds=1800):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._last_purge = 0.0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(session_id TEXT PRIMARY KEY, state TEXT NOT NULL, last_seen REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_seen ON sessions(last_seen)")
+
+    def _connection(self):
+        # One connection per thread; used as a context manager it commits
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_or_create(self, session_id=None, memory_policy=None):
+        """Return the stored session for session_id, or a new one if it is unknown or expired.
+
+        memory_policy, if given, names the memory policy the session uses from
+        now on (ValueError if there is no such policy).
+        """
+        memory = get_memory_policy(memory_policy) if memory_policy else None
+        session = None
+        if session_id:
+            row = self._connection().execute(
+                "SELECT state FROM sessions WHERE session_id = ? AND last_seen > ?",
+                (session_id, time.time() - self.ttl_seconds)
+            ).fetchone()
+            if row:
+                session = Session.from_state(session_id, json.loads(row[0]))
+        if session is None:
+            session = Session(session_id or secrets.token_urlsafe(16))
+        if memory is not None:
+            session.memory = memory
+        return session
+
+    def save(self, session):
+        """Write a session back at the end of a request"""
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO sessions (session_id, state, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET state = excluded.state, last_seen = excluded.last_seen",
+                (session.session_id, json.dumps(session.to_state()), now)
+            )
+            if now - self._last_purge > SESSION_PURGE_INTERVAL:
+                self._last_purge = now
+                conn.execute("DELETE FROM sessions WHERE last_seen <= ?", (now - self.ttl_seconds,))
+
+    def discard(self, session_id):
+        """Drop a session if it exists"""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM sessions WHERE last_seen > ?", (time.time() - self.ttl_seconds,)
+        ).fetchone()[0]
+
+
+def build_session_store(kind=None, ttl_seconds=1800, max_sessions=10000):
+    """Build the store named by kind (SESSION_STORE if not given)"""
+    kind = kind or SESSION_STORE
+    if kind == "memory":
+        return SessionStore(ttl_seconds=ttl_seconds, max_sessions=max_sessions)
+    if kind == "sqlite":
+        # Rows expire by TTL; disk is not bounded by max_sessions
+        return SQLiteSessionStore(ttl_seconds=ttl_seconds)
+    raise ValueError(f"Unknown SESSION_STORE {kind!r}; expected memory or sqlite")
@@ -0,0 +1,292 @@
+"""Single-pass slot extraction for chat messages and staff queries.
+
+All patterns are compiled and the keyword trie is built once at import.
+Each message is lowercased once and scanned once by a master token pattern;
+values that follow a cue ("my name is", "service:", "on", ...) are read
+with anchored matches at the cue's end instead of rescanning the text.
+"""
+import re
+import time
+from typing import NamedTuple, Optional, Tuple
+
+from migrations import SERVICES
+
+DATE_WORDS = ["tomorrow", "today", "next week", "next month"]
+
+# Status keyword -> stored status value; earlier entries win
+STATUS_KEYWORDS = [
+    (("done", "completed", "finish", "ended"), "done"),
+    (("pending", "upcoming", "scheduled", "future"), "pending"),
+    (("cancel", "cancelled", "canceled"), "cancel"),
+]
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<email>\b[\w.-]+@[\w.-]+\.\w+\b)
+  | (?P<iso_date>\b\d{4}-\d{2}-\d{2}\b)
+  | (?P<numeric_date>\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b)
+  | (?P<time>\b\d{1,2}(?::\d{2})?\s*(?:am|pm)\b|\b\d{1,2}:\d{2}\b)
+  | (?P<ticket>\bAPPT-\d+\b)
+  | (?P<name_cue>\b(?:my\s+name\s+is|name\s+is|i\s+am|i'm|this\s+is|call\s+me)\b|\bname\s*[:-])
+  | (?P<service_cue>\b(?:service\s+is|i\s+need|need\s+a)\b|\bservice\s*[:-])
+  | (?P<date_cue>\b(?:date\s+is|on|for)\b|\bdate\s*[:-])
+""", re.IGNORECASE | re.VERBOSE)
+
+EMAIL_PATTERN = re.compile(r"[\w.-]+@[\w.-]+\.\w+")
+NAME_VALUE_PATTERN = re.compile(r"\s*([A-Za-z]+(?:[ \t]+[A-Za-z]+){0,2})")
+# A message that is only a name, or starts with one followed by a comma
+LEADING_NAME_PATTERN = re.compile(r"\s*([A-Za-z]+(?:[ \t]+[A-Za-z]+){0,2})\s*(?:,|$)")
+SERVICE_VALUE_PATTERN = re.compile(r"\s+(.+?)(?:,|\.|$|\band\b)", re.IGNORECASE)
+DATE_VALUE_PATTERN = re.compile(r"\s+(\S+(?:\s+\S+)*?)(?:,|\.|$)")
+TIME_VALUE_PATTERN = re.compile(r"(\d{1,2})(?::(\d{2}))?\s*(am|pm)?", re.IGNORECASE)
+
+STAFF_NAME_PATTERN = re.compile(r"name\s*(is)?\s*([A-Za-z\s]+)", re.IGNORECASE)
+INCOME_DATE_PATTERN = re.compile(r"(?:date|on|for)\s+(.+?)(?:,|\.|$)", re.IGNORECASE)
+INCOME_SERVICE_PATTERN = re.compile(r"(?:service|type)\s+(.+?)(?:,|\.|$)", re.IGNORECASE)
+INCOME_RANGE_PATTERN = re.compile(r"between\s+(.+?)\s+and\s+(.+?)(?:,|\.|$)", re.IGNORECASE)
+
+# Words that end a name read after a cue ("I am Ann and ...")
+NAME_STOP_WORDS = frozenset([
+    "and", "my", "email", "service", "date", "i", "need", "want", "would", "like", "for", "on", "at",
+    "with", "is", "to", "book", "please", "booking", "appointment",
+])
+# Words that mean the text after a cue is not a name ("I am looking for ...")
+NOT_A_NAME = frozenset([
+    "looking", "here", "booking", "trying", "interested", "going", "not", "just", "a", "an", "the",
+    "available", "free", "from", "fine", "good", "ok", "okay", "sure", "back", "new", "hi", "hello",
+    "hey", "thanks", "thank", "yes", "no", "status", "staff", "exit", "help", "show", "list", "cancel",
+])
+
+
+class KeywordTrie:
+    """Word-boundary keyword matcher built once from a fixed vocabulary.
+
+    Lookups walk the trie from each word start, so a message is scanned in a
+    single pass regardless of how many keywords there are.
+    """
+
+    _END = object()
+
+    def __init__(self, keywords):
+        self._root = {}
+        for keyword, value in keywords:
+            node = self._root
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[self._END] = value
+
+    def find_all(self, lowered, plural=True):
+        """Yield (start, value) for every keyword in lowered text, optionally allowing a plural "s" suffix"""
+        length = len(lowered)
+        for start in range(length):
+            if start and lowered[start - 1].isalnum():
+                continue
+            node = self._root
+            pos = start
+            while pos < length:
+                node = node.get(lowered[pos])
+                if node is None:
+                    break
+                pos += 1
+                value = node.get(self._END)
+                if value is not None:
+                    after = lowered[pos] if pos < length else " "
+                    if plural and after == "s":
+                        after = lowered[pos + 1] if pos + 1 < length else " "
+                    if not after.isalnum():
+                        yield start, value
+
+
+# Values are (category, payload, priority); lower priority wins within a category
+_KEYWORDS = [(service, ("service", service, index)) for index, service in enumerate(SERVICES)]
+_KEYWORDS += [(word, ("date_word", word, index)) for index, word in enumerate(DATE_WORDS)]
+_KEYWORDS += [(word, ("status", status, index))
+              for index, (words, status) in enumerate(STATUS_KEYWORDS) for word in words]
+KEYWORDS = KeywordTrie(_KEYWORDS)
+KEYWORD_WORDS = frozenset(word for keyword, _ in _KEYWORDS for word in keyword.split())
+
+
+class ExtractedSlots(NamedTuple):
+    """Slots found in one customer message; dates are left unresolved for the caller to parse"""
+    name: Optional[str]
+    email: Optional[str]
+    service: Optional[str]
+    # Date texts in the order they should be tried
+    date_candidates: Tuple[str, ...]
+    time: Optional[str]
+    ticket: Optional[str]
+    status: Optional[str]
+
+
+class StaffFilters(NamedTuple):
+    """Filters for a staff appointment listing"""
+    name: Optional[str]
+    email: Optional[str]
+    service: Optional[str]
+    date_text: Optional[str]
+    status: Optional[str]
+
+
+class IncomeFilters(NamedTuple):
+    """Filters for a staff income query"""
+    date_text: Optional[str]
+    service_text: Optional[str]
+    range_texts: Optional[Tuple[str, str]]
+
+
+def normalize_time(time_text):
+    """Turn "3pm" / "3:30 pm" / "15:30" into HH:MM, or None if it is not a valid time"""
+    time_match = TIME_VALUE_PATTERN.match(time_text)
+    if not time_match:
+        return None
+    hour, minute = int(time_match.group(1)), int(time_match.group(2) or 0)
+    if time_match.group(3):
+        hour = hour % 12 + (12 if time_match.group(3).lower() == "pm" else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+
+def canonical_service(service_text):
+    """Map free text such as "a haircut" to the one service it names.
+
+    Text naming no service, or several ("haircut and massage"), is returned
+    as it is. Bookings, staff filters and migration 3 all store services
+    through this, so old and new rows follow the same rule.
+    """
+    named = {service for _, (category, service, _) in KEYWORDS.find_all(service_text.lower()) if category == "service"}
+    if len(named) > 1:
+        # "appointment" is the generic service; another one named is meant
+        named.discard("appointment")
+    return named.pop() if len(named) == 1 else service_text
+
+
+def _clean_name(words):
+    parts = []
+    for word in words.split():
+        lowered = word.lower()
+        if lowered in NAME_STOP_WORDS or lowered in KEYWORD_WORDS or lowered[:-1] in KEYWORD_WORDS:
+            break
+        parts.append(word)
+    if not parts or parts[0].lower() in NOT_A_NAME:
+        return None
+    name = " ".join(parts)
+    return name.title() if len(name) >= 2 else None
+
+
+def _keyword_slots(lowered, plural=True):
+    best = {}
+    for _, (category, value, priority) in KEYWORDS.find_all(lowered, plural):
+        if category not in best or priority < best[category][1]:
+            best[category] = (value, priority)
+    return {category: value for category, (value, _) in best.items()}
+
+
+def extract_slots(text):
+    """Scan a customer message once and return every slot it mentions"""
+    return _scan(text)[0]
+
+
+def _scan(text):
+    # Returns the slots plus the raw keyword hits and the exact (numeric or
+    # ISO) dates, which staff filters use instead of the cue-based reading.
+    name = email = service = time_value = ticket = None
+    numeric_dates, iso_dates, phrase_dates = [], [], []
+
+    for token in TOKEN_PATTERN.finditer(text):
+        kind = token.lastgroup
+        if kind == "email":
+            email = email or token.group()
+        elif kind == "iso_date":
+            iso_dates.append(token.group())
+        elif kind == "numeric_date":
+            numeric_dates.append(token.group())
+        elif kind == "time":
+            time_value = time_value or normalize_time(token.group())
+        elif kind == "ticket":
+            ticket = ticket or token.group()
+        elif kind == "name_cue" and name is None:
+            value = NAME_VALUE_PATTERN.match(text, token.end())
+            if value:
+                name = _clean_name(value.group(1))
+        elif kind == "service_cue" and service is None:
+            value = SERVICE_VALUE_PATTERN.match(text, token.end())
+            if value:
+                service = canonical_service(value.group(1).strip())
+        elif kind == "date_cue":
+            value = DATE_VALUE_PATTERN.match(text, token.end())
+            if value:
+                phrase_dates.append(value.group(1))
+
+    if name is None:
+        leading = LEADING_NAME_PATTERN.match(text)
+        if leading:
+            name = _clean_name(leading.group(1))
+
+    keywords = _keyword_slots(text.lower())
+    if service is None:
+        service = keywords.get("service")
+    date_words = [keywords["date_word"]] if "date_word" in keywords else []
+
+    slots = ExtractedSlots(
+        name=name,
+        email=email,
+        service=service,
+        date_candidates=tuple(dict.fromkeys(numeric_dates + iso_dates + phrase_dates + date_words)),
+        time=time_value,
+        ticket=ticket,
+        status=keywords.get("status"),
+    )
+    return slots, keywords, numeric_dates + iso_dates
+
+
+def extract_staff_filters(text):
+    """Read listing filters (name, email, service, date, status) from a staff query"""
+    name_match = STAFF_NAME_PATTERN.search(text)
+    slots, _, exact_dates = _scan(text)
+    # Whole words only, so "appointments" is not read as the "appointment" service
+    keywords = _keyword_slots(text.lower(), plural=False)
+    return StaffFilters(
+        name=name_match.group(2).strip() if name_match else None,
+        email=slots.email,
+        service=keywords.get("service"),
+        date_text=exact_dates[0] if exact_dates else None,
+        status=keywords.get("status"),
+    )
+
+
+def extract_income_filters(text):
+    """Read date, service and date-range filters from a staff income query"""
+    date_match = INCOME_DATE_PATTERN.search(text)
+    service_match = INCOME_SERVICE_PATTERN.search(text)
+    range_match = INCOME_RANGE_PATTERN.search(text)
+    return IncomeFilters(
+        date_text=date_match.group(1) if date_match else None,
+        service_text=service_match.group(1).strip() if service_match else None,
+        range_texts=(range_match.group(1), range_match.group(2)) if range_match else None,
+    )
+
+
+BENCHMARK_MESSAGES = [
+    "Hi, my name is Ann Lee",
+    "ann.lee@example.com",
+    "I need a haircut on 12/05/2031, please",
+    "service: massage, date: 2031-05-12 at 3pm",
+    "Ann Lee, ann@example.com, facial, tomorrow",
+    "Can you book me in for next week? I'd like a manicure and pedicure.",
+]
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: per-message extraction cost
+    rounds = 20000
+    for message in BENCHMARK_MESSAGES:
+        extract_slots(message)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for message in BENCHMARK_MESSAGES:
+            extract_slots(message)
+    elapsed = time.perf_counter() - started
+    per_message_us = elapsed / (rounds * len(BENCHMARK_MESSAGES)) * 1e6
+    print(f"extract_slots: {per_message_us:.1f} µs per message ({rounds * len(BENCHMARK_MESSAGES)} messages)")
+    for message in BENCHMARK_MESSAGES:
+        print(f"  {message!r} -> {extract_slots(message)}")
@@ -0,0 +1,67 @@
+"""Import-time budget check for the servers.
+
+Imports each entry module in a fresh interpreter under `python -X importtime`
+and fails if the import takes longer than the budget or pulls in a module
+that should only load on first use (LangChain, the Gemini client, dateparser).
+Run before shipping changes that touch imports:
+
+    python startup_check.py
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+ENTRY_MODULES = ["server", "asgi_server"]
+# Milliseconds allowed for importing one entry module
+IMPORT_BUDGET_MS = float(os.environ.get("STARTUP_IMPORT_BUDGET_MS", 500))
+DEFERRED_MODULES = ["langchain", "langchain_core", "langchain_google_genai", "langchain_openai", "dateparser"]
+
+
+def import_times(module):
+    """Import module in a new interpreter; returns {imported module: cumulative microseconds}"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, AGENT_WARMUP="lazy", APPOINTMENT_DB_PATH=os.path.join(tmp, "startup.db"))
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True
+        )
+    if result.returncode:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def check(module):
+    """Return a list of problems with module's import cost (empty if within budget)"""
+    times = import_times(module)
+    total_ms = times.get(module, 0) / 1000
+    print(f"{module}: {total_ms:.0f} ms (budget {IMPORT_BUDGET_MS:.0f} ms)")
+    for name, micros in sorted(times.items(), key=lambda item: -item[1])[1:6]:
+        print(f"  {micros / 1000:7.1f} ms  {name}")
+
+    problems = []
+    if total_ms > IMPORT_BUDGET_MS:
+        problems.append(f"{module} took {total_ms:.0f} ms to import")
+    for name in DEFERRED_MODULES:
+        if name in times:
+            problems.append(f"{module} imports {name} at startup")
+    return problems
+
+
+if __name__ == "__main__":
+    problems = []
+    for module in ENTRY_MODULES:
+        problems += check(module)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if not problems:
+        print("✅ Startup within budget")
+    sys.exit(1 if problems else 0)
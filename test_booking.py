@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+import database
+from appointment_create_agent import book_appointment, initialize_database
+from scheduling import CHAIRS, DAILY_CAPACITY, SLOTS_PER_DAY, slot_index, slots_needed
+
+THREADS = 80
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    initialize_database()
+
+
+def _book_concurrently(date, services, preferred_time=None):
+    barrier = threading.Barrier(THREADS)
+    results = [None] * THREADS
+
+    def book(n):
+        barrier.wait()
+        results[n] = book_appointment(f"Guest {n}", f"guest{n}@example.com", services[n % len(services)],
+                                      date, preferred_time)
+
+    threads = [threading.Thread(target=book, args=(n,)) for n in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [result for result in results if result[0]]
+
+
+def _occupancy(date):
+    occupancy = [0] * SLOTS_PER_DAY
+    with database.connection() as conn:
+        rows = conn.execute(
+            "SELECT service, start_time FROM appointments WHERE status = 'pending' AND date = ?", (date,)
+        ).fetchall()
+    for service, start_time in rows:
+        start = slot_index(start_time)
+        for slot in range(start, start + slots_needed(service)):
+            occupancy[slot] += 1
+    return len(rows), occupancy
+
+
+def test_concurrent_bookings_never_oversubscribe_a_day():
+    booked = _book_concurrently("2031-06-02", ["haircut", "massage", "manicure"])
+
+    count, occupancy = _occupancy("2031-06-02")
+    assert 0 < count == len(booked) <= DAILY_CAPACITY
+    assert max(occupancy) <= CHAIRS
+    assert len({ticket for ticket, _ in booked}) == len(booked)
+
+
+def test_concurrent_bookings_stop_at_the_daily_capacity():
+    # 30-minute bookings leave chairs free, so only the daily cap stops them
+    booked = _book_concurrently("2031-06-04", ["haircut"])
+
+    count, occupancy = _occupancy("2031-06-04")
+    assert count == len(booked) == min(THREADS, DAILY_CAPACITY)
+    assert max(occupancy) <= CHAIRS
+
+
+def test_concurrent_bookings_of_one_time_fill_only_its_chairs():
+    booked = _book_concurrently("2031-06-03", ["haircut"], preferred_time="10:00")
+
+    count, occupancy = _occupancy("2031-06-03")
+    assert count == len(booked) == CHAIRS
+    assert {start_time for _, start_time in booked} == {"10:00"}
+    assert occupancy[slot_index("10:00")] == CHAIRS
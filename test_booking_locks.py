@@ -0,0 +1,42 @@
+import os
+import threading
+
+from booking_locks import FileLocks
+
+
+def test_file_locks_use_a_fixed_set_of_files(tmp_path):
+    locks = FileLocks(str(tmp_path), stripes=4)
+    for day in range(1, 29):
+        with locks.hold(f"2031-02-{day:02d}"):
+            pass
+
+    assert 0 < len(os.listdir(tmp_path)) <= 4
+
+
+def test_keys_sharing_a_file_are_held_together(tmp_path):
+    # With one file every key shares it; holding several must not deadlock
+    locks = FileLocks(str(tmp_path), stripes=1)
+    with locks.hold("2031-02-01", "2031-02-02"):
+        pass
+
+
+def test_file_locks_exclude_other_threads(tmp_path):
+    locks = FileLocks(str(tmp_path))
+    inside, overlaps = [0], []
+    guard = threading.Lock()
+
+    def book():
+        for _ in range(20):
+            with locks.hold("2031-02-01"):
+                with guard:
+                    inside[0] += 1
+                    overlaps.append(inside[0])
+                with guard:
+                    inside[0] -= 1
+
+    threads = [threading.Thread(target=book) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(overlaps) == 1
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import database
+import migrations
+from booking_queue import WriteBehindQueue
+
+BOOKING = ("Eve", "eve.crash@example.com", "haircut", "2031-07-01", "APPT-900001", "09:00")
+
+# Queues one booking with a writer that would wait a minute before its group
+# commit, then kills the process before the commit happens
+CRASH_SCRIPT = textwrap.dedent('''
+    import os, sys
+    from booking_queue import WriteBehindQueue
+
+    queue = WriteBehindQueue(sys.argv[1], "fsync", flush_interval_ms=60000)
+    queue.start()
+    queue.submit(*sys.argv[2:])
+    os._exit(1)
+''')
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    migrations.migrate(verbose=False)
+    return str(tmp_path / "bookings.journal")
+
+
+def _rows(ticket_number):
+    with database.connection() as conn:
+        return conn.execute(
+            "SELECT name, email, service, date, ticket_number, start_time FROM appointments WHERE ticket_number = ?",
+            (ticket_number,)
+        ).fetchall()
+
+
+def _crash_after_submit(journal_path):
+    subprocess.run([sys.executable, "-c", CRASH_SCRIPT, journal_path, *BOOKING],
+                   cwd=os.path.dirname(os.path.abspath(__file__)), check=False)
+
+
+def test_journaled_booking_survives_a_crash_exactly_once(journal_path):
+    _crash_after_submit(journal_path)
+    assert _rows(BOOKING[4]) == []
+    assert os.path.getsize(journal_path) > 0
+
+    queue = WriteBehindQueue(journal_path, "fsync")
+    queue.start()
+    queue.stop()
+    assert _rows(BOOKING[4]) == [BOOKING]
+    assert os.path.getsize(journal_path) == 0
+
+    # Journaled again and crashed: replaying a booking that is already in
+    # the database (as after a crash between commit and journal truncation)
+    # inserts nothing
+    _crash_after_submit(journal_path)
+    queue = WriteBehindQueue(journal_path, "fsync")
+    queue.start()
+    queue.stop()
+    assert _rows(BOOKING[4]) == [BOOKING]
@@ -0,0 +1,22 @@
+from types import SimpleNamespace
+
+from chat_router import ChatRouter
+from session_store import Session
+
+
+def test_time_savings_wait_for_a_timed_agent_turn():
+    router = ChatRouter()
+    session = Session("router-session")
+
+    _, routing = router.handle(session, "status")
+    assert routing["route"] == "fast"
+    assert routing["msSaved"] is None
+    assert router.stats()["msSaved"] is None
+
+    # An agent turn that made two LLM calls taking 0.5 s in total
+    router._record_agent(SimpleNamespace(calls=2, llm_seconds=0.5), 0.0)
+    assert router.llm_call_ms == 250.0
+    _, routing = router.handle(session, "status")
+    assert 0 < routing["msSaved"] <= router.llm_calls_per_turn * 250.0
+    # Both fast turns count once the per-call time is known
+    assert 0 < router.stats()["msSaved"] <= router.stats()["llmCallsSaved"] * 250.0
@@ -0,0 +1,28 @@
+import database
+import server
+
+BOOKING_MESSAGE = "My name is Ann Lee, email ann.retry@example.com, service is haircut, date is 2031-05-12"
+
+
+def _count_bookings(email):
+    with database.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM appointments WHERE email = ?", (email,)).fetchone()[0]
+
+
+def test_retried_chat_gets_the_first_reply_and_books_once():
+    client = server.app.test_client()
+    body = {"message": BOOKING_MESSAGE, "sessionId": "retry-session"}
+    headers = {"Idempotency-Key": "retry-key-1"}
+    fast_turns = server.router.stats()["fastTurns"]
+
+    first = client.post("/chat", json=body, headers=headers)
+    retry = client.post("/chat", json=body, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert "APPT-" in first.get_json()["reply"]
+    assert retry.get_json() == first.get_json()
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    # The retry was answered from the stored reply, not by running the turn again
+    assert server.router.stats()["fastTurns"] == fast_turns + 1
+    assert _count_bookings("ann.retry@example.com") == 1
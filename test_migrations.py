@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+import database
+import migrations
+from slot_extractor import canonical_service
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    yield conn
+    conn.close()
+
+
+def _insert(conn, service, ticket_number):
+    conn.execute(
+        "INSERT INTO appointments (name, email, service, date, ticket_number) VALUES (?, ?, ?, ?, ?)",
+        ("Ann", "ann@example.com", service, "2030-01-01", ticket_number)
+    )
+
+
+@pytest.mark.parametrize("sql, index, plan, ok", migrations.check_query_plans(),
+                         ids=[check[2] for check in migrations.QUERY_PLAN_CHECKS])
+def test_tool_queries_use_their_index(sql, index, plan, ok):
+    assert ok, f"{sql} should use {index}, plan: {plan}"
+
+
+def test_free_text_services_follow_the_booking_rule(conn):
+    conn.execute(database.APPOINTMENTS_TABLE_SQL)
+    texts = ["a Haircut", "haircut appointment", "deep tissue massage", "haircut and massage", "something else"]
+    for n, service in enumerate(texts):
+        _insert(conn, service, f"APPT-{n}")
+    conn.commit()
+    migrations.migrate(conn, verbose=False)
+
+    services = [row[0] for row in conn.execute("SELECT service FROM appointments ORDER BY id")]
+    assert services == ["haircut", "haircut", "massage", "haircut and massage", "something else"]
+    assert services == [canonical_service(text) for text in texts]
+
+
+def test_duplicate_tickets_get_fresh_numbers(conn):
+    conn.execute(database.APPOINTMENTS_TABLE_SQL)
+    for ticket_number in ["APPT-12345", "APPT-12345", "APPT-12345", "APPT-200000"]:
+        _insert(conn, "haircut", ticket_number)
+    conn.commit()
+    migrations.migrate(conn, verbose=False)
+
+    tickets = [row[0] for row in conn.execute("SELECT ticket_number FROM appointments ORDER BY id")]
+    assert tickets == ["APPT-12345", "APPT-200001", "APPT-200002", "APPT-200000"]
+    next_value = conn.execute("SELECT next_value FROM ticket_sequence").fetchone()[0]
+    assert next_value == 200003
+
@@ -0,0 +1,64 @@
+import json
+
+from session_store import AppointmentInfo, Session
+
+
+def test_delta_holds_only_slots_changed_since_the_tag():
+    info = AppointmentInfo()
+    info["name"] = "Ann"
+    tag = info.tag
+    info["email"] = "ann@example.com"
+    info["name"] = "Ann"  # unchanged, so not a change
+
+    assert info.delta_since(tag) == {"email": "ann@example.com"}
+    assert info.delta_since(info.tag) == {}
+
+
+def test_delta_of_unknown_tags_is_none():
+    info = AppointmentInfo({"name": "Ann"})
+    info["service"] = "haircut"
+    epoch, version = info.tag.split(".")
+
+    # Another slot set (say an expired session whose id was reused)
+    assert info.delta_since(AppointmentInfo().tag) is None
+    assert info.delta_since(f"{epoch}x.{version}") is None
+    # A version these slots have not reached yet
+    assert info.delta_since(f"{epoch}.{info.version + 1}") is None
+    assert info.delta_since(f"{epoch}.abc") is None
+    assert info.delta_since(None) is None
+
+
+def test_clear_counts_as_a_change():
+    info = AppointmentInfo()
+    info.update(name="Ann", service="haircut")
+    tag = info.tag
+    rendered = info.to_dict()
+
+    info.clear()
+
+    assert info.tag != tag
+    assert info.delta_since(tag) == {"name": None, "service": None}
+    assert info.to_dict() is not rendered
+    assert info.to_dict() == dict.fromkeys(rendered)
+
+
+def test_state_round_trip_keeps_tags_valid():
+    session = Session("round-trip")
+    session.appointment_info.update(name="Ann", email="ann@example.com")
+    tag = session.appointment_info.tag
+    session.appointment_info["service"] = "haircut"
+    session.preferred_time = "10:00"
+    session.add_turn("hi", "hello")
+
+    restored = Session.from_state("round-trip", json.loads(json.dumps(session.to_state())))
+    info = restored.appointment_info
+
+    assert info.to_dict() == session.appointment_info.to_dict()
+    assert info.tag == session.appointment_info.tag
+    assert info.delta_since(tag) == {"service": "haircut"}
+    assert restored.preferred_time == "10:00"
+    assert restored.history == session.history
+    assert restored.memory is session.memory
+    # Later changes keep counting from the restored version
+    info["date"] = "2031-05-12"
+    assert info.delta_since(tag) == {"service": "haircut", "date": "2031-05-12"}
@@ -0,0 +1,61 @@
+import os
+import threading
+
+import database
+
+TICKET_PREFIX = "APPT-"
+
+# Ticket numbers reserved from the database per round trip
+TICKET_BLOCK_SIZE = int(os.environ.get("TICKET_BLOCK_SIZE", 50))
+
+
+class TicketAllocator:
+    """Hands out unique ticket numbers from blocks reserved in the ticket_sequence table.
+
+    Each block is claimed in one short write transaction, so every process
+    (and thread) gets a disjoint range and allocation is O(1) in between.
+    Numbers left in a block when the process exits are simply skipped.
+    """
+
+    def __init__(self, block_size=TICKET_BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def allocate(self):
+        """Return a new ticket number such as APPT-100042"""
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._reserve_block()
+            value = self._next
+            self._next += 1
+        return f"{TICKET_PREFIX}{value}"
+
+    def allocate_many(self, count):
+        """Return count new ticket numbers, reserving at most one extra block"""
+        with self._lock:
+            values = list(range(self._next, min(self._end, self._next + count)))
+            self._next += len(values)
+            missing = count - len(values)
+            if missing:
+                start, end = self._reserve_block(max(self.block_size, missing))
+                values.extend(range(start, start + missing))
+                self._next, self._end = start + missing, end
+        return [f"{TICKET_PREFIX}{value}" for value in values]
+
+    def _reserve_block(self, size=None):
+        size = size or self.block_size
+        with database.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            start = conn.execute("SELECT next_value FROM ticket_sequence WHERE id = 1").fetchone()[0]
+            conn.execute("UPDATE ticket_sequence SET next_value = ? WHERE id = 1", (start + size,))
+        return start, start + size
+
+    def reset(self):
+        """Forget the current block, e.g. after switching databases"""
+        with self._lock:
+            self._next = self._end = 0
+
+
+ticket_allocator = TicketAllocator()